@@ -0,0 +1,360 @@
+"""只读JSON接口：直接读取已缓存的项目分析结果，供BI看板、定时报表等工具使用
+
+用法（在项目根目录运行，与 streamlit run main.py 使用相同的缓存目录）：
+    python precompute.py --refresh       # 先离线填充缓存
+    python api_server.py --port 8765
+
+接口（均为GET，month 默认12，labor=1 表示包含自有人工成本，默认0）：
+    /api/health                          服务状态和已加载的数据快照
+    /api/projects                        项目列表
+    /api/projects/<项目名称>              单个项目的完整分析结果
+    /api/kpis                            各项目KPI列式表和全部项目合计
+    /api/fee-series[?project=名称]        二级费项1-12月累计目标/已发生（不指定项目时为全部项目合计）
+    /api/exceptions?kind=main|tertiary[&project=名称]   截至该月的异常明细
+    /api/aggregate                       多项目合并后的关键指标和季度/半年/全年汇总
+
+响应带有根据数据指纹生成的ETag，请求头 If-None-Match 与之匹配（弱比较，或为 *）时返回304。
+"""
+import argparse
+import hashlib
+import json
+import logging
+import sys
+import threading
+import time
+from collections import OrderedDict
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from utils.data_processor import analyze_project, extract_table_from_excel, get_excel_files, merge_project_data
+from utils.diagnostics import LEVELS, collect_diagnostics
+from utils.exception_store import EXCEPTION_KINDS, build_exception_store
+from utils.portfolio_store import build_portfolio_store
+
+try:
+    import orjson
+except ImportError:  # orjson 不可用时退回标准库 json
+    orjson = None
+
+logger = logging.getLogger("dashboard.api")
+
+# 数据文件签名（大小和修改时间）的复查间隔（秒），间隔内的请求直接使用已加载的快照
+SIGNATURE_TTL = 2.0
+# 同时保留的数据快照（月份 x 人工成本口径）数量上限
+SNAPSHOT_CACHE_SIZE = 24
+# 缓存的序列化响应数量上限
+RESPONSE_CACHE_SIZE = 512
+
+
+def _default(obj):
+    """序列化 orjson/json 不支持的类型"""
+    if isinstance(obj, pd.DataFrame):
+        return obj.to_dict(orient='records')
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"无法序列化的类型: {type(obj).__name__}")
+
+
+def dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=_default, ensure_ascii=False).encode()
+
+
+class ApiError(Exception):
+    """请求参数错误或资源不存在，status 为返回的HTTP状态码"""
+
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class PortfolioSnapshot:
+    """某个月份和人工成本口径下全部项目的分析结果
+
+    从提取缓存和分析缓存读取（缓存缺失时才解析工作簿），fingerprint 由数据文件签名、
+    月份和口径决定，同时作为响应ETag的一部分。期间查询表和异常记录表在首次使用时构建。
+    """
+
+    def __init__(self, month: int, include_self_owned_labor: bool, files, fingerprint: str):
+        self.month = month
+        self.include_self_owned_labor = include_self_owned_labor
+        self.fingerprint = fingerprint
+        self.all_data = {}
+        self.all_main_dfs = {}
+        self.loaded_at = time.time()
+        self._lock = threading.Lock()
+        self._portfolio_store = None
+        self._exception_store = None
+
+        with collect_diagnostics() as diagnostics:
+            for file_path in files:
+                project_name = file_path.name.replace('.xlsx', '')
+                main_df, tertiary_df = extract_table_from_excel(file_path, include_self_owned_labor)
+                if main_df is None or tertiary_df is None:
+                    continue
+                data = analyze_project(main_df, tertiary_df, month, project_name, include_self_owned_labor)
+                if data:
+                    self.all_data[project_name] = data
+                    self.all_main_dfs[project_name] = main_df
+        self.diagnostics = [{'level': d.level, 'message': d.message} for d in diagnostics]
+        for diagnostic in diagnostics:
+            logger.log(LEVELS[diagnostic.level], "%s", diagnostic.message)
+
+    @property
+    def portfolio_store(self):
+        with self._lock:
+            if self._portfolio_store is None:
+                self._portfolio_store = build_portfolio_store(self.all_data)
+            return self._portfolio_store
+
+    @property
+    def exception_store(self):
+        with self._lock:
+            if self._exception_store is None:
+                self._exception_store = build_exception_store(self.all_data)
+            return self._exception_store
+
+    def project(self, name: str):
+        data = self.all_data.get(name)
+        if data is None:
+            raise ApiError(HTTPStatus.NOT_FOUND, f"项目不存在: {name}")
+        return data
+
+
+class PortfolioApi:
+    """按月份和口径缓存数据快照，并按请求路径缓存序列化后的响应"""
+
+    def __init__(self, data_dir: Path):
+        self.data_dir = Path(data_dir)
+        self._lock = threading.Lock()
+        self._snapshots = {}
+        # 每个（月份, 口径）一把锁：同一快照只构建一次，构建期间不阻塞其他快照和响应缓存
+        self._snapshot_locks = {}
+        self._responses: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._signature = None
+        self._signature_checked = 0.0
+
+    def files_signature(self):
+        """数据目录中工作簿的签名，在 SIGNATURE_TTL 内复用上次的结果"""
+        now = time.monotonic()
+        if self._signature is None or now - self._signature_checked > SIGNATURE_TTL:
+            # 与页面中相同的文件路径写法（data_dir / 文件名），缓存键才能对应
+            files = sorted(self.data_dir / f.name for f in get_excel_files(self.data_dir))
+            stats = [(f.name, f.stat().st_size, f.stat().st_mtime_ns) for f in files]
+            self._signature = (files, hashlib.md5(repr(stats).encode()).hexdigest())
+            self._signature_checked = now
+        return self._signature
+
+    def snapshot(self, month: int, include_self_owned_labor: bool) -> PortfolioSnapshot:
+        files, signature = self.files_signature()
+        key = (month, include_self_owned_labor)
+        fingerprint = f"{signature}:{month}:{int(include_self_owned_labor)}"
+        with self._lock:
+            snapshot = self._snapshots.get(key)
+            if snapshot is not None and snapshot.fingerprint == fingerprint:
+                return snapshot
+            key_lock = self._snapshot_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            # 等待期间其他请求可能已构建好同一快照
+            with self._lock:
+                snapshot = self._snapshots.get(key)
+            if snapshot is not None and snapshot.fingerprint == fingerprint:
+                return snapshot
+            snapshot = PortfolioSnapshot(month, include_self_owned_labor, files, fingerprint)
+            with self._lock:
+                self._snapshots[key] = snapshot
+                while len(self._snapshots) > SNAPSHOT_CACHE_SIZE:
+                    self._snapshots.pop(next(iter(self._snapshots)))
+            return snapshot
+
+    def respond(self, path: str, query):
+        """返回 (ETag, JSON字节)，数据指纹未变化时直接返回缓存的响应"""
+        month = _int_param(query, 'month', 12, 1, 12)
+        include_self_owned_labor = bool(_int_param(query, 'labor', 0, 0, 1))
+        snapshot = self.snapshot(month, include_self_owned_labor)
+        cache_key = (path, tuple(sorted((k, tuple(v)) for k, v in query.items())))
+        etag = '"' + hashlib.md5(f"{snapshot.fingerprint}|{cache_key}".encode()).hexdigest() + '"'
+
+        with self._lock:
+            cached = self._responses.get(cache_key)
+            if cached is not None and cached[0] == etag:
+                self._responses.move_to_end(cache_key)
+                return cached
+
+        body = dumps(self.build(path, query, snapshot))
+        with self._lock:
+            self._responses[cache_key] = (etag, body)
+            while len(self._responses) > RESPONSE_CACHE_SIZE:
+                self._responses.popitem(last=False)
+        return etag, body
+
+    def build(self, path: str, query, snapshot: PortfolioSnapshot):
+        """根据请求路径生成响应内容"""
+        meta = {
+            'month': snapshot.month,
+            'include_self_owned_labor': snapshot.include_self_owned_labor,
+            'fingerprint': snapshot.fingerprint,
+        }
+        if path == '/api/health':
+            return {**meta, 'status': 'ok', 'projects': len(snapshot.all_data), 'loaded_at': snapshot.loaded_at,
+                    'diagnostics': snapshot.diagnostics}
+        if path == '/api/projects':
+            return {**meta, 'projects': list(snapshot.all_data)}
+        if path.startswith('/api/projects/'):
+            name = unquote(path[len('/api/projects/'):])
+            return {**meta, 'project': name, 'data': snapshot.project(name)}
+        if path == '/api/kpis':
+            store = snapshot.portfolio_store
+            return {**meta, 'money_scale': store.money_scale, 'projects': store.kpi_frame(snapshot.month),
+                    'portfolio': store.range_query(1, snapshot.month)}
+        if path == '/api/fee-series':
+            project = _str_param(query, 'project')
+            return {**meta, 'project': project, 'fee_series': self.fee_series(snapshot, project)}
+        if path == '/api/exceptions':
+            kind = _str_param(query, 'kind') or 'main'
+            if kind not in EXCEPTION_KINDS:
+                raise ApiError(HTTPStatus.BAD_REQUEST, f"kind 应为 {'/'.join(EXCEPTION_KINDS)}")
+            records = snapshot.exception_store.records(kind, snapshot.month)
+            project = _str_param(query, 'project')
+            if project is not None:
+                snapshot.project(project)
+                records = records[records['project_name'] == project]
+            return {**meta, 'kind': kind, 'project': project, 'count': len(records), 'records': records}
+        if path == '/api/aggregate':
+            merged = merge_project_data(snapshot.all_data, snapshot.all_main_dfs, snapshot.month,
+                                        snapshot.include_self_owned_labor)
+            return {**meta, 'merged': merged, 'periods': snapshot.portfolio_store.period_summary}
+        raise ApiError(HTTPStatus.NOT_FOUND, f"未知的接口: {path}")
+
+    @staticmethod
+    def fee_series(snapshot: PortfolioSnapshot, project=None):
+        """单个项目的二级费项累计序列，不指定项目时按费项名称合计全部项目"""
+        if project is not None:
+            return snapshot.project(project).get('fee_series')
+        totals = {}
+        for data in snapshot.all_data.values():
+            series = data.get('fee_series') or {}
+            for name, cum_target, cum_actual in zip(series.get('names', []), series.get('cum_target', []),
+                                                    series.get('cum_actual', [])):
+                target, actual = totals.setdefault(name, (np.zeros(12), np.zeros(12)))
+                target += np.asarray(cum_target, dtype=float)[:12]
+                actual += np.asarray(cum_actual, dtype=float)[:12]
+        return {
+            'names': list(totals),
+            'cum_target': [target for target, _ in totals.values()],
+            'cum_actual': [actual for _, actual in totals.values()],
+        }
+
+
+def _str_param(query, name):
+    values = query.get(name)
+    return values[0] if values else None
+
+
+def _int_param(query, name, default, low, high):
+    value = _str_param(query, name)
+    if value is None:
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"{name} 应为整数")
+    if not low <= value <= high:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"{name} 应在 {low}-{high} 之间")
+    return value
+
+
+def etag_matches(if_none_match, etag: str) -> bool:
+    """If-None-Match 是否与当前ETag匹配：* 匹配任意表示，其余按弱比较（忽略 W/ 前缀，RFC 9110 13.1.2）"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    opaque_tag = etag.removeprefix('W/')
+    return any(tag.strip().removeprefix('W/') == opaque_tag for tag in if_none_match.split(','))
+
+
+class ApiRequestHandler(BaseHTTPRequestHandler):
+    """只读接口的请求处理：GET/HEAD，支持 If-None-Match"""
+
+    api: PortfolioApi = None
+
+    def do_GET(self):
+        self._handle(send_body=True)
+
+    def do_HEAD(self):
+        self._handle(send_body=False)
+
+    def _handle(self, send_body):
+        url = urlsplit(self.path)
+        path = url.path.rstrip('/') or '/'
+        try:
+            etag, body = self.api.respond(path, parse_qs(url.query))
+        except ApiError as e:
+            self._send(e.status, dumps({'error': str(e)}), send_body=send_body)
+            return
+        except Exception as e:
+            logger.exception("处理请求 %s 时出错", self.path)
+            self._send(HTTPStatus.INTERNAL_SERVER_ERROR, dumps({'error': str(e)}), send_body=send_body)
+            return
+
+        if etag_matches(self.headers.get('If-None-Match'), etag):
+            self._send(HTTPStatus.NOT_MODIFIED, b'', etag=etag, send_body=False)
+            return
+        self._send(HTTPStatus.OK, body, etag=etag, send_body=send_body)
+
+    def _send(self, status, body, etag=None, send_body=True):
+        self.send_response(status)
+        if status != HTTPStatus.NOT_MODIFIED:
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+        if etag:
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        if send_body and body:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.info("%s - %s", self.address_string(), format % args)
+
+
+def make_server(host: str, port: int, data_dir) -> ThreadingHTTPServer:
+    """创建接口服务（每个请求一个线程）"""
+    handler = type('BoundApiRequestHandler', (ApiRequestHandler,), {'api': PortfolioApi(data_dir)})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="运营成本看板只读JSON接口")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址（默认只监听本机 127.0.0.1）")
+    parser.add_argument("--port", type=int, default=8765, help="监听端口（默认 8765）")
+    parser.add_argument("--data-dir", default="data", help="工作簿所在目录（默认 data）")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    if not Path(args.data_dir).is_dir():
+        print(f"数据目录不存在: {args.data_dir}", file=sys.stderr)
+        return 2
+    server = make_server(args.host, args.port, args.data_dir)
+    logger.info("接口服务已启动: http://%s:%s/api/health", args.host, server.server_address[1])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
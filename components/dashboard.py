@@ -1,4 +1,9 @@
 import streamlit as st
+from streamlit.errors import StreamlitAPIException
+import functools
+import hashlib
+from pathlib import Path
+from packaging.version import Version
 import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
@@ -22,13 +27,100 @@ from utils.chart_creator import (
     create_tertiary_exception_chart, # Added tertiary exception chart
     create_tertiary_exception_details_table, # Added tertiary exception details table
     create_secondary_fee_combined_chart, # Added secondary fee combined chart
+    create_three_donut_charts_by_month,
+    create_combined_donut_chart,
+    create_combined_donut_chart_by_month,
+    create_bar_chart_by_month,
+    create_line_chart_by_month,
+    create_exception_pie_by_month,
+    slim_figure,
+    to_wan,
     # create_three_donut_charts_matplotlib # 暂时注释掉 Matplotlib 版本
 )
 
+from utils.exception_store import build_exception_store, year_type_counts
+from utils.portfolio_store import build_portfolio_store, COMPARISON_SORT_KEYS
+from utils.fee_hierarchy import build_fee_rollup_index
+from utils.project_groups import (
+    GROUP_MAPPING_FILE, ProjectGroupTree, load_group_mapping, make_grouper, mapping_signature
+)
+from utils.data_processor import FEE_CATEGORY_MAP
+from utils.cache_manager import fingerprint_frame
+from components.diagnostics_view import streamlit_diagnostics
+from utils.export_payloads import XLSX_MIME, csv_bytes, deferred_payload, excel_bytes, streaming_excel_bytes
+from utils.report_exporter import get_report_job, main_exception_frame, report_key, report_sheets, start_report_job
 from utils.data_processor import create_summary_excel, merge_project_data, create_client_download_table, create_monthly_fee_summary, create_secondary_fee_overall_data, extract_labor_service_breakdown, create_labor_service_summary
 
-def render_kpi_metrics(all_data, all_dfs, month, include_self_owned_labor):
-    """渲染KPI指标 - 苹果风格卡片设计"""
+# 片段（局部重新运行）：区域内的控件变化只重新运行该区域，旧版本Streamlit中退化为普通函数
+_st_fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None)
+
+def fragment(func=None, *, run_every=None):
+    """将渲染函数标记为独立重新运行的片段，片段单独重新运行时数据处理的诊断信息同样显示在页面中
+    
+    Args:
+        run_every: 片段定时自动重新运行的间隔（秒），由Streamlit调度
+    """
+    if func is None:
+        return functools.partial(fragment, run_every=run_every)
+    if not _st_fragment:
+        return func
+    
+    @functools.wraps(func)
+    def run_with_diagnostics(*args, **kwargs):
+        with streamlit_diagnostics():
+            return func(*args, **kwargs)
+    return _st_fragment(run_with_diagnostics, run_every=run_every) if run_every else _st_fragment(run_with_diagnostics)
+
+# 延迟计算区域的开关，旧版本Streamlit中使用复选框
+_st_toggle = getattr(st, "toggle", None) or st.checkbox
+
+def rerun_section():
+    """只重新运行当前片段，不在片段中或版本不支持时重新运行整个页面"""
+    try:
+        st.rerun(scope="fragment")
+    except (TypeError, StreamlitAPIException):
+        st.rerun()
+
+# Streamlit 1.52.0 起下载按钮的 data 支持传入函数，点击时才生成文件内容
+DEFERRED_DOWNLOAD_VERSION = Version("1.52.0")
+_DEFERRED_DOWNLOADS = Version(st.__version__) >= DEFERRED_DOWNLOAD_VERSION
+
+def download_button(label, payload, **kwargs):
+    """渲染下载按钮，文件内容由 payload（无参数函数）在点击时生成，旧版本Streamlit中立即生成"""
+    return st.download_button(label=label, data=payload if _DEFERRED_DOWNLOADS else payload(), **kwargs)
+
+def render_progress_donuts(data, month, key_suffix, combined=False, client_months=False, slim=False):
+    """渲染时间进度、年使用率、月累使用率3个甜甜圈图
+    
+    Args:
+        key_suffix: 图表key的后缀，区分页面中不同位置的甜甜圈图
+        combined: 3个环合并为一个图表，只需一次 st.plotly_chart
+        client_months: 图表带1-12月的帧，在浏览器中切换月份
+        slim: 精简模式，图表不嵌入默认模板，发送到浏览器的JSON更小
+    """
+    if combined:
+        chart = (create_combined_donut_chart_by_month if client_months else create_combined_donut_chart)(data, month)
+        st.plotly_chart(slim_figure(chart) if slim else chart, use_container_width=True,
+                        key=f"donut_chart_combined_{key_suffix}")
+        return
+    
+    # 使用3列布局显示独立的甜甜圈图
+    three_donut_charts = (create_three_donut_charts_by_month if client_months else create_three_donut_charts)(data, month)
+    for idx, (col, chart) in enumerate(zip(st.columns(3), three_donut_charts), 1):
+        with col:
+            st.plotly_chart(slim_figure(chart) if slim else chart, use_container_width=True,
+                            key=f"donut_chart_{idx}_{key_suffix}")
+
+@fragment
+def render_kpi_metrics(all_data, all_dfs, month, include_self_owned_labor, fixed_point=False, client_months=False,
+                       combined_donuts=False, slim_donuts=False):
+    """渲染KPI指标 - 苹果风格卡片设计
+    
+    Args:
+        client_months: 甜甜圈图带1-12月的帧，在浏览器中切换月份
+        combined_donuts: 3个甜甜圈图合并为一个图表
+        slim_donuts: 甜甜圈图使用精简模式
+    """
     # 确保month是整数类型
     month = int(month) if isinstance(month, str) else month
     # 判断是单项目还是多项目模式
@@ -37,25 +129,12 @@ def render_kpi_metrics(all_data, all_dfs, month, include_self_owned_labor):
         pass
     else:
         # 多项目模式：显示合并后的关键指标
-        merged_data = merge_project_data(all_data, all_dfs, month, include_self_owned_labor)
+        merged_data = merge_project_data(all_data, all_dfs, month, include_self_owned_labor, fixed_point)
         if merged_data:
             st.markdown("### 多项目合并指标")
             
             # 创建上下布局：上面3个甜甜圈图，下面金额指标
-            # 上面显示3个独立的甜甜圈图
-            three_donut_charts = create_three_donut_charts(merged_data, month)
-            
-            # 使用3列布局显示独立的甜甜圈图
-            col1, col2, col3 = st.columns(3)
-            
-            with col1:
-                st.plotly_chart(three_donut_charts[0], use_container_width=True, key="donut_chart_1_merged")
-            
-            with col2:
-                st.plotly_chart(three_donut_charts[1], use_container_width=True, key="donut_chart_2_merged")
-            
-            with col3:
-                st.plotly_chart(three_donut_charts[2], use_container_width=True, key="donut_chart_3_merged")
+            render_progress_donuts(merged_data, month, "merged", combined_donuts, client_months, slim_donuts)
             
             # 下面显示金额指标 - 使用更紧凑的布局
             st.markdown("#### 金额指标详情")
@@ -163,7 +242,9 @@ def render_kpi_metrics(all_data, all_dfs, month, include_self_owned_labor):
                 project_list = ", ".join(all_data.keys())
             st.info(project_list)
 
-def render_single_project_analysis(project_name, data, month, show_details=True):
+@fragment
+def render_single_project_analysis(project_name, data, month, show_details=True, client_months=False,
+                                   combined_donuts=False, slim_donuts=False):
     """渲染单项目详细分析 - 采用苹果风格卡片设计"""
     # 确保month是整数类型
     month = int(month) if isinstance(month, str) else month
@@ -174,20 +255,7 @@ def render_single_project_analysis(project_name, data, month, show_details=True)
         # 项目详细信息 - 显示甜甜圈图
         st.markdown("#### 项目进度指标")
         
-        # 显示3个独立的甜甜圈图
-        three_donut_charts = create_three_donut_charts(data, month)
-        
-        # 使用3列布局显示独立的甜甜圈图
-        col1, col2, col3 = st.columns(3)
-        
-        with col1:
-            st.plotly_chart(three_donut_charts[0], use_container_width=True, key=f"donut_chart_1_detail_{project_name}")
-        
-        with col2:
-            st.plotly_chart(three_donut_charts[1], use_container_width=True, key=f"donut_chart_2_detail_{project_name}")
-        
-        with col3:
-            st.plotly_chart(three_donut_charts[2], use_container_width=True, key=f"donut_chart_3_detail_{project_name}")
+        render_progress_donuts(data, month, f"detail_{project_name}", combined_donuts, client_months, slim_donuts)
         
         # 显示其他详细信息
         st.markdown("#### 📋 项目详细信息")
@@ -321,8 +389,18 @@ def render_single_project_analysis(project_name, data, month, show_details=True)
     else:
         st.warning("没有找到二级费项数据")
 
-def render_anomaly_section(anomalies, project_name=None, all_data=None, month=None, section_type="main"):
-    """渲染主控费项展示区域"""
+def render_anomaly_section(anomalies=None, project_name=None, all_data=None, month=None, section_type="main",
+                           exception_store=None, client_months=False):
+    """渲染主控费项展示区域
+    
+    Args:
+        anomalies: 主控费项异常列表，传入exception_store或all_data时可省略
+        exception_store: 已构建的异常记录表，各月份的统计和明细都从中切片读取
+        client_months: 异常饼图带1-12月的帧，在浏览器中切换月份（明细表仍按月份滑块筛选）
+    """
+    if exception_store is None:
+        source = all_data if all_data else {project_name or '未知项目': {'exceptions': anomalies or []}}
+        exception_store = build_exception_store(source)
     
     # 创建标题和按钮的布局
     col1, col2 = st.columns([3, 1])
@@ -341,18 +419,18 @@ def render_anomaly_section(anomalies, project_name=None, all_data=None, month=No
             
             if st.button(button_text, key="exception_ranking_btn"):
                 st.session_state.show_exception_ranking = not st.session_state.show_exception_ranking
-                st.rerun()  # 立即重新运行页面
+                rerun_section()  # 立即重新运行排行榜所在区域
     
     # 显示异常排行榜（如果被激活）
     if st.session_state.get('show_exception_ranking', False) and all_data and section_type == "multi":
         try:
-            render_exception_ranking(all_data, month)
+            render_exception_ranking(all_data, month, exception_store)
         except Exception as e:
             st.error(f"显示排行榜时出错: {e}")
             st.session_state.show_exception_ranking = False  # 出错时重置状态
     
     # 月份筛选器
-    all_months = sorted({anomaly['month'] for anomaly in anomalies})
+    all_months = exception_store.months('main')
     if all_months:
         selected_month = st.select_slider(
             "选择月份",
@@ -361,64 +439,64 @@ def render_anomaly_section(anomalies, project_name=None, all_data=None, month=No
             key=f"anomaly_month_slider_{project_name or 'multi'}_{section_type}"
         )
         
-        # 过滤到选中月份的数据
-        filtered_anomalies = [a for a in anomalies if a['month'] <= selected_month]
-        
-        # 统计异常数量
-        red_count = sum(1 for a in filtered_anomalies if a['exception_type'] == 'red')
-        yellow_count = sum(1 for a in filtered_anomalies if a['exception_type'] == 'yellow')
-        
-        # 创建饼图（与三级费项保持一致）
-        fig = go.Figure()
-        
-        # 准备数据
-        labels = []
-        values = []
-        colors = []
+        # 截至选中月份的异常明细（按月份升序）和数量统计
+        filtered_anomalies = exception_store.records('main', selected_month)
+        red_count, yellow_count = exception_store.type_counts('main', selected_month)
         
-        if red_count > 0:
-            labels.append('红色异常')
-            values.append(red_count)
-            colors.append('#ef4444')
-        
-        if yellow_count > 0:
-            labels.append('黄色异常')
-            values.append(yellow_count)
-            colors.append('#f59e0b')
-        
-        # 创建饼图
-        fig.add_trace(go.Pie(
-            labels=labels,
-            values=values,
-            hole=0.5,
-            marker_colors=colors,
-            textinfo='label+value',
-            textposition='inside',
-            textfont=dict(size=12, color='white')
-        ))
-        
-        # 更新布局
-        fig.update_layout(
-            title={
-                'text': f'主控费项异常统计 (第{selected_month}月)',
-                'x': 0.5,
-                'xanchor': 'center',
-                'font': {'size': 18, 'color': '#1D1D1F'}
-            },
-            plot_bgcolor='white',
-            paper_bgcolor='white',
-            font=dict(family="SF Pro Display, -apple-system, BlinkMacSystemFont, sans-serif"),
-            height=400,
-            showlegend=True,
-            legend=dict(
-                orientation="v",  # 垂直布局
-                yanchor="top",
-                y=1,
-                xanchor="left",
-                x=0,  # 图例放在左边
-                itemsizing='constant'
+        if client_months and all_data:
+            fig = create_exception_pie_by_month(year_type_counts(all_data, 'main'), selected_month, '主控费项异常统计')
+        else:
+            # 创建饼图（与三级费项保持一致）
+            fig = go.Figure()
+        
+            # 准备数据
+            labels = []
+            values = []
+            colors = []
+        
+            if red_count > 0:
+                labels.append('红色异常')
+                values.append(red_count)
+                colors.append('#ef4444')
+        
+            if yellow_count > 0:
+                labels.append('黄色异常')
+                values.append(yellow_count)
+                colors.append('#f59e0b')
+        
+            # 创建饼图
+            fig.add_trace(go.Pie(
+                labels=labels,
+                values=values,
+                hole=0.5,
+                marker_colors=colors,
+                textinfo='label+value',
+                textposition='inside',
+                textfont=dict(size=12, color='white')
+            ))
+        
+            # 更新布局
+            fig.update_layout(
+                title={
+                    'text': f'主控费项异常统计 (第{selected_month}月)',
+                    'x': 0.5,
+                    'xanchor': 'center',
+                    'font': {'size': 18, 'color': '#1D1D1F'}
+                },
+                plot_bgcolor='white',
+                paper_bgcolor='white',
+                font=dict(family="SF Pro Display, -apple-system, BlinkMacSystemFont, sans-serif"),
+                height=400,
+                showlegend=True,
+                legend=dict(
+                    orientation="v",  # 垂直布局
+                    yanchor="top",
+                    y=1,
+                    xanchor="left",
+                    x=0,  # 图例放在左边
+                    itemsizing='constant'
+                )
             )
-        )
         
         # 左右排布显示
         col1, col2 = st.columns([1, 1])
@@ -427,26 +505,12 @@ def render_anomaly_section(anomalies, project_name=None, all_data=None, month=No
             st.plotly_chart(fig, use_container_width=True, key=f"main_anomaly_chart_{project_name or 'multi'}_{section_type}")
         
         with col2:
-            if filtered_anomalies:
+            if not filtered_anomalies.empty:
                 # 显示带颜色的表格
                 st.subheader("主控费项异常详情")
                 
-                # 准备表格数据
-                table_data = []
-                for anomaly in filtered_anomalies:
-                    row = {
-                        '项目名称': anomaly.get('project_name', project_name) if (anomaly.get('project_name') or project_name) else '未知项目',
-                        '月份': anomaly['month'],
-                        '费项名称': anomaly['fee_name'],
-                        '异常类型': '红色异常' if anomaly['exception_type'] == 'red' else '黄色异常',
-                        '累计已发生': round(anomaly['cum_actual'], 2),
-                        '当月目标': round(anomaly['cum_target'], 2),
-                        '年总目标': round(anomaly['year_target'], 2)
-                    }
-                    table_data.append(row)
-                
-                # 创建DataFrame并显示
-                df = pd.DataFrame(table_data)
+                # 按列构建表格数据
+                df = main_exception_frame(filtered_anomalies)
                 
                 # 添加样式
                 def highlight_anomaly(row):
@@ -459,11 +523,10 @@ def render_anomaly_section(anomalies, project_name=None, all_data=None, month=No
                 styled_df = df.style.apply(highlight_anomaly, axis=1)
                 st.dataframe(styled_df, use_container_width=True)
 
-                # 添加异常明细下载按钮
-                csv = df.to_csv(index=False, encoding='utf-8-sig')
-                st.download_button(
-                    label="📥 下载主控费项异常明细",
-                    data=csv,
+                # 添加异常明细下载按钮（点击时才生成CSV）
+                download_button(
+                    "📥 下载主控费项异常明细",
+                    deferred_payload('main_anomaly_csv', csv_bytes, df),
                     file_name=f"主控费项异常明细_{selected_month}月.csv",
                     mime="text/csv",
                     key=f"download_main_anomaly_detail_{project_name or 'multi'}_{section_type}"
@@ -480,8 +543,13 @@ def render_anomaly_section(anomalies, project_name=None, all_data=None, month=No
         
         # 创建三级费项异常图表和表格
         # 使用汇总的异常数据创建图表
-        exception_chart = create_tertiary_exception_chart(all_data, selected_month if all_months else month)
-        exception_result = create_tertiary_exception_details_table(all_data, selected_month if all_months else month)
+        tertiary_month = selected_month if all_months else month
+        if client_months:
+            exception_chart = create_exception_pie_by_month(year_type_counts(all_data, 'tertiary'), tertiary_month,
+                                                            '三级费项异常统计')
+        else:
+            exception_chart = create_tertiary_exception_chart(all_data, tertiary_month, exception_store)
+        exception_result = create_tertiary_exception_details_table(all_data, tertiary_month, exception_store)
         
         if exception_result:
             exception_table, exception_df = exception_result
@@ -512,10 +580,9 @@ def render_anomaly_section(anomalies, project_name=None, all_data=None, month=No
                 st.dataframe(styled_df, use_container_width=True)
                 
                 # 添加下载按钮
-                csv = exception_df.to_csv(index=False, encoding='utf-8-sig')
-                st.download_button(
-                    label="📥 下载三级费项异常明细",
-                    data=csv,
+                download_button(
+                    "📥 下载三级费项异常明细",
+                    deferred_payload('tertiary_anomaly_csv', csv_bytes, exception_df),
                     file_name=f"三级费项异常明细_{selected_month if all_months else month}月.csv",
                     mime="text/csv",
                     key=f"download_tertiary_exception_{project_name or 'multi'}_{section_type}"
@@ -523,34 +590,211 @@ def render_anomaly_section(anomalies, project_name=None, all_data=None, month=No
             else:
                 st.info("暂无三级费项异常数据")
 
-def render_multi_project_analysis(all_data, all_main_dfs, all_tertiary_dfs, month, include_self_owned_labor):
-    """渲染多项目对比分析"""
-    # 确保month是整数类型
-    month = int(month) if isinstance(month, str) else month
+def _get_session_index(cache_name, signature_parts, builder):
+    """会话级索引缓存：签名未变化时直接复用上次构建的结果"""
+    signature = hashlib.md5(repr(signature_parts).encode()).hexdigest()
+    cached = st.session_state.get(cache_name)
+    if cached and cached[0] == signature:
+        return cached[1]
+    index = builder()
+    st.session_state[cache_name] = (signature, index)
+    return index
+
+def frames_signature(all_dfs):
+    """各项目原始数据表的内容指纹，用作会话缓存的签名"""
+    return [(name, fingerprint_frame(df)) for name, df in all_dfs.items()]
+
+def lazy_section(title, key):
+    """延迟计算区域的开关：打开前区域内不做任何计算，打开后的计算结果按数据签名缓存在会话中"""
+    opened = _st_toggle(f"展开{title}", value=False, key=f"lazy_section_{key}")
+    if not opened:
+        st.caption(f"{title}尚未展开，打开后才会计算")
+    return opened
+
+def labor_source_files(all_data):
+    """返回数据目录、选中项目对应的文件名列表及其签名（修改时间和大小）"""
+    data_dir = Path("data")
+    all_files = [f"{name}.xlsx" for name in all_data if (data_dir / f"{name}.xlsx").is_file()]
+    file_signature = [(f, (data_dir / f).stat().st_mtime_ns, (data_dir / f).stat().st_size) for f in all_files]
+    return data_dir, all_files, file_signature
+
+def get_session_portfolio_store(all_data, fixed_point=False):
+    """获取期间查询表（含按月缓存的KPI列式表），选中项目数据和金额存储方式未变化时复用"""
+    signature_parts = [fixed_point] + [
+        (name, data.get('cum_target'), data.get('cum_actual'),
+         data.get('year_exception_counts'), data.get('tertiary_year_exception_counts'),
+         len(data.get('exceptions') or []), len(data.get('tertiary_exceptions') or []))
+        for name, data in all_data.items()
+    ]
+    return _get_session_index('portfolio_store_cache', signature_parts,
+                              lambda: build_portfolio_store(all_data, fixed_point))
+
+def get_session_exception_store(all_data):
+    """获取异常记录表，选中项目及其异常未变化时复用会话中已构建的记录表和排行榜"""
+    signature_parts = [
+        (name, data.get('exception_counts'), data.get('tertiary_exception_counts'),
+         len(data.get('exceptions') or []), len(data.get('tertiary_exceptions') or []))
+        for name, data in all_data.items()
+    ]
+    return _get_session_index('exception_store_cache', signature_parts, lambda: build_exception_store(all_data))
+
+def get_session_fee_rollup(all_data):
+    """获取费项层级小计索引，选中项目数据未变化时复用会话中已汇总的结果"""
+    signature_parts = [
+        (name, data.get('cum_target'), data.get('cum_actual'), len(data.get('tertiary_fee_items') or []))
+        for name, data in all_data.items()
+    ]
+    return _get_session_index('fee_rollup_cache', signature_parts,
+                              lambda: build_fee_rollup_index(all_data, FEE_CATEGORY_MAP))
+
+def get_session_group_tree(all_data, mapping):
+    """获取会话中的项目分组汇总树，分组规则变化时重建，否则只增量同步变化的项目"""
+    signature = mapping_signature(mapping)
+    cached = st.session_state.get('project_group_tree')
+    if not cached or cached[0] != signature:
+        cached = (signature, ProjectGroupTree(make_grouper(mapping)))
+        st.session_state.project_group_tree = cached
+    group_tree = cached[1]
+    group_tree.sync(all_data)
+    return group_tree
+
+def render_project_group_section(all_data, month, data_dir=Path("data")):
+    """渲染项目分组汇总：按名称前缀或分组映射文件分组，指标直接读取分组汇总树"""
+    st.subheader("项目分组汇总")
+    
+    mapping = {}
+    mapping_file = data_dir / GROUP_MAPPING_FILE
+    if mapping_file.exists():
+        try:
+            mapping = load_group_mapping(mapping_file)
+        except ValueError as e:
+            st.warning(f"{e}，已改为按名称前缀分组")
+    group_tree = get_session_group_tree(all_data, mapping)
+    
+    groups = group_tree.children()
+    if len(groups) == len(all_data):
+        st.info("当前选中的项目各自成组，可在数据目录中添加 "
+                f"{GROUP_MAPPING_FILE} 自定义分组（格式：{{\"项目名称\": \"一级分组/二级分组\"}}）")
+    
+    group_data = group_tree.level_data(month)
+    if len(group_data) > 1:
+        group_chart = create_project_comparison_chart(group_data, month)
+        group_chart.update_layout(title={'text': "分组使用率与金额对比"}, xaxis_title="分组")
+        st.plotly_chart(group_chart, use_container_width=True, key="project_group_comparison_chart")
+    
+    st.dataframe(group_tree.subtotal_table(month), use_container_width=True, hide_index=True)
+
+@fragment
+def render_fee_hierarchy_section(all_data, month):
+    """渲染费项层级钻取：一级 -> 二级 -> 三级费项的预汇总小计"""
+    fee_rollup = get_session_fee_rollup(all_data)
+    hierarchy = fee_rollup.hierarchy
+    if not hierarchy.leaves or not any(data.get('tertiary_fee_items') for data in all_data.values()):
+        return
+    
+    st.markdown("---")
+    st.subheader("费项层级钻取")
+    
+    def render_children(code, key):
+        children = fee_rollup.children_table(code, month)
+        chart = create_bar_chart({'fee_items': [
+            {'name': name, 'cum_target': target, 'cum_actual': actual}
+            for name, target, actual in zip(children['name'], children['cum_target'], children['cum_actual'])
+        ]})
+        if chart:
+            chart.update_layout(title=f"{hierarchy.names[code]} 下级费项累计对比 (第{month}月)")
+            st.plotly_chart(chart, use_container_width=True, key=key)
+        st.dataframe(pd.DataFrame({
+            '费项编码': children['code'],
+            '费项名称': children['name'],
+            '累计目标': children['cum_target'].round(2),
+            '累计已发生': children['cum_actual'].round(2),
+            '使用率(%)': children['usage']
+        }), use_container_width=True, hide_index=True)
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        # 一级费项下的二级小计
+        root = hierarchy.roots()[0]
+        st.markdown(f"#### {hierarchy.names[root]}")
+        render_children(root, "fee_hierarchy_root_chart")
+    with col2:
+        groups = hierarchy.children(root)
+        selected_group = st.selectbox(
+            "选择二级费项:",
+            groups,
+            format_func=lambda code: f"{code} {hierarchy.names[code]}",
+            key="fee_hierarchy_group"
+        )
+        st.markdown(f"#### {hierarchy.names[selected_group]}")
+        render_children(selected_group, "fee_hierarchy_group_chart")
+
+# 项目数超过该值时对比图显示排序、前/后N名和分页控件
+COMPARISON_CONTROLS_MIN_PROJECTS = 20
+
+def render_comparison_controls(portfolio_store, month):
+    """渲染项目对比图的排序和范围控件，返回对比图使用的KPI子集"""
+    total = len(portfolio_store.projects)
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        sort_by = st.selectbox("排序指标", list(COMPARISON_SORT_KEYS), format_func=COMPARISON_SORT_KEYS.get,
+                               key="comparison_sort_by")
+    with col2:
+        selection = st.selectbox("显示范围", ['top', 'bottom', 'all'],
+                                 format_func={'top': '前N名', 'bottom': '后N名', 'all': '全部（分页）'}.get,
+                                 key="comparison_selection")
+    with col3:
+        if selection == 'all':
+            page_size = st.number_input("每页项目数", min_value=10, max_value=200, value=50, step=10,
+                                        key="comparison_page_size")
+            pages = (total + page_size - 1) // page_size
+            page = st.number_input(f"页码（共{pages}页）", min_value=1, max_value=max(pages, 1), value=1,
+                                   key="comparison_page")
+            n = COMPARISON_CONTROLS_MIN_PROJECTS
+        else:
+            n = st.number_input("N", min_value=1, max_value=total, value=min(COMPARISON_CONTROLS_MIN_PROJECTS, total),
+                                key="comparison_top_n")
+            page, page_size = 1, 50
+    with col4:
+        others = st.checkbox("其余项目合并为“其他”", value=True, key="comparison_others",
+                             disabled=selection == 'all')
+    
+    return portfolio_store.comparison_view(month, sort_by, selection, n=n, page=page, page_size=page_size,
+                                           others=others)
+
+@fragment
+def render_comparison_section(all_data, all_main_dfs, month, fixed_point=False):
+    """渲染项目使用率对比图、详细指标对比表、下载按钮和项目分组汇总"""
     st.subheader(" 项目对比分析")
     
-    # 项目使用率对比图
-    st.plotly_chart(create_project_comparison_chart(all_data, month), use_container_width=True, key="project_comparison_chart")
+    # KPI列式表：每个选择和月份只构建一次，对比图和指标表都从中读取
+    kpi_frame = get_session_portfolio_store(all_data, fixed_point).kpi_frame(month)
+    
+    # 项目使用率对比图：项目较多时按指标排序后显示前/后N名或分页显示
+    chart_frame = kpi_frame
+    if len(kpi_frame) > COMPARISON_CONTROLS_MIN_PROJECTS:
+        chart_frame = render_comparison_controls(get_session_portfolio_store(all_data, fixed_point), month)
+    st.plotly_chart(create_project_comparison_chart(all_data, month, chart_frame), use_container_width=True, key="project_comparison_chart")
     
     # 详细指标对比表
     st.subheader(" 详细指标对比")
-    comparison_data = create_kpi_display(all_data)
-    df_comparison = pd.DataFrame(comparison_data)
-    
-    # 定义样式函数
-    def highlight_usage_rate(val):
-        """根据年使用率添加颜色标记"""
-        if val >= 100:
-            # 超过100%标红色
-            return 'background-color: #ffcdd2; color: #d32f2f;'  # 浅红背景，深红文字
-        elif val >= 90:
-            # 超过90%黄色
-            return 'background-color: #fff9c4; color: #f57f17;'  # 浅黄背景，深黄文字
-        else:
-            return ''
+    comparison_table = create_kpi_display(all_data, month, kpi_frame)
+    usage_bands = comparison_table.pop('usage_band')
+    df_comparison = comparison_table
+    
+    # 年使用率颜色分档已在KPI表中算好：超过100%标红色，超过90%标黄色
+    band_styles = {
+        'red': 'background-color: #ffcdd2; color: #d32f2f;',  # 浅红背景，深红文字
+        'yellow': 'background-color: #fff9c4; color: #f57f17;'  # 浅黄背景，深黄文字
+    }
     
-    # 应用样式到年使用率列
-    styled_df = df_comparison.style.map(highlight_usage_rate, subset=['年使用率(%)'])
+    def highlight_usage_rate(frame):
+        styles = pd.DataFrame('', index=frame.index, columns=frame.columns)
+        styles['年使用率(%)'] = usage_bands.map(band_styles).astype(object).fillna('').to_numpy()
+        return styles
+    
+    # 一次性应用样式到年使用率列
+    styled_df = df_comparison.style.apply(highlight_usage_rate, axis=None)
     
     st.dataframe(styled_df, use_container_width=True)
     
@@ -559,10 +803,9 @@ def render_multi_project_analysis(all_data, all_main_dfs, all_tertiary_dfs, mont
     
     with col1:
         # 下载月度汇总表（CSV格式）
-        csv = df_comparison.to_csv(index=False, encoding='utf-8-sig')
-        st.download_button(
-            label="📥 下载月度汇总表",
-            data=csv,
+        download_button(
+            "📥 下载月度汇总表",
+            deferred_payload('kpi_csv', csv_bytes, df_comparison),
             file_name=f"项目汇总_{month}月.csv",
             mime="text/csv",
             key="download_csv_multi"
@@ -571,41 +814,50 @@ def render_multi_project_analysis(all_data, all_main_dfs, all_tertiary_dfs, mont
     with col2:
         # 下载原始数据汇总表（Excel格式）
         if all_main_dfs:
-            summary_df = create_summary_excel(all_main_dfs)
+            summary_df = _get_session_index('summary_excel_cache', frames_signature(all_main_dfs),
+                                            lambda: create_summary_excel(all_main_dfs))
             if summary_df is not None:
-                # 将DataFrame转换为Excel字节流
-                import io
-                output = io.BytesIO()
-                with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                    summary_df.to_excel(writer, index=False, sheet_name='汇总数据')
-                excel_data = output.getvalue()
-                
-                st.download_button(
-                    label="📥 下载项目汇总表",
-                    data=excel_data,
+                # 点击时才将DataFrame转换为Excel字节流
+                download_button(
+                    "📥 下载项目汇总表",
+                    deferred_payload('summary_xlsx', excel_bytes, summary_df, '汇总数据'),
                     file_name="项目汇总表.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                    mime=XLSX_MIME,
                     key="download_excel_multi",
                     help="下载所有项目的汇总数据表，而不是拼接表"
                 )
     
-    # 每月费项数据处理
-    monthly_fee_df = create_monthly_fee_summary(all_main_dfs)
+    # 项目分组汇总
+    render_project_group_section(all_data, month)
+
+@fragment
+def render_secondary_fee_section(all_main_dfs, month, include_self_owned_labor):
+    """渲染每月费项成本柱状图和二级费项整体分析"""
+    st.subheader("费项成本分析")
+    if not lazy_section("每月费项与二级费项分析", "secondary_fee"):
+        return
+    
+    def build_monthly_fee_summary():
+        monthly_fee_df = create_monthly_fee_summary(all_main_dfs)
+        if monthly_fee_df is not None:
+            # 格式化数据，保留2位小数
+            monthly_fee_df['目标成本'] = monthly_fee_df['目标成本'].round(2)
+            monthly_fee_df['已发生成本'] = monthly_fee_df['已发生成本'].round(2)
+        return monthly_fee_df
+    
+    # 每月费项数据处理（按原始数据指纹缓存在会话中）
+    main_signature = frames_signature(all_main_dfs)
+    monthly_fee_df = _get_session_index('monthly_fee_summary_cache', main_signature, build_monthly_fee_summary)
     if monthly_fee_df is not None:
-        # 格式化数据，保留2位小数
-        monthly_fee_df['目标成本'] = monthly_fee_df['目标成本'].round(2)
-        monthly_fee_df['已发生成本'] = monthly_fee_df['已发生成本'].round(2)
-        
         # 绘制柱状图
         st.subheader("每月费项成本柱状图")
         bar_chart = create_bar_chart(monthly_fee_df)
         st.plotly_chart(bar_chart, use_container_width=True, key="monthly_fee_bar_chart")
         
         # 添加下载按钮
-        csv = monthly_fee_df.to_csv(index=False, encoding='utf-8-sig')
-        st.download_button(
-            label="📥 下载每月费项汇总表",
-            data=csv,
+        download_button(
+            "📥 下载每月费项汇总表",
+            deferred_payload('monthly_fee_csv', csv_bytes, monthly_fee_df),
             file_name="每月费项成本汇总.csv",
             mime="text/csv",
             key="download_monthly_fee_summary"
@@ -617,7 +869,10 @@ def render_multi_project_analysis(all_data, all_main_dfs, all_tertiary_dfs, mont
     st.subheader("二级费项整体分析")
     
     # 获取二级费项整体数据
-    secondary_fee_data = create_secondary_fee_overall_data(all_main_dfs, month, include_self_owned_labor)
+    secondary_fee_data = _get_session_index(
+        'secondary_fee_overall_cache', [main_signature, month, include_self_owned_labor],
+        lambda: create_secondary_fee_overall_data(all_main_dfs, month, include_self_owned_labor)
+    )
     
     if secondary_fee_data:
         # 创建费项选择下拉框
@@ -658,10 +913,9 @@ def render_multi_project_analysis(all_data, all_main_dfs, all_tertiary_dfs, mont
                         })
                     
                     df_chart = pd.DataFrame(chart_data)
-                    csv = df_chart.to_csv(index=False, encoding='utf-8-sig')
-                    st.download_button(
-                        label=f"📥 下载{selected_fee}整体数据",
-                        data=csv,
+                    download_button(
+                        f"📥 下载{selected_fee}整体数据",
+                        deferred_payload('secondary_fee_csv', csv_bytes, df_chart),
                         file_name=f"{selected_fee}_整体分析数据.csv",
                         mime="text/csv",
                         key=f"download_secondary_fee_{selected_fee}"
@@ -670,40 +924,23 @@ def render_multi_project_analysis(all_data, all_main_dfs, all_tertiary_dfs, mont
                 st.warning(f"无法创建{selected_fee}的图表")
     else:
         st.info("没有找到二级费项数据")
-    
-    # 异常项展示 - 合并所有项目的异常
-    all_anomalies = []
-    all_tertiary_exceptions = []
-    
-    for project_name, data in all_data.items():
-        # 收集主控费项异常
-        if 'exceptions' in data and data['exceptions']:
-            for anomaly in data['exceptions']:
-                # 添加项目名称到异常数据
-                anomaly_with_project = anomaly.copy()
-                anomaly_with_project['project_name'] = project_name
-                all_anomalies.append(anomaly_with_project)
-        
-        # 收集三级费项异常
-        if 'tertiary_exceptions' in data and data['tertiary_exceptions']:
-            for exception in data['tertiary_exceptions']:
-                # 添加项目名称到异常数据
-                exception_with_project = exception.copy()
-                exception_with_project['project_name'] = project_name
-                all_tertiary_exceptions.append(exception_with_project)
-    
+
+@fragment
+def render_labor_section(all_data):
+    """渲染人工服务拆分汇总数据"""
     # 添加人工服务拆分表格展示 - 移到这里
     st.markdown("---")
     st.subheader("人工服务拆分汇总数据")
+    if not lazy_section("人工服务拆分汇总", "labor"):
+        return
     
-    # 获取所有项目文件
-    from pathlib import Path
-    data_dir = Path("data")
-    all_files = [f.name for f in data_dir.glob("*.xlsx") if f.is_file()]
+    # 只汇总当前选中的项目文件
+    data_dir, all_files, file_signature = labor_source_files(all_data)
     
     if all_files:
-        # 创建人工服务拆分汇总表
-        labor_summary = create_labor_service_summary(all_files, data_dir)
+        # 创建人工服务拆分汇总表（文件未变化时复用会话中的结果）
+        labor_summary = _get_session_index('labor_summary_cache', file_signature,
+                                           lambda: create_labor_service_summary(all_files, data_dir))
         
         if labor_summary is not None:
             # 显示汇总信息
@@ -850,12 +1087,11 @@ def render_multi_project_analysis(all_data, all_main_dfs, all_tertiary_dfs, mont
             st.dataframe(styled_labor_df, use_container_width=True, hide_index=True)
             
             # 提供下载按钮
-            csv_data = labor_summary.to_csv(index=False, encoding='utf-8-sig')
             file_name = f"人工服务拆分汇总表_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}.csv"
             
-            st.download_button(
-                label="📥 下载人工服务拆分汇总表",
-                data=csv_data,
+            download_button(
+                "📥 下载人工服务拆分汇总表",
+                deferred_payload('labor_csv', csv_bytes, labor_summary),
                 file_name=file_name,
                 mime="text/csv",
                 key="download_labor_service_data"
@@ -864,35 +1100,31 @@ def render_multi_project_analysis(all_data, all_main_dfs, all_tertiary_dfs, mont
             st.info("未找到人工服务拆分数据")
     else:
         st.info("没有可用的项目文件")
+
+@fragment
+def render_multi_anomaly_section(all_data, month, client_months=False):
+    """渲染所有项目的主控费项异常和排行榜"""
+    st.subheader("异常监控")
+    if not lazy_section("主控费项与三级费项异常", "anomaly"):
+        return
     
-    if all_anomalies or all_tertiary_exceptions:
-        # 创建汇总的异常数据
-        combined_data = {}
-        for project_name, data in all_data.items():
-            combined_data[project_name] = data.copy()
-            # 确保每个项目都有异常数据字段
-            if 'exceptions' not in combined_data[project_name]:
-                combined_data[project_name]['exceptions'] = []
-            if 'tertiary_exceptions' not in combined_data[project_name]:
-                combined_data[project_name]['tertiary_exceptions'] = []
-        
-        # 将汇总的三级费项异常数据添加到combined_data中
-        for project_name, data in all_data.items():
-            if project_name in combined_data:
-                # 收集该项目所有的三级费项异常
-                project_tertiary_exceptions = []
-                for exception in all_tertiary_exceptions:
-                    if exception.get('project_name') == project_name:
-                        project_tertiary_exceptions.append(exception)
-                combined_data[project_name]['tertiary_exceptions'] = project_tertiary_exceptions
-        
-        render_anomaly_section(all_anomalies, all_data=combined_data, month=month, section_type="multi")
+    # 异常项展示 - 所有项目的异常汇总为一张按月份索引的记录表
+    exception_store = get_session_exception_store(all_data)
+    
+    if exception_store.total() > 0:
+        render_anomaly_section(all_data=all_data, month=month, section_type="multi", exception_store=exception_store,
+                               client_months=client_months)
     else:
         st.info("没有找到异常数据")
-    
+
+@fragment
+def render_project_detail_section(all_data, month, client_months=False, combined_donuts=False, slim_donuts=False):
+    """渲染选中项目的详细分析"""
     # 添加项目选择下拉框和详细图表
     st.divider()
     st.subheader("📈 项目详细分析")
+    if not lazy_section("项目详细分析", "project_detail"):
+        return
     
     # 项目选择下拉框
     project_names = list(all_data.keys())
@@ -909,20 +1141,8 @@ def render_multi_project_analysis(all_data, all_main_dfs, all_tertiary_dfs, mont
         # 显示选中项目的详细分析 - 显示甜甜圈图
         st.markdown(f"#### {selected_project} 进度指标")
         
-        # 显示3个独立的甜甜圈图
-        three_donut_charts = create_three_donut_charts(selected_data, month)
-        
-        # 使用3列布局显示独立的甜甜圈图
-        col1, col2, col3 = st.columns(3)
-        
-        with col1:
-            st.plotly_chart(three_donut_charts[0], use_container_width=True, key=f"donut_chart_1_multi_{selected_project}")
-        
-        with col2:
-            st.plotly_chart(three_donut_charts[1], use_container_width=True, key=f"donut_chart_2_multi_{selected_project}")
-        
-        with col3:
-            st.plotly_chart(three_donut_charts[2], use_container_width=True, key=f"donut_chart_3_multi_{selected_project}")
+        render_progress_donuts(selected_data, month, f"multi_{selected_project}", combined_donuts, client_months,
+                               slim_donuts)
         
         # 显示其他详细信息
         st.markdown(f"####  {selected_project} 详细信息")
@@ -1035,8 +1255,12 @@ def render_multi_project_analysis(all_data, all_main_dfs, all_tertiary_dfs, mont
             show_actual_line = st.checkbox("显示总已发生成本折线", value=True, key=f"show_actual_line_multi_{selected_project}")
         
         # 创建两张独立的图表
-        bar_chart = create_bar_chart(selected_data)
-        line_chart = create_line_chart(selected_data)
+        if client_months:
+            bar_chart = create_bar_chart_by_month(selected_data, month)
+            line_chart = create_line_chart_by_month(selected_data, month)
+        else:
+            bar_chart = create_bar_chart(selected_data)
+            line_chart = create_line_chart(selected_data)
         
         if bar_chart and line_chart:
             # 控制柱状图显示
@@ -1057,16 +1281,85 @@ def render_multi_project_analysis(all_data, all_main_dfs, all_tertiary_dfs, mont
         else:
             st.warning("没有找到二级费项数据")
 
-def render_dashboard(all_data, all_main_dfs, all_tertiary_dfs, month, include_self_owned_labor=False):
-    """渲染主仪表盘"""
+def render_multi_project_analysis(all_data, all_main_dfs, all_tertiary_dfs, month, include_self_owned_labor, fixed_point=False,
+                                  client_months=False, combined_donuts=False, slim_donuts=False):
+    """渲染多项目对比分析"""
+    # 确保month是整数类型
+    month = int(month) if isinstance(month, str) else month
+    
+    # 各区域均为独立片段：区域内的控件变化只重新运行该区域
+    render_comparison_section(all_data, all_main_dfs, month, fixed_point)
+    render_secondary_fee_section(all_main_dfs, month, include_self_owned_labor)
+    render_labor_section(all_data)
+    render_multi_anomaly_section(all_data, month, client_months)
+    render_project_detail_section(all_data, month, client_months, combined_donuts, slim_donuts)
+
+def render_period_analysis(all_data, period, fixed_point=False):
+    """渲染月份区间分析：区间指标、各项目区间明细和季度/半年汇总"""
+    start, end = period
+    portfolio_store = get_session_portfolio_store(all_data, fixed_point)
+    money_scale = portfolio_store.money_scale
+    summary = portfolio_store.range_query(start, end)
+    
+    st.markdown(f"### 区间分析（{start}月 - {end}月）")
+    
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("区间目标成本", f"{to_wan(summary['target'], money_scale):,.2f} 万元")
+    with col2:
+        st.metric("区间已发生成本", f"{to_wan(summary['actual'], money_scale):,.2f} 万元")
+    with col3:
+        st.metric("区间使用率", f"{summary['usage']:.2f}%")
+    with col4:
+        st.metric("区间异常数",
+                  summary['main_red'] + summary['main_yellow'] + summary['tertiary_red'] + summary['tertiary_yellow'],
+                  help=f"主控费项 {summary['main_red'] + summary['main_yellow']} 项，"
+                       f"三级费项 {summary['tertiary_red'] + summary['tertiary_yellow']} 项")
+    
+    def to_display(table, label_column, label_name):
+        return pd.DataFrame({
+            label_name: table[label_column],
+            '目标成本(万元)': np.round(to_wan(table['target'], money_scale), 2),
+            '已发生成本(万元)': np.round(to_wan(table['actual'], money_scale), 2),
+            '使用率(%)': table['usage'],
+            '主控费项异常': table['main_red'] + table['main_yellow'],
+            '三级费项异常': table['tertiary_red'] + table['tertiary_yellow'],
+        })
+    
+    if len(all_data) > 1:
+        st.markdown("#### 各项目区间指标")
+        st.dataframe(to_display(portfolio_store.project_range_table(start, end), 'project', '项目名称'),
+                     use_container_width=True, hide_index=True)
+    
+    st.markdown("#### 季度 / 半年汇总")
+    st.dataframe(to_display(portfolio_store.period_summary, 'period', '统计区间'),
+                 use_container_width=True, hide_index=True)
+
+def render_dashboard(all_data, all_main_dfs, all_tertiary_dfs, month, include_self_owned_labor=False, period=None,
+                     fixed_point=False, client_months=False, combined_donuts=False, slim_donuts=False):
+    """渲染主仪表盘
+    
+    Args:
+        period: 区间模式下选择的 (起始月份, 结束月份)，此时month为结束月份
+        fixed_point: 多项目汇总时金额是否按int64的分累加
+        client_months: 甜甜圈图、柱状图/折线图和异常饼图一次性带上1-12月的数据，在浏览器中切换月份
+        combined_donuts: 时间进度、年使用率、月累使用率3个甜甜圈图合并为一个图表
+        slim_donuts: 甜甜圈图不嵌入默认模板，减小发送到浏览器的图表数据
+    """
     # 确保month是整数类型
     month = int(month) if isinstance(month, str) else month
     if not all_data:
         st.error("没有可用的数据")
         return
     
+    # 区间模式：先显示区间指标
+    if period:
+        render_period_analysis(all_data, period, fixed_point)
+        st.markdown("---")
+    
     # 显示KPI指标
-    render_kpi_metrics(all_data, all_main_dfs, month, include_self_owned_labor)
+    render_kpi_metrics(all_data, all_main_dfs, month, include_self_owned_labor, fixed_point, client_months,
+                       combined_donuts, slim_donuts)
     
     # 根据项目数量选择显示方式
     if len(all_data) == 1:
@@ -1075,17 +1368,30 @@ def render_dashboard(all_data, all_main_dfs, all_tertiary_dfs, month, include_se
         data = all_data[project_name]
         
         # 显示详细分析
-        render_single_project_analysis(project_name, data, month)
+        render_single_project_analysis(project_name, data, month, client_months=client_months,
+                                       combined_donuts=combined_donuts, slim_donuts=slim_donuts)
     else:
         # 多项目模式：显示项目对比分析
-        render_multi_project_analysis(all_data, all_main_dfs, all_tertiary_dfs, month, include_self_owned_labor)
+        render_multi_project_analysis(all_data, all_main_dfs, all_tertiary_dfs, month, include_self_owned_labor, fixed_point,
+                                      client_months, combined_donuts, slim_donuts)
+    
+    # 费项层级钻取（单项目和多项目模式通用）
+    render_fee_hierarchy_section(all_data, month)
     
     # 添加客户下载表格功能 - 移到最后
+    render_export_section(all_data, all_main_dfs, month, include_self_owned_labor, fixed_point)
+
+@fragment
+def render_export_section(all_data, all_main_dfs, month=12, include_self_owned_labor=False, fixed_point=False):
+    """渲染项目数据导出：表格预览、Excel下载和完整报告"""
     st.markdown("---")
     st.subheader("📥 项目数据导出")
+    if not lazy_section("项目数据导出", "export"):
+        return
     
-    # 创建客户下载表格
-    client_table = create_client_download_table(all_main_dfs, all_data)
+    # 创建客户下载表格（原始数据未变化时复用会话中的结果）
+    client_table = _get_session_index('client_table_cache', [frames_signature(all_main_dfs), list(all_data)],
+                                      lambda: create_client_download_table(all_main_dfs, all_data))
     
     # 显示表格预览
     st.markdown("#### 项目数据表格预览")
@@ -1094,28 +1400,96 @@ def render_dashboard(all_data, all_main_dfs, all_tertiary_dfs, month, include_se
     # 提供下载按钮
     st.markdown("#### 📥 下载数据")
     
-    # 转换为Excel格式
-    output = pd.ExcelWriter('temp_client_data.xlsx', engine='openpyxl')
-    client_table.to_excel(output, sheet_name='客户数据', index=False)
-    output.close()
-    
-    # 读取文件并创建下载按钮
-    with open('temp_client_data.xlsx', 'rb') as file:
-        st.download_button(
-            label="📥 下载项目数据表格 (Excel)",
-            data=file.read(),
-            file_name=f"客户数据表格_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            help="下载包含所有项目12个月数据的Excel表格"
-        )
+    # 点击时才在内存中生成Excel文件，按表格内容缓存，各会话互不影响
+    download_button(
+        "📥 下载项目数据表格 (Excel)",
+        deferred_payload('client_xlsx', streaming_excel_bytes, client_table, '客户数据'),
+        file_name=f"客户数据表格_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
+        mime=XLSX_MIME,
+        help="下载包含所有项目12个月数据的Excel表格"
+    )
     
-    # 清理临时文件
-    import os
-    if os.path.exists('temp_client_data.xlsx'):
-        os.remove('temp_client_data.xlsx')
+    render_full_report(all_data, all_main_dfs, month, include_self_owned_labor, fixed_point)
+
+# 完整报告生成期间刷新进度的间隔（秒）
+REPORT_POLL_SECONDS = 0.5
+
+@fragment(run_every=REPORT_POLL_SECONDS)
+def render_report_progress(key):
+    """显示后台报告任务的进度；任务结束（成功或失败）后重新运行页面，显示下载按钮或错误信息"""
+    job = get_report_job(key)
+    if job is None or job.done:
+        st.rerun()
+    st.progress(job.progress, text=f"正在生成完整报告：{job.stage}")
 
-def render_exception_ranking(all_data, month):
-    """渲染异常数量排行榜"""
+def render_full_report(all_data, all_main_dfs, month, include_self_owned_labor=False, fixed_point=False):
+    """完整报告：所有表格写入一个工作簿，在后台线程生成，按项目数据指纹缓存"""
+    st.markdown("#### 📦 完整报告")
+    st.caption("包含项目KPI、项目汇总表、每月费项、全部二级费项、人工服务拆分和异常明细")
+    
+    data_dir, labor_files, file_signature = labor_source_files(all_data)
+    key = report_key(frames_signature(all_main_dfs), list(all_data), month, include_self_owned_labor, fixed_point,
+                     file_signature)
+    job = get_report_job(key)
+    
+    if job is None or job.error is not None:
+        if job is not None:
+            st.error(f"生成完整报告失败: {job.error}")
+        if st.button("生成完整报告" if job is None else "重新生成", key="full_report_btn"):
+            sheets = report_sheets(
+                all_data, all_main_dfs, month, include_self_owned_labor,
+                kpi_frame=get_session_portfolio_store(all_data, fixed_point).kpi_frame(month),
+                exception_store=get_session_exception_store(all_data),
+                labor_files=labor_files, data_dir=data_dir
+            )
+            job = start_report_job(key, sheets)
+        else:
+            return
+    
+    if not job.done:
+        if _st_fragment:
+            # 进度由定时重新运行的片段显示，轮询由Streamlit调度，不占用页面脚本线程
+            render_report_progress(key)
+        else:
+            st.progress(job.progress, text=f"正在生成完整报告：{job.stage}")
+            st.caption("报告生成中，稍后刷新页面即可下载")
+        return
+    if job.error is not None:
+        st.error(f"生成完整报告失败: {job.error}")
+        return
+    
+    st.caption(f"完整报告已生成（{len(job.result) / 1024:,.0f} KB，用时 {job.elapsed:.1f} 秒）")
+    download_button(
+        "📥 下载完整报告 (Excel)",
+        lambda: job.result,
+        file_name=f"完整报告_{month}月.xlsx",
+        mime=XLSX_MIME,
+        key="download_full_report"
+    )
+
+# 排行榜前三名的配色：第一名红色、第二名黄色、第三名橙色
+_RANKING_STYLES = [
+    'background-color: #fee2e2; color: #dc2626;',
+    'background-color: #fef3c7; color: #d97706;',
+    'background-color: #fef2dd; color: #ea580c;',
+]
+
+def _style_ranking_table(df, bold=False):
+    """按排名为前三名且有异常的行着色，一次性生成整张样式表"""
+    def highlight(frame):
+        ranks = frame['排名'].to_numpy()
+        has_exceptions = frame['总异常数'].to_numpy() > 0
+        styles = [style + (' font-weight: bold;' if bold else '') for style in _RANKING_STYLES]
+        row_styles = np.select([(ranks == i + 1) & has_exceptions for i in range(len(styles))], styles, default='')
+        return pd.DataFrame(np.repeat(row_styles[:, None], frame.shape[1], axis=1),
+                            index=frame.index, columns=frame.columns)
+    return df.style.apply(highlight, axis=None)
+
+def render_exception_ranking(all_data, month, exception_store=None):
+    """渲染异常数量排行榜
+    
+    排名基于分析时缓存的各项目 1-12 月异常前缀计数，Top-N 使用部分排序。
+    """
     # 确保month是整数类型，处理各种可能的格式
     if isinstance(month, str):
         # 处理"12月"这样的字符串格式
@@ -1136,197 +1510,82 @@ def render_exception_ranking(all_data, month):
     st.markdown("---")
     st.subheader("📊 项目异常数量排行榜")
     
-    # 统计每个项目的异常数量
-    project_stats = {}
-    
     try:
-        for project_name, data in all_data.items():
-            if not isinstance(data, dict):
-                continue
-                
-            # 统计二级费项异常（主控费项异常）
-            main_exceptions = data.get('exceptions', [])
-            if not isinstance(main_exceptions, list):
-                main_exceptions = []
-                
-            main_red_count = 0
-            main_yellow_count = 0
-            for e in main_exceptions:
-                if isinstance(e, dict):
-                    # 处理异常数据中的月份格式
-                    exception_month = e.get('month', 0)
-                    if isinstance(exception_month, str):
-                        import re
-                        month_match = re.search(r'(\d+)', exception_month)
-                        if month_match:
-                            exception_month = int(month_match.group(1))
-                        else:
-                            exception_month = 0
-                    else:
-                        exception_month = int(exception_month) if exception_month is not None else 0
-                    
-                    if e.get('exception_type') == 'red' and exception_month <= month:
-                        main_red_count += 1
-                    elif e.get('exception_type') == 'yellow' and exception_month <= month:
-                        main_yellow_count += 1
-            
-            # 统计三级费项异常
-            tertiary_exceptions = data.get('tertiary_exceptions', [])
-            if not isinstance(tertiary_exceptions, list):
-                tertiary_exceptions = []
-                
-            tertiary_red_count = 0
-            tertiary_yellow_count = 0
-            for e in tertiary_exceptions:
-                if isinstance(e, dict):
-                    # 处理异常数据中的月份格式
-                    exception_month = e.get('month', 0)
-                    if isinstance(exception_month, str):
-                        import re
-                        month_match = re.search(r'(\d+)', exception_month)
-                        if month_match:
-                            exception_month = int(month_match.group(1))
-                        else:
-                            exception_month = 0
-                    else:
-                        exception_month = int(exception_month) if exception_month is not None else 0
-                    
-                    if e.get('exception_type') == 'red' and exception_month <= month:
-                        tertiary_red_count += 1
-                    elif e.get('exception_type') == 'yellow' and exception_month <= month:
-                        tertiary_yellow_count += 1
-            
-            project_stats[project_name] = {
-                'main_red': main_red_count,
-                'main_yellow': main_yellow_count,
-                'main_total': main_red_count + main_yellow_count,
-                'tertiary_red': tertiary_red_count,
-                'tertiary_yellow': tertiary_yellow_count,
-                'tertiary_total': tertiary_red_count + tertiary_yellow_count,
-                'total_exceptions': main_red_count + main_yellow_count + tertiary_red_count + tertiary_yellow_count
-            }
+        if exception_store is None:
+            exception_store = build_exception_store(all_data)
+        leaderboard = exception_store.leaderboard()
     except Exception as e:
         st.error(f"处理项目数据时出错: {e}")
         return
     
+    projects = np.asarray(exception_store.projects, dtype=object)
+    main_counts = exception_store.counts('main', month)
+    tertiary_counts = exception_store.counts('tertiary', month)
+    
+    # 项目较多时默认只显示前20名
+    size_options = [10, 20, 50, "全部"]
+    top_n_option = st.selectbox(
+        "显示名次",
+        size_options,
+        index=3 if len(projects) <= 50 else 1,
+        key="exception_ranking_top_n"
+    )
+    top_n = None if top_n_option == "全部" else int(top_n_option)
+    
+    def ranking_table(metric, counts):
+        order = leaderboard.top(metric, month, top_n)
+        return pd.DataFrame({
+            '排名': np.arange(1, len(order) + 1),
+            '项目名称': projects[order],
+            '红色异常': counts[order, 0],
+            '黄色异常': counts[order, 1],
+            '总异常数': counts[order].sum(axis=1)
+        })
+    
     # 创建两列布局显示排行榜
     col1, col2 = st.columns(2)
     
     with col1:
         st.markdown("#### 🔴 二级费项异常排行榜")
         
-        # 按二级费项异常总数排序
-        main_ranking = sorted(project_stats.items(), key=lambda x: x[1]['main_total'], reverse=True)
-        
-        # 创建表格数据
-        main_table_data = []
-        for rank, (project_name, stats) in enumerate(main_ranking, 1):
-            main_table_data.append({
-                '排名': rank,
-                '项目名称': project_name,
-                '红色异常': stats['main_red'],
-                '黄色异常': stats['main_yellow'],
-                '总异常数': stats['main_total']
-            })
-        
-        # 显示表格
-        if main_table_data:
-            main_df = pd.DataFrame(main_table_data)
-            
-            # 添加颜色样式
-            def highlight_main_ranking(row):
-                if row['排名'] == 1 and row['总异常数'] > 0:
-                    return ['background-color: #fee2e2; color: #dc2626;'] * len(row)  # 第一名红色
-                elif row['排名'] == 2 and row['总异常数'] > 0:
-                    return ['background-color: #fef3c7; color: #d97706;'] * len(row)  # 第二名黄色
-                elif row['排名'] == 3 and row['总异常数'] > 0:
-                    return ['background-color: #fef2dd; color: #ea580c;'] * len(row)  # 第三名橙色
-                return [''] * len(row)
-            
-            styled_main_df = main_df.style.apply(highlight_main_ranking, axis=1)
-            st.dataframe(styled_main_df, use_container_width=True, hide_index=True)
+        if len(projects):
+            main_df = ranking_table('main', main_counts)
+            st.dataframe(_style_ranking_table(main_df), use_container_width=True, hide_index=True)
         else:
             st.info("暂无二级费项异常数据")
     
     with col2:
         st.markdown("#### 🔵 三级费项异常排行榜")
         
-        # 按三级费项异常总数排序
-        tertiary_ranking = sorted(project_stats.items(), key=lambda x: x[1]['tertiary_total'], reverse=True)
-        
-        # 创建表格数据
-        tertiary_table_data = []
-        for rank, (project_name, stats) in enumerate(tertiary_ranking, 1):
-            tertiary_table_data.append({
-                '排名': rank,
-                '项目名称': project_name,
-                '红色异常': stats['tertiary_red'],
-                '黄色异常': stats['tertiary_yellow'],
-                '总异常数': stats['tertiary_total']
-            })
-        
-        # 显示表格
-        if tertiary_table_data:
-            tertiary_df = pd.DataFrame(tertiary_table_data)
-            
-            # 添加颜色样式
-            def highlight_tertiary_ranking(row):
-                if row['排名'] == 1 and row['总异常数'] > 0:
-                    return ['background-color: #fee2e2; color: #dc2626;'] * len(row)  # 第一名红色
-                elif row['排名'] == 2 and row['总异常数'] > 0:
-                    return ['background-color: #fef3c7; color: #d97706;'] * len(row)  # 第二名黄色
-                elif row['排名'] == 3 and row['总异常数'] > 0:
-                    return ['background-color: #fef2dd; color: #ea580c;'] * len(row)  # 第三名橙色
-                return [''] * len(row)
-            
-            styled_tertiary_df = tertiary_df.style.apply(highlight_tertiary_ranking, axis=1)
-            st.dataframe(styled_tertiary_df, use_container_width=True, hide_index=True)
+        if len(projects):
+            tertiary_df = ranking_table('tertiary', tertiary_counts)
+            st.dataframe(_style_ranking_table(tertiary_df), use_container_width=True, hide_index=True)
         else:
             st.info("暂无三级费项异常数据")
     
     # 综合排行榜
     st.markdown("#### 🏆 综合异常排行榜（总异常数）")
     
-    # 按总异常数排序
-    total_ranking = sorted(project_stats.items(), key=lambda x: x[1]['total_exceptions'], reverse=True)
-    
-    # 创建综合表格数据
-    total_table_data = []
-    for rank, (project_name, stats) in enumerate(total_ranking, 1):
-        total_table_data.append({
-            '排名': rank,
-            '项目名称': project_name,
-            '二级费项异常': stats['main_total'],
-            '三级费项异常': stats['tertiary_total'],
-            '总异常数': stats['total_exceptions']
+    if len(projects):
+        order = leaderboard.top('total', month, top_n)
+        main_total = main_counts.sum(axis=1)[order]
+        tertiary_total = tertiary_counts.sum(axis=1)[order]
+        total_df = pd.DataFrame({
+            '排名': np.arange(1, len(order) + 1),
+            '项目名称': projects[order],
+            '二级费项异常': main_total,
+            '三级费项异常': tertiary_total,
+            '总异常数': main_total + tertiary_total
         })
-    
-    # 显示综合表格
-    if total_table_data:
-        total_df = pd.DataFrame(total_table_data)
-        
-        # 添加颜色样式
-        def highlight_total_ranking(row):
-            if row['排名'] == 1 and row['总异常数'] > 0:
-                return ['background-color: #fee2e2; color: #dc2626; font-weight: bold;'] * len(row)  # 第一名红色加粗
-            elif row['排名'] == 2 and row['总异常数'] > 0:
-                return ['background-color: #fef3c7; color: #d97706; font-weight: bold;'] * len(row)  # 第二名黄色加粗
-            elif row['排名'] == 3 and row['总异常数'] > 0:
-                return ['background-color: #fef2dd; color: #ea580c; font-weight: bold;'] * len(row)  # 第三名橙色加粗
-            return [''] * len(row)
+        st.dataframe(_style_ranking_table(total_df, bold=True), use_container_width=True, hide_index=True)
         
-        styled_total_df = total_df.style.apply(highlight_total_ranking, axis=1)
-        st.dataframe(styled_total_df, use_container_width=True, hide_index=True)
-    else:
-        st.info("暂无异常数据")
-    
-    # 下载按钮
-    if total_table_data:
-        csv_data = total_df.to_csv(index=False, encoding='utf-8-sig')
-        st.download_button(
-            label="📥 下载异常排行榜",
-            data=csv_data,
+        # 下载按钮
+        download_button(
+            "📥 下载异常排行榜",
+            deferred_payload('exception_ranking_csv', csv_bytes, total_df),
             file_name=f"项目异常排行榜_{month}月.csv",
             mime="text/csv",
             key="download_exception_ranking"
-        )
\ No newline at end of file
+        )
+    else:
+        st.info("暂无异常数据")
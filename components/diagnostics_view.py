@@ -0,0 +1,15 @@
+import streamlit as st
+from utils.diagnostics import diagnostics_handler
+
+def render_diagnostic(diagnostic):
+    """将数据处理的诊断信息显示为对应级别的提示框"""
+    getattr(st, diagnostic.level)(diagnostic.message)
+
+def render_diagnostics(diagnostics):
+    """显示收集到的全部诊断信息"""
+    for diagnostic in diagnostics:
+        render_diagnostic(diagnostic)
+
+def streamlit_diagnostics():
+    """在页面脚本中运行数据处理时，诊断信息在产生的位置显示为提示框"""
+    return diagnostics_handler(render_diagnostic)
@@ -4,6 +4,8 @@ from components.sidebar import render_sidebar
 from components.dashboard import render_dashboard
 from utils.data_processor import load_and_process_files, create_summary_excel, extract_table_from_excel, get_excel_files
 from utils.cache_manager import get_cache_manager
+from utils.portfolio_store import PERIODS
+from components.diagnostics_view import streamlit_diagnostics
 from components.cache_indicator import start_performance_timer, end_performance_timer, show_cache_benefit_message
 
 # 页面配置
@@ -184,8 +186,35 @@ def main():
     # 渲染侧边栏并获取文件
     all_uploaded_files, extracted_files, selected_files, uploaded_main_dfs, uploaded_tertiary_dfs, include_self_owned_labor = render_sidebar(DATA_DIR)
     
-    # 月份选择
-    month = st.slider("选择月份:", min_value=1, max_value=12, value=5)  # 默认5月
+    # 月份选择：截至某月，或任意月份区间（季度、半年或自定义）
+    month_mode = st.radio("月份模式:", ["截至月份", "月份区间"], horizontal=True)
+    period = None
+    if month_mode == "月份区间":
+        preset = st.selectbox("快捷区间:", ["自定义"] + list(PERIODS))
+        if preset == "自定义":
+            period = st.select_slider("选择月份区间:", options=list(range(1, 13)), value=(4, 6))
+        else:
+            period = PERIODS[preset]
+        # 分析到区间结束月份，异常统计覆盖整个区间
+        month = period[1]
+    else:
+        month = st.slider("选择月份:", min_value=1, max_value=12, value=5)  # 默认5月
+    
+    # 多项目汇总金额按int64的分累加，合并指标与逐项目金额之和完全一致
+    fixed_point = st.checkbox("精确金额汇总（按分存储）", value=False,
+                              help="多项目合并时将每月金额转换为整数分后再求和，避免浮点累计误差")
+    
+    # 图表一次性带上1-12月的数据，拖动图表下方的滑块切换月份，不需要重新运行页面
+    client_months = st.checkbox("浏览器端切换月份", value=False,
+                                help="进度甜甜圈图、费项柱状图/折线图和异常饼图带有月份滑块，切换月份时不再请求服务器")
+    
+    # 时间进度、年使用率、月累使用率3个环合并为一个图表渲染
+    combined_donuts = st.checkbox("合并进度甜甜圈图", value=False,
+                                  help="3个进度环放在同一个图表中，减少图表数量，加快页面渲染")
+    
+    # 进度甜甜圈图不嵌入默认模板，图表数据约为原来的1/7
+    slim_donuts = st.checkbox("精简进度图表", value=False,
+                              help="进度甜甜圈图使用页面主题、数值保留两位小数，减小发送到浏览器的数据量")
 
     # 动态收集所有项目数据
     all_main_dfs = {}
@@ -226,15 +255,11 @@ def main():
     
     # 3. 统一分析所有项目
     if all_main_dfs:
-        from utils.data_processor import process_excel_data, process_tertiary_fee_data
+        from utils.data_processor import analyze_project
         for project_name, main_df in all_main_dfs.items():
-            data = process_excel_data(main_df, month, project_name, include_self_owned_labor)
+            data = analyze_project(main_df, all_tertiary_dfs.get(project_name), month, project_name,
+                                   include_self_owned_labor)
             if data:
-                tertiary_df = all_tertiary_dfs.get(project_name)
-                if tertiary_df is not None:
-                    tertiary_result = process_tertiary_fee_data(tertiary_df, month, project_name, include_self_owned_labor)
-                    data['tertiary_fee_items'] = tertiary_result['tertiary_fee_items']
-                    data['tertiary_exceptions'] = tertiary_result['exceptions']
                 all_data[project_name] = data
         
         # 显示分析结果
@@ -260,7 +285,10 @@ def main():
         st.warning("没有可分析的文件")
     
     # 渲染仪表盘
-    render_dashboard(all_data, all_main_dfs, all_tertiary_dfs, month, include_self_owned_labor)
+    render_dashboard(all_data, all_main_dfs, all_tertiary_dfs, month, include_self_owned_labor, period, fixed_point,
+                     client_months, combined_donuts, slim_donuts)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # 数据处理模块不依赖Streamlit，诊断信息在这里交给页面显示
+    with streamlit_diagnostics():
+        main()
\ No newline at end of file
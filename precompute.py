@@ -0,0 +1,189 @@
+"""离线预计算：批量处理data目录中的全部工作簿，预先填充提取缓存和分析缓存
+
+用法（在项目根目录运行，与 streamlit run main.py 使用相同的缓存目录）：
+    python precompute.py                 # 全部文件、1-12月、两种人工成本口径
+    python precompute.py --workers 4     # 4个进程并行处理
+    python precompute.py --months 1-6 --labor-mode without --refresh
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from utils.cache_manager import get_cache_manager, use_read_only_cache_manager
+from utils.diagnostics import collect_diagnostics
+from utils.data_processor import (
+    extract_labor_service_breakdown, extract_table_from_excel, get_excel_files, process_excel_data,
+    process_tertiary_fee_data
+)
+
+# 人工成本口径：命令行选项 -> include_self_owned_labor 取值
+LABOR_MODES = {
+    'both': (False, True),
+    'without': (False,),
+    'with': (True,),
+}
+
+
+def parse_months(text):
+    """解析月份参数：'1-12'、'3'、'1,3,6' 或其组合"""
+    months = set()
+    for part in text.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        start, _, end = part.partition('-')
+        try:
+            start, end = int(start), int(end or start)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"无效的月份: {part}")
+        if not 1 <= start <= end <= 12:
+            raise argparse.ArgumentTypeError(f"无效的月份区间: {part}")
+        months.update(range(start, end + 1))
+    if not months:
+        raise argparse.ArgumentTypeError("未指定月份")
+    return sorted(months)
+
+
+def new_result(file_path, errors=()):
+    """单个工作簿的处理结果（尚未提取任何数据）"""
+    file_path = str(file_path)
+    return {'file': file_path, 'project': Path(file_path).name.replace('.xlsx', ''), 'extracted': {},
+            'labor_df': None, 'labor_extracted': False,
+            'timings': {'extract': 0.0, 'analysis': 0.0, 'labor': 0.0}, 'errors': list(errors), 'warnings': []}
+
+
+def precompute_file(file_path, months, labor_modes, refresh=False):
+    """处理单个工作簿（在工作进程中运行）
+
+    分析缓存按项目、月份和口径各自写入独立文件，可以在工作进程中直接保存；
+    提取缓存和人工服务拆分缓存共用一个元数据文件，由主进程统一写入，避免多进程互相覆盖
+    （工作进程使用只读的缓存管理器，见 use_read_only_cache_manager）。
+
+    Returns:
+        dict: 提取结果（需要主进程写入缓存的部分）、各阶段耗时、错误和警告信息
+    """
+    cache_manager = get_cache_manager()
+    result = new_result(file_path)
+    file_path, project_name = result['file'], result['project']
+    timings = result['timings']
+
+    with collect_diagnostics() as diagnostics:
+        for include_self_owned_labor in labor_modes:
+            start = time.perf_counter()
+            cached = None if refresh else cache_manager.get_cached_data(file_path, include_self_owned_labor)
+            if cached:
+                main_df, tertiary_df = cached
+            else:
+                main_df, tertiary_df = extract_table_from_excel(file_path, include_self_owned_labor, use_cache=False)
+                if main_df is not None and tertiary_df is not None:
+                    result['extracted'][include_self_owned_labor] = (main_df, tertiary_df)
+            timings['extract'] += time.perf_counter() - start
+            if main_df is None or tertiary_df is None:
+                result['errors'].append(f"无法提取有效数据（{'包含' if include_self_owned_labor else '不包含'}自有人工成本）")
+                continue
+
+            start = time.perf_counter()
+            for month in months:
+                if refresh:
+                    cache_manager.remove_analysis_cache("project_analysis", project_name, month, include_self_owned_labor)
+                    cache_manager.remove_analysis_cache("anomaly", project_name, month, include_self_owned_labor)
+                if process_excel_data(main_df, month, project_name, include_self_owned_labor) is None:
+                    result['errors'].append(f"{month}月分析失败")
+                process_tertiary_fee_data(tertiary_df, month, project_name, include_self_owned_labor)
+            timings['analysis'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        if refresh or cache_manager.get_labor_cache(file_path) is None:
+            result['labor_df'] = extract_labor_service_breakdown(file_path)
+            result['labor_extracted'] = True
+        timings['labor'] = time.perf_counter() - start
+
+    # 数据处理过程中报告的错误和警告（如缺少工作表）
+    result['errors'].extend(d.message for d in diagnostics if d.level == 'error')
+    result['warnings'].extend(d.message for d in diagnostics if d.level == 'warning')
+    return result
+
+
+def save_shared_caches(result):
+    """在主进程中写入工作进程提取的数据（提取缓存和人工服务拆分缓存）"""
+    cache_manager = get_cache_manager()
+    for include_self_owned_labor, (main_df, tertiary_df) in result['extracted'].items():
+        cache_manager.save_cached_data(result['file'], include_self_owned_labor, main_df, tertiary_df)
+    if result['labor_extracted']:
+        cache_manager.save_labor_cache(result['file'], result['labor_df'])
+
+
+def print_report(results, workers, elapsed):
+    """输出每个文件各阶段的耗时和汇总信息"""
+    name_width = max([len(r['project']) for r in results] + [4])
+    print(f"{'项目'.ljust(name_width)}  {'提取(s)':>8}  {'分析(s)':>8}  {'人工(s)':>8}  {'合计(s)':>8}  结果")
+    for r in sorted(results, key=lambda r: r['project']):
+        timings = r['timings']
+        total = sum(timings.values())
+        status = '；'.join(r['errors']) or '成功'
+        print(f"{r['project'].ljust(name_width)}  {timings['extract']:8.2f}  {timings['analysis']:8.2f}  "
+              f"{timings['labor']:8.2f}  {total:8.2f}  {status}")
+    for r in sorted(results, key=lambda r: r['project']):
+        for message in dict.fromkeys(r['warnings']):
+            print(f"警告 [{r['project']}] {message}")
+    busy = sum(sum(r['timings'].values()) for r in results)
+    failed = sum(1 for r in results if r['errors'])
+    print(f"\n共 {len(results)} 个文件，成功 {len(results) - failed} 个，失败 {failed} 个；"
+          f"进程数 {workers}，总耗时 {elapsed:.2f}s（逐文件耗时合计 {busy:.2f}s）")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="离线预计算运营成本看板的提取缓存和分析缓存")
+    parser.add_argument("--data-dir", default="data", help="工作簿所在目录（默认 data）")
+    parser.add_argument("--workers", "-j", type=int, default=1,
+                        help=f"并行处理的进程数（默认1，本机CPU数 {os.cpu_count()}）")
+    parser.add_argument("--months", type=parse_months, default=list(range(1, 13)),
+                        help="预计算的月份，如 1-12、6 或 1,3,6（默认1-12）")
+    parser.add_argument("--labor-mode", choices=list(LABOR_MODES), default='both',
+                        help="人工成本口径：both 两种都算（默认）、with 包含自有人工、without 不包含")
+    parser.add_argument("--refresh", action="store_true", help="忽略仍有效的缓存，全部重新计算")
+    args = parser.parse_args(argv)
+
+    data_dir = Path(args.data_dir)
+    if not data_dir.is_dir():
+        print(f"数据目录不存在: {data_dir}", file=sys.stderr)
+        return 2
+    # 与页面中相同的文件路径写法（data_dir / 文件名），缓存键才能对应
+    files = sorted(data_dir / f.name for f in get_excel_files(data_dir))
+    if not files:
+        print(f"{data_dir} 中没有可处理的Excel文件", file=sys.stderr)
+        return 2
+
+    labor_modes = LABOR_MODES[args.labor_mode]
+    workers = max(1, min(args.workers, len(files)))
+    print(f"预计算 {len(files)} 个文件，月份 {args.months[0]}-{args.months[-1]}（{len(args.months)}个），"
+          f"口径 {args.labor_mode}，进程数 {workers}")
+
+    start = time.perf_counter()
+    results = []
+    if workers == 1:
+        for file_path in files:
+            result = precompute_file(file_path, args.months, labor_modes, args.refresh)
+            save_shared_caches(result)
+            results.append(result)
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=use_read_only_cache_manager) as executor:
+            futures = {executor.submit(precompute_file, file_path, args.months, labor_modes, args.refresh): file_path
+                       for file_path in files}
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = new_result(futures[future], errors=[str(e)])
+                save_shared_caches(result)
+                results.append(result)
+
+    print_report(results, workers, time.perf_counter() - start)
+    return 1 if any(r['errors'] for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
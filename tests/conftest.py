@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# 测试从项目根目录导入 utils、components 等模块
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,100 @@
+import http.client
+import json
+import shutil
+import threading
+from pathlib import Path
+from urllib.parse import quote
+
+import pytest
+
+import api_server
+from api_server import PortfolioApi, etag_matches, make_server
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+
+
+@pytest.fixture(scope="module")
+def server(tmp_path_factory):
+    """在临时端口上运行接口服务，数据目录只放一个工作簿"""
+    data_dir = tmp_path_factory.mktemp("data")
+    workbook = min(DATA_DIR.glob("*.xlsx"), key=lambda f: f.stat().st_size)
+    shutil.copy(workbook, data_dir / workbook.name)
+    httpd = make_server("127.0.0.1", 0, data_dir)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd, workbook.name.replace('.xlsx', '')
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _get(server, path, headers=None):
+    httpd, _ = server
+    conn = http.client.HTTPConnection(*httpd.server_address, timeout=300)
+    try:
+        conn.request("GET", path, headers=headers or {})
+        response = conn.getresponse()
+        return response.status, response.getheader('ETag'), response.read()
+    finally:
+        conn.close()
+
+
+def test_etag_revalidation(server):
+    _, project = server
+    path = f"/api/projects/{quote(project)}?month=6"
+    status, etag, body = _get(server, path)
+    assert status == 200
+    assert json.loads(body)['project'] == project
+
+    for if_none_match in (etag, f'W/{etag}', f'"other", {etag}', '*'):
+        status, revalidated_etag, body = _get(server, path, {'If-None-Match': if_none_match})
+        assert (status, revalidated_etag, body) == (304, etag, b'')
+    assert _get(server, path, {'If-None-Match': '"other"'})[0] == 200
+
+
+@pytest.mark.parametrize("path, status", [
+    ("/api/kpis?month=13", 400),
+    ("/api/kpis?labor=x", 400),
+    ("/api/exceptions?kind=other", 400),
+    ("/api/projects/不存在的项目", 404),
+    ("/api/unknown", 404),
+])
+def test_error_responses(server, path, status):
+    response_status, etag, body = _get(server, quote(path, safe='/?=&'))
+    assert response_status == status
+    assert etag is None
+    assert json.loads(body)['error']
+
+
+def test_etag_matches():
+    assert etag_matches('W/"a"', '"a"')
+    assert etag_matches('"b" , "a"', 'W/"a"')
+    assert etag_matches(' * ', '"a"')
+    assert not etag_matches('"b"', '"a"')
+    assert not etag_matches(None, '"a"')
+
+
+def test_snapshot_built_outside_shared_lock(monkeypatch, tmp_path):
+    """冷快照构建期间其他月份的快照不被阻塞，同一快照只构建一次"""
+    release = threading.Event()
+    built = []
+
+    class SlowSnapshot:
+        def __init__(self, month, include_self_owned_labor, files, fingerprint):
+            built.append(month)
+            if month == 1:
+                assert release.wait(10)
+            self.fingerprint = fingerprint
+
+    monkeypatch.setattr(api_server, "PortfolioSnapshot", SlowSnapshot)
+    api = PortfolioApi(tmp_path)
+    results = []
+    slow = [threading.Thread(target=lambda: results.append(api.snapshot(1, False))) for _ in range(2)]
+    for thread in slow:
+        thread.start()
+
+    assert api.snapshot(2, False).fingerprint.endswith(":2:0")
+    release.set()
+    for thread in slow:
+        thread.join(10)
+    assert results[0] is results[1]
+    assert sorted(built) == [1, 2]
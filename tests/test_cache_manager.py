@@ -0,0 +1,44 @@
+import os
+import time
+
+import pandas as pd
+
+from utils.cache_manager import CacheManager
+
+
+def _write_cache(tmp_path):
+    source = tmp_path / "项目.xlsx"
+    source.write_bytes(b"xlsx")
+    cache_dir = tmp_path / "buffer"
+    CacheManager(str(cache_dir)).save_cached_data(str(source), False, pd.DataFrame({'a': [1]}), pd.DataFrame())
+    return source, cache_dir
+
+
+def test_read_only_manager_leaves_metadata_to_writer(tmp_path):
+    source, cache_dir = _write_cache(tmp_path)
+    metadata_file = cache_dir / "cache_metadata.pkl"
+    main_df, _ = CacheManager(str(cache_dir), read_only=True).get_cached_data(str(source), False)
+    assert main_df['a'].tolist() == [1]
+
+    # 源文件变化后的新缓存、过期缓存的删除和清空操作都不写入元数据
+    os.utime(metadata_file, (0, 0))
+    reader = CacheManager(str(cache_dir), read_only=True)
+    for cache_info in reader.cache_metadata.values():
+        cache_info['timestamp'] = time.time() - 2 * 86400
+    assert reader.get_cached_data(str(source), False) is None
+    reader.save_labor_cache(str(source), None)
+    reader.cleanup_expired_cache()
+    reader.clear_all_cache()
+
+    assert metadata_file.stat().st_mtime == 0
+    assert len(CacheManager(str(cache_dir)).cache_metadata) == 1
+    assert len([f for f in cache_dir.glob("*.pkl") if f != metadata_file]) == 1
+
+
+def test_writer_removes_expired_cache(tmp_path):
+    source, cache_dir = _write_cache(tmp_path)
+    writer = CacheManager(str(cache_dir))
+    for cache_info in writer.cache_metadata.values():
+        cache_info['timestamp'] = time.time() - 2 * 86400
+    assert writer.get_cached_data(str(source), False) is None
+    assert CacheManager(str(cache_dir)).cache_metadata == {}
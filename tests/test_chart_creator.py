@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+from utils.chart_creator import (
+    create_combined_donut_chart, create_combined_donut_chart_by_month, create_three_donut_charts,
+    create_three_donut_charts_by_month, slim_figure
+)
+
+DATA = {
+    'time_progress': 41.666666666,
+    'year_usage': 37.123456,
+    'month_usage': 88.888888,
+    'cum_target': [1000.0 * m for m in range(1, 13)],
+    'cum_actual': [910.0 * m for m in range(1, 13)],
+}
+
+BUILDERS = {
+    'three': lambda: create_three_donut_charts(DATA, 5),
+    'combined': lambda: [create_combined_donut_chart(DATA, 5)],
+    'three_by_month': lambda: create_three_donut_charts_by_month(DATA, 5),
+    'combined_by_month': lambda: [create_combined_donut_chart_by_month(DATA, 5)],
+}
+
+
+def _without_template(fig):
+    spec = json.loads(fig.to_json())
+    spec['layout'].pop('template', None)
+    return spec
+
+
+def _assert_close(slim, full, path="figure"):
+    """除环形数值保留两位小数外，精简图表与原图表完全一致"""
+    if isinstance(full, dict):
+        assert slim.keys() == full.keys(), path
+        for key in full:
+            _assert_close(slim[key], full[key], f"{path}.{key}")
+    elif isinstance(full, list):
+        assert len(slim) == len(full), path
+        for i, (a, b) in enumerate(zip(slim, full)):
+            _assert_close(a, b, f"{path}[{i}]")
+    elif isinstance(full, float):
+        assert slim == pytest.approx(full, abs=0.005), path
+    else:
+        assert slim == full, path
+
+
+@pytest.mark.parametrize("name", BUILDERS)
+def test_slim_donuts_match_default_output(name):
+    for full, slim in zip(BUILDERS[name](), BUILDERS[name]()):
+        slim_figure(slim)
+        assert 'template' not in json.loads(slim.to_json())['layout']
+        _assert_close(_without_template(slim), _without_template(full))
+        assert len(slim.to_json()) < len(full.to_json())
+
+
+def test_slim_rounds_ring_values():
+    slim = slim_figure(create_three_donut_charts(DATA, 5)[0])
+    assert list(slim.data[0].values) == [41.67, 58.33]
@@ -0,0 +1,77 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from utils.data_processor import create_summary_excel
+
+MONTHS = [f'{m}月' for m in range(1, 13)]
+
+
+def _main_df(rows, project, blank_row=False):
+    """构造主要费项表：费项名称、数据类型、1-12月和项目名称列"""
+    records = [[name, kind, *values, project] for name, kind, values in rows]
+    if blank_row:
+        records.append([np.nan, np.nan, *[0] * 12, project])
+    return pd.DataFrame(records, columns=['二级费项', '列1', *MONTHS, '项目名称'])
+
+
+def test_summary_sums_rows_by_label():
+    a = _main_df([('年总成本', '月累总目标成本', [1] * 12), ('年总成本', '月累已发生成本', [2] * 12)], 'A')
+    b = _main_df([('年总成本', '月累已发生成本', [5] * 12), ('年总成本', '月累总目标成本', [3] * 12)], 'B')
+
+    summary = create_summary_excel({'A': a, 'B': b})
+
+    assert summary['列1'].tolist() == ['月累总目标成本', '月累已发生成本']
+    assert summary[MONTHS].to_numpy().tolist() == [[4.0] * 12, [7.0] * 12]
+    assert (summary['项目名称'] == '汇总').all()
+
+
+def test_summary_drops_blank_rows():
+    rows = [('年总成本', '月累总目标成本', [1] * 12)]
+    summary = create_summary_excel({'A': _main_df(rows, 'A', blank_row=True), 'B': _main_df(rows, 'B')})
+
+    assert len(summary) == 1
+    assert summary['二级费项'].notna().all()
+
+
+def _labor_df(month_format, values, extra_column=False):
+    df = pd.DataFrame({'费项名称': ['保洁', '保安'], '数据类型': ['人数', '人数']})
+    for m in range(1, 13):
+        df[month_format.format(m)] = values
+    if extra_column:
+        df['备注'] = ['', '']
+    return df
+
+
+def test_labor_summary_aligns_month_columns_across_files(monkeypatch):
+    from utils import data_processor
+
+    frames = {
+        'a.xlsx': _labor_df('{}', [1, 2]),
+        'b.xlsx': _labor_df('{}月', [10, 20]),
+    }
+    monkeypatch.setattr(data_processor, 'load_labor_service_breakdown', lambda path: frames[path.name])
+
+    summary = data_processor.create_labor_service_summary(list(frames), Path('.'))
+
+    assert summary[['费项名称', '数据类型']].values.tolist() == [['保安', '人数'], ['保洁', '人数']]
+    assert summary[[str(m) for m in range(1, 13)]].to_numpy().tolist() == [[22.0] * 12, [11.0] * 12]
+
+
+def test_labor_summary_reports_file_with_different_columns(monkeypatch):
+    from utils import data_processor
+    from utils.diagnostics import collect_diagnostics
+
+    frames = {
+        'a.xlsx': _labor_df('{}', [1, 2], extra_column=True),
+        'b.xlsx': _labor_df('{}', [10, 20]),
+    }
+    monkeypatch.setattr(data_processor, 'load_labor_service_breakdown', lambda path: frames[path.name])
+
+    with collect_diagnostics() as diagnostics:
+        summary = data_processor.create_labor_service_summary(list(frames), Path('.'))
+
+    assert summary[[str(m) for m in range(1, 13)]].to_numpy().tolist() == [[2.0] * 12, [1.0] * 12]
+    assert [d.level for d in diagnostics] == ['error']
+    assert 'b.xlsx' in diagnostics[0].message
@@ -0,0 +1,109 @@
+import io
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.export_payloads import clear_payload_cache, deferred_payload, streaming_excel_bytes
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+SESSIONS = 8
+ROUNDS = 4
+
+
+def _project_frame(name, seed):
+    """单个项目1-12月的目标和已发生金额，各项目数值不同"""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        '项目名称': name,
+        '月份': [f'{m}月' for m in range(1, 13)],
+        '目标成本': np.round(rng.uniform(1e4, 1e6, 12), 2),
+        '已发生成本': np.round(rng.uniform(1e4, 1e6, 12), 2),
+    })
+
+
+def _export_concurrently(tables):
+    """每个会话一个线程，同时点击下载，返回各会话收到的xlsx字节"""
+    results = [None] * len(tables)
+    errors = []
+    barrier = threading.Barrier(len(tables))
+
+    def session(i):
+        try:
+            download = deferred_payload('client_xlsx', streaming_excel_bytes, tables[i], '客户数据')
+            barrier.wait()
+            results[i] = download()
+        except Exception as e:  # 线程中的异常交给主线程断言
+            errors.append(e)
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(len(tables))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    return results
+
+
+def _assert_round_trip(payloads, tables):
+    for payload, table in zip(payloads, tables):
+        back = pd.read_excel(io.BytesIO(payload), sheet_name='客户数据')
+        pd.testing.assert_frame_equal(back, table.reset_index(drop=True), check_dtype=False)
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """在空的工作目录中运行，导出结束后检查没有留下任何文件"""
+    monkeypatch.chdir(tmp_path)
+    clear_payload_cache()
+    yield tmp_path
+    clear_payload_cache()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_concurrent_sessions_export_their_own_projects(workdir):
+    projects = {f'项目{i}': _project_frame(f'项目{i}', i) for i in range(12)}
+    names = list(projects)
+    # 每个会话选择不同的项目子集
+    tables = [pd.concat([projects[n] for n in names[k:k + 2 + k % 4]], ignore_index=True) for k in range(SESSIONS)]
+
+    for _ in range(ROUNDS):
+        clear_payload_cache()
+        _assert_round_trip(_export_concurrently(tables), tables)
+
+
+def test_concurrent_sessions_with_same_selection_share_payload(workdir):
+    table = _project_frame('项目A', 0)
+    payloads = _export_concurrently([table.copy() for _ in range(SESSIONS)])
+    _assert_round_trip(payloads, [table] * SESSIONS)
+
+
+@pytest.fixture(scope="module")
+def workbook_tables():
+    """data目录中的工作簿按不同项目子集生成的客户下载表"""
+    from utils.data_processor import create_client_download_table, extract_table_from_excel, process_excel_data
+
+    main_dfs = {}
+    for file_path in sorted(DATA_DIR.glob("*.xlsx")):
+        main_df, _ = extract_table_from_excel(file_path)
+        if main_df is not None:
+            main_dfs[file_path.stem] = main_df
+    if len(main_dfs) < 2:
+        pytest.skip("可提取的工作簿不足")
+
+    names = list(main_dfs)
+    tables = []
+    for k in range(SESSIONS):
+        start = k % len(names)
+        subset = names[start:start + 1 + k % 3]
+        # 不传项目名称，不读写分析缓存
+        data = {n: process_excel_data(main_dfs[n], 12) for n in subset}
+        tables.append(create_client_download_table({n: main_dfs[n] for n in subset}, data))
+    return tables
+
+
+@pytest.mark.skipif(not any(DATA_DIR.glob("*.xlsx")), reason="data目录中没有工作簿")
+def test_concurrent_client_exports_for_workbooks(workbook_tables, workdir):
+    _assert_round_trip(_export_concurrently(workbook_tables), workbook_tables)
@@ -0,0 +1,66 @@
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.numeric_parser import to_cents, to_float_array, to_float_matrix
+
+
+def safe_convert_to_float(data):
+    """改造前 process_excel_data 中逐单元格转换的实现，作为对照"""
+    converted_data = []
+    for item in data:
+        if pd.isna(item):
+            converted_data.append(0.0)
+        elif isinstance(item, str):
+            number_match = re.search(r'([+-]?\d*\.?\d+)', str(item))
+            if number_match:
+                try:
+                    converted_data.append(float(number_match.group(1)))
+                except ValueError:
+                    converted_data.append(0.0)
+            else:
+                converted_data.append(0.0)
+        else:
+            try:
+                converted_data.append(float(item))
+            except (ValueError, TypeError):
+                converted_data.append(0.0)
+    return np.array(converted_data)
+
+
+# 与改造前结果一致的取值
+SAME_AS_BEFORE = [1234.5, 0, -3, '42', ' 42 ', '１２', '12月', '-7.5元', '-', '—', 'N/A', '', 'abc', None, np.nan]
+# 有意改变的取值：千分位和中文逗号不再截断数字，科学计数法按数值解析
+CHANGED = {'3，000': 3000.0, '1,234.56': 1234.56, '1e3': 1000.0}
+
+
+@pytest.mark.parametrize("value", SAME_AS_BEFORE, ids=repr)
+def test_matches_previous_conversion(value):
+    column = pd.Series([value, '1'], dtype=object)
+    np.testing.assert_array_equal(to_float_array(column), safe_convert_to_float(column))
+
+
+@pytest.mark.parametrize("value,expected", CHANGED.items(), ids=repr)
+def test_separators_and_exponents(value, expected):
+    assert to_float_array([value])[0] == expected
+
+
+def test_mixed_column_matches_per_cell_results():
+    values = SAME_AS_BEFORE * 3
+    np.testing.assert_array_equal(to_float_array(pd.Series(values, dtype=object)), safe_convert_to_float(values))
+    assert to_float_array(pd.Series([1.5, np.nan, 2])).tolist() == [1.5, 0.0, 2.0]
+
+
+def test_matrix_converts_each_column_and_pads_width():
+    df = pd.DataFrame({'a': SAME_AS_BEFORE, 'b': list(reversed(SAME_AS_BEFORE))})
+    matrix = to_float_matrix(df, width=3)
+    assert matrix.shape == (len(SAME_AS_BEFORE), 3)
+    np.testing.assert_array_equal(matrix[:, 0], safe_convert_to_float(df['a']))
+    np.testing.assert_array_equal(matrix[:, 1], safe_convert_to_float(df['b']))
+    assert not matrix[:, 2].any()
+
+
+def test_to_cents_rounds_to_integer_cents():
+    assert to_cents([0.1, 0.2, 19.99, -2.5]).tolist() == [10, 20, 1999, -250]
@@ -0,0 +1,129 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.data_processor import analyze_project, process_excel_data, process_tertiary_fee_data
+from utils.exception_store import exception_prefix_counts
+from utils.portfolio_store import build_portfolio_store
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+
+
+def _project(month, exceptions_by_month):
+    """构造分析结果：异常逐月出现，exceptions 只保留到所选月份"""
+    year_exceptions = [{'month': m, 'exception_type': kind} for m, kind in exceptions_by_month]
+    exceptions = [e for e in year_exceptions if e['month'] <= month]
+    return {
+        'cum_target': [100.0 * m for m in range(1, 13)],
+        'cum_actual': [90.0 * m for m in range(1, 13)],
+        'exceptions': exceptions,
+        'exception_counts': exception_prefix_counts(exceptions),
+        'year_exception_counts': exception_prefix_counts(year_exceptions),
+        'tertiary_exceptions': exceptions,
+        'tertiary_exception_counts': exception_prefix_counts(exceptions),
+        'tertiary_year_exception_counts': exception_prefix_counts(year_exceptions),
+    }
+
+
+def _period_summaries(make_all_data):
+    return {month: build_portfolio_store(make_all_data(month)).period_summary for month in range(1, 13)}
+
+
+def test_period_summary_independent_of_selected_month():
+    exceptions = [(2, 'yellow'), (5, 'red'), (8, 'yellow'), (11, 'red'), (12, 'red')]
+    summaries = _period_summaries(lambda month: {'A': _project(month, exceptions), 'B': _project(month, exceptions[:2])})
+
+    for month, summary in summaries.items():
+        pd.testing.assert_frame_equal(summary, summaries[12], obj=f"month={month}")
+    full_year = summaries[12].set_index('period').loc['全年']
+    assert full_year['main_red'] == 4
+    assert full_year['tertiary_yellow'] == 3
+
+
+def test_range_query_counts_full_year_exceptions():
+    store = build_portfolio_store({'A': _project(3, [(2, 'yellow'), (10, 'red')])})
+    assert store.range_query(10, 12)['main_red'] == 1
+    assert store.range_query(1, 3)['main_yellow'] == 1
+
+
+MONTHS = [f'{m}月' for m in range(1, 13)]
+# 4月一次性发生2000，超过全年目标1200：4-12月每月都是红色异常
+SPIKE = [0, 0, 0, 2000] + [0] * 8
+
+
+def _workbook_frames():
+    main_df = pd.DataFrame([
+        ['年总成本', '月累总目标成本', *[100] * 12, 'X'],
+        ['年总成本', '月累已发生成本', *SPIKE, 'X'],
+        ['保洁', '目标金额', *[100] * 12, 'X'],
+        ['保洁', '已发生金额', *SPIKE, 'X'],
+    ], columns=['二级费项', '列1', *MONTHS, '项目名称'])
+    tertiary_df = pd.DataFrame([
+        ['1.1.1', '目标金额', *[100] * 12],
+        ['1.1.1', '目标金额累计', *range(100, 1300, 100)],
+        ['1.1.1', '已发生金额', *SPIKE],
+        ['1.1.1', '已发生金额累计', *np.cumsum(SPIKE)],
+    ], columns=['费项编码', '数据类型', *MONTHS])
+    return main_df, tertiary_df
+
+
+class _OldCacheManager:
+    """返回旧版本缓存（没有全年异常计数）的缓存管理器"""
+
+    def __init__(self, main_df, tertiary_df, month):
+        self.project = process_excel_data(main_df, month)
+        self.anomaly = process_tertiary_fee_data(tertiary_df, month)
+        for cached in (self.project, self.anomaly):
+            del cached['year_exception_counts']
+        self.saved = []
+
+    def get_project_analysis_cache(self, project_name, month, include_self_owned_labor=False):
+        return self.project
+
+    def get_anomaly_cache(self, project_name, month, include_self_owned_labor=False):
+        return self.anomaly
+
+    def save_project_analysis_cache(self, project_name, month, data, include_self_owned_labor=False):
+        self.saved.append(('project_analysis', data))
+
+    def save_anomaly_cache(self, project_name, month, data, include_self_owned_labor=False):
+        self.saved.append(('anomaly', data))
+
+
+def test_old_cache_without_year_counts_is_recomputed(monkeypatch):
+    from utils import data_processor
+
+    main_df, tertiary_df = _workbook_frames()
+    cache_manager = _OldCacheManager(main_df, tertiary_df, month=3)
+    monkeypatch.setattr(data_processor, 'get_cache_manager', lambda: cache_manager)
+
+    data = analyze_project(main_df, tertiary_df, 3, 'X')
+
+    assert [kind for kind, _ in cache_manager.saved] == ['project_analysis', 'anomaly']
+    summary = build_portfolio_store({'X': data}).period_summary.set_index('period')
+    for kind in ('main', 'tertiary'):
+        assert summary[f'{kind}_red'].to_dict() == {'Q1': 0, 'Q2': 3, 'Q3': 3, 'Q4': 3, '上半年': 3, '下半年': 6, '全年': 9}
+    # 截至所选月份的异常仍只到3月
+    assert data['exceptions'] == [] and data['tertiary_exceptions'] == []
+
+
+@pytest.mark.skipif(not any(DATA_DIR.glob("*.xlsx")), reason="data目录中没有工作簿")
+def test_period_summary_independent_of_month_for_workbooks():
+    from utils.data_processor import extract_table_from_excel
+
+    frames = {}
+    for file_path in sorted(DATA_DIR.glob("*.xlsx"))[:3]:
+        main_df, tertiary_df = extract_table_from_excel(file_path, use_cache=False)
+        if main_df is not None and tertiary_df is not None:
+            frames[file_path.stem] = (main_df, tertiary_df)
+    if not frames:
+        pytest.skip("没有可提取的工作簿")
+
+    # 不传项目名称，不读写分析缓存
+    def all_data(month):
+        return {name: analyze_project(main_df, tertiary_df, month) for name, (main_df, tertiary_df) in frames.items()}
+
+    q1, year_end = build_portfolio_store(all_data(3)), build_portfolio_store(all_data(12))
+    pd.testing.assert_frame_equal(q1.period_summary, year_end.period_summary)
@@ -1,4 +1,3 @@
-import streamlit as st
 import pandas as pd
 import hashlib
 import time
@@ -6,12 +5,19 @@ from pathlib import Path
 from typing import Dict, Any, Optional, Tuple
 import pickle
 import os
+import threading
+from utils import diagnostics
 
 class CacheManager:
-    """缓存管理器，用于缓存处理过的数据，减少重复加载时间"""
+    """缓存管理器，用于缓存处理过的数据，减少重复加载时间
     
-    def __init__(self, cache_dir: str = "output/buffer"):
+    read_only=True 时只读取提取缓存，不写入或删除元数据及其对应的缓存文件（用于预计算的工作进程，
+    元数据由主进程统一写入）；分析缓存每项一个独立文件，仍可直接读写。
+    """
+    
+    def __init__(self, cache_dir: str = "output/buffer", read_only: bool = False):
         self.cache_dir = Path(cache_dir)
+        self.read_only = read_only
         self.cache_dir.mkdir(parents=True, exist_ok=True)
         self.cache_metadata_file = self.cache_dir / "cache_metadata.pkl"
         self.cache_metadata = self._load_cache_metadata()
@@ -28,17 +34,22 @@ class CacheManager:
     
     def _save_cache_metadata(self):
         """保存缓存元数据"""
+        if self.read_only:
+            return
         try:
             with open(self.cache_metadata_file, 'wb') as f:
                 pickle.dump(self.cache_metadata, f)
         except Exception as e:
-            st.warning(f"保存缓存元数据失败: {e}")
+            diagnostics.warning(f"保存缓存元数据失败: {e}")
     
     def _generate_cache_key(self, file_path: str, include_self_owned_labor: bool, 
-                           file_size: int, file_mtime: float) -> str:
+                           file_size: int, file_mtime: float, kind: str = "data") -> str:
         """生成缓存键"""
         # 使用文件路径、参数、大小和修改时间生成唯一键
         key_data = f"{file_path}_{include_self_owned_labor}_{file_size}_{file_mtime}"
+        # 同一文件的其他类别缓存（如人工服务拆分）在键中加上类别
+        if kind != "data":
+            key_data = f"{kind}_{key_data}"
         return hashlib.md5(key_data.encode()).hexdigest()
     
     def _get_file_info(self, file_path: Path) -> Tuple[int, float]:
@@ -49,20 +60,25 @@ class CacheManager:
         except:
             return 0, 0
     
-    def get_cached_data(self, file_path: str, include_self_owned_labor: bool) -> Optional[Tuple[pd.DataFrame, pd.DataFrame]]:
-        """获取缓存的数据"""
+    def _cache_file(self, cache_key: str, kind: str = "data") -> Path:
+        """缓存数据文件路径"""
+        return self.cache_dir / (f"{cache_key}.pkl" if kind == "data" else f"{kind}_{cache_key}.pkl")
+    
+    def _load_file_cache(self, file_path: str, include_self_owned_labor: bool,
+                         kind: str = "data") -> Optional[Dict[str, Any]]:
+        """读取按文件路径、参数、大小和修改时间缓存的数据，缓存不存在或已失效时返回None"""
         try:
             file_path_obj = Path(file_path)
             if not file_path_obj.exists():
                 return None
                 
             file_size, file_mtime = self._get_file_info(file_path_obj)
-            cache_key = self._generate_cache_key(str(file_path), include_self_owned_labor, file_size, file_mtime)
+            cache_key = self._generate_cache_key(str(file_path), include_self_owned_labor, file_size, file_mtime, kind)
             
             # 检查缓存是否存在且有效
             if cache_key in self.cache_metadata:
                 cache_info = self.cache_metadata[cache_key]
-                cache_file = self.cache_dir / f"{cache_key}.pkl"
+                cache_file = self._cache_file(cache_key, kind)
                 
                 # 检查缓存文件是否存在
                 if cache_file.exists():
@@ -70,8 +86,7 @@ class CacheManager:
                     if time.time() - cache_info['timestamp'] < 86400:
                         try:
                             with open(cache_file, 'rb') as f:
-                                cached_data = pickle.load(f)
-                                return cached_data['main_df'], cached_data['tertiary_df']
+                                return pickle.load(f)
                         except Exception as e:
                             # 删除无效缓存
                             self._remove_cache(cache_key)
@@ -83,26 +98,21 @@ class CacheManager:
         except Exception as e:
             return None
     
-    def save_cached_data(self, file_path: str, include_self_owned_labor: bool, 
-                        main_df: pd.DataFrame, tertiary_df: pd.DataFrame):
-        """保存数据到缓存"""
+    def _save_file_cache(self, file_path: str, include_self_owned_labor: bool,
+                         cache_data: Dict[str, Any], kind: str = "data"):
+        """保存按文件路径、参数、大小和修改时间缓存的数据"""
+        if self.read_only:
+            return
         try:
             file_path_obj = Path(file_path)
             if not file_path_obj.exists():
                 return
                 
             file_size, file_mtime = self._get_file_info(file_path_obj)
-            cache_key = self._generate_cache_key(str(file_path), include_self_owned_labor, file_size, file_mtime)
+            cache_key = self._generate_cache_key(str(file_path), include_self_owned_labor, file_size, file_mtime, kind)
             
             # 保存数据到缓存文件
-            cache_file = self.cache_dir / f"{cache_key}.pkl"
-            cache_data = {
-                'main_df': main_df,
-                'tertiary_df': tertiary_df,
-                'file_path': str(file_path),
-                'include_self_owned_labor': include_self_owned_labor
-            }
-            
+            cache_file = self._cache_file(cache_key, kind)
             with open(cache_file, 'wb') as f:
                 pickle.dump(cache_data, f)
             
@@ -110,6 +120,7 @@ class CacheManager:
             self.cache_metadata[cache_key] = {
                 'file_path': str(file_path),
                 'include_self_owned_labor': include_self_owned_labor,
+                'kind': kind,
                 'file_size': file_size,
                 'file_mtime': file_mtime,
                 'timestamp': time.time(),
@@ -121,7 +132,32 @@ class CacheManager:
         except Exception as e:
             pass
     
-    def get_analysis_cache(self, cache_type: str, project_name: str, month: int, 
+    def get_cached_data(self, file_path: str, include_self_owned_labor: bool) -> Optional[Tuple[pd.DataFrame, pd.DataFrame]]:
+        """获取缓存的数据"""
+        cached_data = self._load_file_cache(file_path, include_self_owned_labor)
+        if cached_data is None:
+            return None
+        return cached_data['main_df'], cached_data['tertiary_df']
+    
+    def save_cached_data(self, file_path: str, include_self_owned_labor: bool, 
+                        main_df: pd.DataFrame, tertiary_df: pd.DataFrame):
+        """保存数据到缓存"""
+        self._save_file_cache(file_path, include_self_owned_labor, {
+            'main_df': main_df,
+            'tertiary_df': tertiary_df,
+            'file_path': str(file_path),
+            'include_self_owned_labor': include_self_owned_labor
+        })
+    
+    def get_labor_cache(self, file_path: str) -> Optional[Dict[str, Any]]:
+        """获取人工服务拆分数据缓存（与人工成本口径无关）"""
+        return self._load_file_cache(file_path, False, kind="labor")
+    
+    def save_labor_cache(self, file_path: str, labor_df: Optional[pd.DataFrame]):
+        """保存人工服务拆分数据到缓存（未找到工作表时也缓存空结果）"""
+        self._save_file_cache(file_path, False, {'labor_df': labor_df, 'file_path': str(file_path)}, kind="labor")
+    
+    def get_analysis_cache(self, cache_type: str, project_name: str, month: int,
                           include_self_owned_labor: bool = False) -> Optional[Dict[str, Any]]:
         """获取分析结果缓存"""
         try:
@@ -156,6 +192,17 @@ class CacheManager:
         except Exception:
             pass
     
+    def remove_analysis_cache(self, cache_type: str, project_name: str, month: int,
+                              include_self_owned_labor: bool = False):
+        """删除分析结果缓存，下次读取时重新计算"""
+        try:
+            cache_key = f"{cache_type}_{project_name}_{month}_{include_self_owned_labor}"
+            cache_file = self.cache_dir / f"analysis_{cache_key}.pkl"
+            if cache_file.exists():
+                cache_file.unlink()
+        except Exception:
+            pass
+    
     def get_secondary_fee_cache(self, project_name: str, month: int, 
                                include_self_owned_labor: bool = False) -> Optional[pd.DataFrame]:
         """获取二级费项缓存"""
@@ -187,19 +234,23 @@ class CacheManager:
         self.save_analysis_cache("project_analysis", project_name, month, data, include_self_owned_labor)
     
     def _remove_cache(self, cache_key: str):
-        """删除指定的缓存"""
+        """删除指定的缓存（只读时只在本实例中忽略该缓存）"""
         try:
-            if cache_key in self.cache_metadata:
+            if self.read_only:
+                self.cache_metadata.pop(cache_key, None)
+            elif cache_key in self.cache_metadata:
                 cache_file = Path(self.cache_metadata[cache_key]['cache_file'])
                 if cache_file.exists():
                     cache_file.unlink()
                 del self.cache_metadata[cache_key]
                 self._save_cache_metadata()
         except Exception as e:
-            st.warning(f"删除缓存失败: {e}")
+            diagnostics.warning(f"删除缓存失败: {e}")
     
     def clear_all_cache(self):
         """清除所有缓存"""
+        if self.read_only:
+            return
         try:
             # 删除所有缓存文件
             for cache_file in self.cache_dir.glob("*.pkl"):
@@ -209,10 +260,10 @@ class CacheManager:
             # 清空元数据
             self.cache_metadata = {}
             self._save_cache_metadata()
-            st.success("🗑️ 已清除所有缓存")
+            diagnostics.success("🗑️ 已清除所有缓存")
             
         except Exception as e:
-            st.error(f"清除缓存失败: {e}")
+            diagnostics.error(f"清除缓存失败: {e}")
     
     def get_cache_stats(self) -> Dict[str, Any]:
         """获取缓存统计信息"""
@@ -244,11 +295,33 @@ class CacheManager:
             # 静默清理过期缓存
                 
         except Exception as e:
-            st.warning(f"清理过期缓存失败: {e}")
+            diagnostics.warning(f"清理过期缓存失败: {e}")
+
+def fingerprint_frame(df: Optional[pd.DataFrame]) -> str:
+    """根据DataFrame的列名、形状和内容生成指纹，用于判断数据是否变化"""
+    if df is None:
+        return "none"
+    hasher = hashlib.md5()
+    hasher.update(str(list(df.columns)).encode())
+    hasher.update(str(df.shape).encode())
+    hasher.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return hasher.hexdigest()
 
-# 全局缓存管理器实例
-cache_manager = CacheManager()
+# 全局缓存管理器实例（首次使用时创建，导入模块时不创建缓存目录）
+_cache_manager: Optional[CacheManager] = None
+_cache_manager_lock = threading.Lock()
 
 def get_cache_manager() -> CacheManager:
     """获取全局缓存管理器实例"""
-    return cache_manager 
\ No newline at end of file
+    global _cache_manager
+    if _cache_manager is None:
+        with _cache_manager_lock:
+            if _cache_manager is None:
+                _cache_manager = CacheManager()
+    return _cache_manager
+
+def use_read_only_cache_manager():
+    """将当前进程的全局缓存管理器替换为只读实例（在预计算的工作进程启动时调用）"""
+    global _cache_manager
+    with _cache_manager_lock:
+        _cache_manager = CacheManager(read_only=True) 
\ No newline at end of file
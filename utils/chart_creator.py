@@ -5,6 +5,16 @@ import numpy as np
 from plotly.subplots import make_subplots
 # import matplotlib.pyplot as plt  # 暂时注释掉，避免导入错误
 from collections import defaultdict
+from utils.exception_store import build_exception_store
+from utils.portfolio_store import build_portfolio_store
+from utils.figure_cache import cached_figure
+
+# 项目对比图中项目数超过该值时折线改用 WebGL（Scattergl）绘制
+COMPARISON_WEBGL_THRESHOLD = 100
+
+def to_wan(values, money_scale=1):
+    """将金额换算为万元：money_scale 为每元对应的存储单位数（元为1，分为100）"""
+    return np.asarray(values, dtype=float) / (money_scale * 10000)
 
 def create_pie_chart(data):
     """创建三个独立的环形图 - 修复进度条方向相反问题"""
@@ -80,6 +90,13 @@ def create_pie_chart(data):
     
     return fig
 
+def _bar_chart_key(data):
+    """柱状图的缓存键只取决于费项累计值或月度汇总表"""
+    if isinstance(data, dict):
+        return [(item.get('name'), item.get('cum_target'), item.get('cum_actual')) for item in data.get('fee_items') or []]
+    return data
+
+@cached_figure(_bar_chart_key)
 def create_bar_chart(data):
     """创建柱状图 - 根据输入类型自动选择展示方式"""
     # 检查数据类型
@@ -258,6 +275,7 @@ def create_bar_chart(data):
     
     return fig
 
+@cached_figure(lambda data: (data.get('cum_target'), data.get('cum_actual')))
 def create_line_chart(data):
     """创建折线图 - 总成本累计趋势"""
     months = list(range(1, 13))
@@ -383,14 +401,28 @@ def create_bar_line_chart(data):
     
     return fig
 
-def create_project_comparison_chart(all_data, month):
-    """创建项目对比组合图 - 包含使用率柱状图和金额折线图"""
-    projects = list(all_data.keys())
-    year_usages = [all_data[p]['year_usage'] for p in projects]
-    month_usages = [all_data[p]['month_usage'] for p in projects]
-    year_targets = [all_data[p]['year_cum_target_wy'] for p in projects]
-    # 年累计已发生成本（12月累计）
-    year_actuals = [all_data[p]['cum_actual'][-1]/10000 for p in projects]  # 取12月累计值并转换为万元
+@cached_figure(lambda all_data, month, kpi_frame=None: (kpi_frame, month) if kpi_frame is not None else (all_data, month))
+def create_project_comparison_chart(all_data, month, kpi_frame=None):
+    """创建项目对比组合图 - 包含使用率柱状图和金额折线图
+    
+    Args:
+        kpi_frame: 已构建的KPI列式表（PortfolioStore.kpi_frame 或 comparison_view 返回的子集），
+            未传入时根据all_data构建
+    """
+    if kpi_frame is None:
+        kpi_frame = build_portfolio_store(all_data).kpi_frame(month)
+    projects = kpi_frame['project'].tolist()
+    year_usages = kpi_frame['year_usage'].to_numpy()
+    month_usages = kpi_frame['month_usage'].to_numpy()
+    money_scale = kpi_frame.attrs.get('money_scale', 1)
+    year_targets = np.round(to_wan(kpi_frame['year_target'], money_scale), 2)
+    # 年累计已发生成本（12月累计，万元）
+    year_actuals = to_wan(kpi_frame['year_actual'], money_scale)
+    
+    # 项目较多时折线使用WebGL绘制并缩小标记
+    many_projects = len(projects) > COMPARISON_WEBGL_THRESHOLD
+    line_trace = go.Scattergl if many_projects else go.Scatter
+    marker_size = 5 if many_projects else 10
     
     # 创建图表
     fig = go.Figure()
@@ -418,21 +450,21 @@ def create_project_comparison_chart(all_data, month):
     ))
     
     # 添加年总目标折线
-    fig.add_trace(go.Scatter(
+    fig.add_trace(line_trace(
         x=projects, y=year_targets, mode='lines+markers', 
         name='年总目标', 
         line=dict(color='#32CD32', width=3),
-        marker=dict(size=10, color='#32CD32'),
+        marker=dict(size=marker_size, color='#32CD32'),
         hovertemplate='<b>%{x}</b><br>年总目标: %{y:.1f}万元<extra></extra>',
         yaxis='y'  # 金额轴在左边
     ))
     
     # 添加年累计已发生折线
-    fig.add_trace(go.Scatter(
+    fig.add_trace(line_trace(
         x=projects, y=year_actuals, mode='lines+markers', 
         name='年累计已发生', 
         line=dict(color='#FF0000', width=3),
-        marker=dict(size=10, color='#FF0000'),
+        marker=dict(size=marker_size, color='#FF0000'),
         hovertemplate='<b>%{x}</b><br>年累计已发生: %{y:.1f}万元<extra></extra>',
         yaxis='y'  # 金额轴在左边
     ))
@@ -456,7 +488,9 @@ def create_project_comparison_chart(all_data, month):
             gridwidth=1,
             gridcolor='#f0f0f0',
             tickangle=tick_angle,
-            tickfont=dict(family='Microsoft YaHei')
+            tickfont=dict(family='Microsoft YaHei'),
+            # 项目过多时不显示横坐标标签，项目名称见悬停提示
+            showticklabels=not many_projects
         ),
         yaxis=dict(
             title=dict(text="金额 (万元)", font=dict(family='Microsoft YaHei')),
@@ -490,22 +524,28 @@ def create_project_comparison_chart(all_data, month):
     )
     return fig
 
-def create_kpi_display(all_data):
-    """创建KPI指标显示，按年使用率从高到低排序"""
-    kpi_data = []
-    for project_name, data in all_data.items():
-        kpi_data.append({
-            "项目": project_name,
-            "年累计目标(万元)": data['year_cum_target_wy'],
-            "年累计已发生(万元)": data['year_cum_actual_wy'],
-            "年使用率(%)": data['year_usage'],
-            "月累使用率(%)": data['month_usage'],
-            "时间进度(%)": data['time_progress']
-        })
+def create_kpi_display(all_data, month=None, kpi_frame=None):
+    """创建KPI指标显示，按年使用率从高到低排序
     
-    # 按年使用率从高到低排序
-    kpi_data.sort(key=lambda x: x["年使用率(%)"], reverse=True)
-    return kpi_data 
+    Returns:
+        DataFrame: 指标表，附带不显示的年使用率颜色分档列 usage_band
+    """
+    if kpi_frame is None:
+        month = month or 12
+        kpi_frame = build_portfolio_store(all_data).kpi_frame(month)
+    money_scale = kpi_frame.attrs.get('money_scale', 1)
+    kpi_df = pd.DataFrame({
+        "项目": kpi_frame['project'],
+        "年累计目标(万元)": np.round(to_wan(kpi_frame['year_target'], money_scale), 2),
+        "年累计已发生(万元)": np.round(to_wan(kpi_frame['year_actual'], money_scale), 2),
+        "年使用率(%)": kpi_frame['year_usage'],
+        "月累使用率(%)": kpi_frame['month_usage'],
+        "时间进度(%)": kpi_frame['time_progress'],
+        "usage_band": kpi_frame['usage_band']
+    })
+    
+    # 按年使用率从高到低排序（同值保持原顺序）
+    return kpi_df.sort_values("年使用率(%)", ascending=False, kind='stable').reset_index(drop=True)
 
 def create_multi_ring_progress_chart(data, month):
     """创建多环径向进度图，类似用户提供的例图样式"""
@@ -1955,6 +1995,7 @@ def create_echarts_style_donut_chart(data, title="项目进度概览"):
     
     return fig 
 
+@cached_figure(lambda data, month: (data.get('time_progress'), data.get('year_usage'), data.get('month_usage'), month))
 def create_three_donut_charts(data, month):
     """
     创建3个独立的甜甜圈图，分别显示时间进度、年使用率、月累使用率
@@ -2094,6 +2135,62 @@ def create_three_donut_charts(data, month):
     
     return charts 
 
+def slim_figure(fig):
+    """精简模式：去掉图表中嵌入的默认模板（Streamlit渲染时使用自身主题），环形数值保留两位小数
+
+    轨迹、注释和布局不变，只减小发送到浏览器的图表JSON。带月份帧的图表同样处理各帧的数值。
+    """
+    def round_values(traces):
+        for trace in traces:
+            if trace.type == 'pie' and trace.values is not None:
+                trace.values = [round(float(v), 2) for v in trace.values]
+
+    fig.layout.template = None
+    round_values(fig.data)
+    for frame in fig.frames:
+        round_values(frame.data)
+    return fig
+
+def _combine_donut_charts(charts):
+    """将 create_three_donut_charts 生成的3个图表合并为一个图表：每个环占一个 pie 域，标题和中心文本改为注释"""
+    fig = go.Figure()
+    annotations = []
+    for idx, chart in enumerate(charts):
+        x0, x1 = idx / 3, (idx + 1) / 3
+        center_x = round((x0 + x1) / 2, 4)
+        pie = chart.data[0]
+        pie.domain = dict(x=[round(x0 + 0.02, 4), round(x1 - 0.02, 4)], y=[0, 0.85])
+        fig.add_trace(pie)
+        
+        # 中心文本位于pie域的中心
+        center = chart.layout.annotations[0].to_plotly_json()
+        center.update(x=center_x, y=0.425)
+        annotations.append(center)
+        # 原来的图表标题
+        annotations.append(dict(
+            x=center_x, y=1.0, xref='paper', yref='paper', yanchor='bottom',
+            text=chart.layout.title.text, showarrow=False, font=chart.layout.title.font.to_plotly_json()
+        ))
+    
+    fig.update_layout(
+        annotations=annotations,
+        height=300,
+        margin=dict(l=20, r=20, t=50, b=20),
+        showlegend=False,
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        font=dict(family='SF Pro Display, -apple-system, BlinkMacSystemFont, sans-serif')
+    )
+    return fig
+
+@cached_figure(lambda data, month: (data.get('time_progress'), data.get('year_usage'), data.get('month_usage'), month))
+def create_combined_donut_chart(data, month):
+    """
+    创建单个图表显示时间进度、年使用率、月累使用率三个甜甜圈环
+    与 create_three_donut_charts 样式一致，只需一次 st.plotly_chart 渲染
+    """
+    return _combine_donut_charts(create_three_donut_charts(data, month))
+
 # 暂时注释掉 Matplotlib 版本，避免导入问题
 # def create_three_donut_charts_matplotlib(data, month):
 #     """
@@ -2102,35 +2199,21 @@ def create_three_donut_charts(data, month):
 #     """
 #     pass
 
-def create_tertiary_exception_chart(all_data, month):
+def create_tertiary_exception_chart(all_data, month, exception_store=None):
     """
     创建三级费项异常项展示图
     显示所有项目的三级费项异常情况，包括年度目标为0的费项
+    
+    Args:
+        exception_store: 已构建的异常记录表，未传入时根据all_data构建
     """
     import plotly.graph_objects as go
-    import plotly.express as px
-    from collections import defaultdict
-    
-    # 收集所有异常数据
-    all_exceptions = []
-    red_count = 0
-    yellow_count = 0
-    
-    for project_name, data in all_data.items():
-        if 'tertiary_exceptions' in data:
-            for exception in data['tertiary_exceptions']:
-                # 只统计到当前选择月份的异常
-                if exception['month'] <= month:
-                    # 添加项目名称到异常记录
-                    exception_record = exception.copy()
-                    exception_record['project_name'] = project_name
-                    all_exceptions.append(exception_record)
-                    
-                    # 统计异常数量
-                    if exception['exception_type'] == 'red':
-                        red_count += 1
-                    elif exception['exception_type'] == 'yellow':
-                        yellow_count += 1
+    
+    if exception_store is None:
+        exception_store = build_exception_store(all_data)
+    
+    # 直接读取截至当前月份的前缀计数
+    red_count, yellow_count = exception_store.type_counts('tertiary', month)
     
     total_exceptions = red_count + yellow_count
     
@@ -2209,65 +2292,44 @@ def create_tertiary_exception_chart(all_data, month):
     
     return fig
 
-def create_tertiary_exception_details_table(all_data, month):
+def create_tertiary_exception_details_table(all_data, month, exception_store=None):
     """
     创建三级费项异常详情表格
     按照用户要求：Excel 文件名 | 月份 | 费项名称 | 异常类型 | 已发生金额累计 | 目标金额累计
     包括年度目标为0的费项
+    
+    Args:
+        exception_store: 已构建的异常记录表，未传入时根据all_data构建
     """
     import plotly.graph_objects as go
     
-    # 收集所有异常数据
-    all_exceptions = []
-    
-    for project_name, data in all_data.items():
-        if 'tertiary_exceptions' in data:
-            for exception in data['tertiary_exceptions']:
-                # 只显示到当前选择月份的异常
-                if exception['month'] <= month:
-                    # 添加项目名称到异常记录
-                    exception_record = exception.copy()
-                    exception_record['project_name'] = project_name
-                    all_exceptions.append(exception_record)
+    if exception_store is None:
+        exception_store = build_exception_store(all_data)
     
-    # 合并所有数据
-    all_items = all_exceptions
+    # 异常记录表已按月份升序排列，截至当前月份的明细是一段连续切片
+    records = exception_store.records('tertiary', month)
     
-    if not all_items:
+    if records.empty:
         return None, None  # 返回None表示没有数据，第二个None是DataFrame
     
-    # 按月份升序排序
-    all_items.sort(key=lambda x: x.get('month', 0))
-    
-    # 创建表格数据
-    table_data = []
-    for item in all_items:
-        exception_type_text = "超年度目标" if item['exception_type'] == 'red' else "超月度目标"
-        
-        table_data.append([
-            item['project_name'],  # Excel 文件名
-            f"{item.get('month', 'N/A')}月" if item.get('month') else "N/A",  # 月份
-            item['fee_name'],      # 费项名称
-            exception_type_text,   # 异常类型
-            f"{item['cum_actual']:.2f}",  # 已发生金额累计
-            f"{item['cum_target']:.2f}"   # 目标金额累计
-        ])
+    exception_type_text = np.where(records['exception_type'].to_numpy() == 'red', "超年度目标", "超月度目标")
+    month_text = np.where(records['month'].to_numpy() > 0, records['month'].astype(str) + "月", "N/A")
     
     # 创建DataFrame用于下载
-    df_data = []
-    for item in all_items:
-        exception_type_text = "超年度目标" if item['exception_type'] == 'red' else "超月度目标"
-        
-        df_data.append({
-            'Excel 文件名': item['project_name'],
-            '月份': f"{item.get('month', 'N/A')}月" if item.get('month') else "N/A",
-            '费项名称': item['fee_name'],
-            '异常类型': exception_type_text,
-            '已发生金额累计': round(item['cum_actual'], 2),
-            '目标金额累计': round(item['cum_target'], 2)
-        })
-    
-    df = pd.DataFrame(df_data)
+    df = pd.DataFrame({
+        'Excel 文件名': records['project_name'].to_numpy(),
+        '月份': month_text,
+        '费项名称': records['fee_name'].to_numpy(),
+        '异常类型': exception_type_text,
+        '已发生金额累计': records['cum_actual'].round(2).to_numpy(),
+        '目标金额累计': records['cum_target'].round(2).to_numpy()
+    })
+    
+    table_data = [
+        df['Excel 文件名'].tolist(), df['月份'].tolist(), df['费项名称'].tolist(), df['异常类型'].tolist(),
+        [f"{v:.2f}" for v in records['cum_actual']],  # 已发生金额累计
+        [f"{v:.2f}" for v in records['cum_target']]   # 目标金额累计
+    ]
     
     # 创建表格
     fig = go.Figure(data=[go.Table(
@@ -2278,7 +2340,7 @@ def create_tertiary_exception_details_table(all_data, month):
             align='left'
         ),
         cells=dict(
-            values=list(zip(*table_data)),
+            values=table_data,
             fill_color='white',
             font=dict(color='#1D1D1F', size=11),
             align='left',
@@ -2299,6 +2361,8 @@ def create_tertiary_exception_details_table(all_data, month):
     
     return fig, df
 
+@cached_figure(lambda secondary_fee_data, selected_fee_name: (
+    [item for item in secondary_fee_data if item.get('name') == selected_fee_name], selected_fee_name))
 def create_secondary_fee_combined_chart(secondary_fee_data, selected_fee_name):
     """创建二级费项组合图表：柱状图显示单月数据，折线图显示累计数据（合并为一张图表）
     
@@ -2436,4 +2500,179 @@ def create_secondary_fee_combined_chart(secondary_fee_data, selected_fee_name):
         )
     )
 
-    return fig
\ No newline at end of file
+    return fig
+
+# ====== 浏览器端切换月份：1-12月的数据一次性写入图表帧，滑块在浏览器中切换 ======
+
+# 切换到某一帧时立即重绘，不做过渡动画
+_MONTH_FRAME_ANIMATION = dict(mode='immediate', frame=dict(duration=0, redraw=True), transition=dict(duration=0))
+
+def _add_month_frames(fig, frames, month):
+    """为图表添加1-12月的帧和月份滑块，滑块初始位置为所选月份"""
+    fig.frames = frames
+    fig.update_layout(sliders=[dict(
+        active=int(month) - 1,
+        currentvalue=dict(prefix='月份: ', suffix='月', font=dict(size=12)),
+        pad=dict(t=30, b=0),
+        len=1.0,
+        x=0,
+        steps=[dict(label=str(m), method='animate', args=[[str(m)], _MONTH_FRAME_ANIMATION])
+               for m in range(1, 13)]
+    )])
+    return fig
+
+def month_progress_metrics(data):
+    """根据1-12月累计值计算每个月的时间进度、年使用率和月累使用率（与 process_excel_data 口径一致）"""
+    cum_target = np.zeros(12)
+    cum_actual = np.zeros(12)
+    target = np.asarray(data.get('cum_target') or [], dtype=float)[:12]
+    actual = np.asarray(data.get('cum_actual') or [], dtype=float)[:12]
+    cum_target[:len(target)] = target
+    cum_actual[:len(actual)] = actual
+    year_target = cum_target[-1]
+    
+    metrics = []
+    for m in range(1, 13):
+        metrics.append({
+            'time_progress': round(100 * m / 12, 2),
+            'year_usage': round(100 * cum_actual[m-1] / year_target, 2) if year_target else 0,
+            'month_usage': round(100 * cum_actual[m-1] / cum_target[m-1], 2) if cum_target[m-1] else 0
+        })
+    return metrics
+
+@cached_figure(lambda data, month: (data.get('cum_target'), data.get('cum_actual'), month))
+def create_three_donut_charts_by_month(data, month):
+    """创建带1-12月帧的3个甜甜圈图，拖动图表下方的滑块即可切换月份"""
+    month = int(''.join(filter(str.isdigit, month)) or 1) if isinstance(month, str) else int(month)
+    monthly_charts = [create_three_donut_charts(metrics, m) for m, metrics in enumerate(month_progress_metrics(data), 1)]
+    
+    charts = []
+    for idx in range(3):
+        fig = go.Figure(monthly_charts[month - 1][idx])
+        # 帧中只写入随月份变化的属性：环形数值、颜色和中心文本
+        frames = []
+        for m, month_charts in enumerate(monthly_charts, 1):
+            pie = month_charts[idx].data[0]
+            frames.append(go.Frame(
+                name=str(m),
+                data=[dict(type='pie', values=list(pie.values), marker=dict(colors=list(pie.marker.colors)))],
+                layout=dict(annotations=month_charts[idx].layout.annotations)
+            ))
+        _add_month_frames(fig, frames, month)
+        fig.update_layout(height=350, margin=dict(l=20, r=20, t=60, b=70))
+        charts.append(fig)
+    return charts
+
+@cached_figure(lambda data, month: (data.get('cum_target'), data.get('cum_actual'), month))
+def create_combined_donut_chart_by_month(data, month):
+    """创建带1-12月帧的合并甜甜圈图，三个环共用一个月份滑块"""
+    month = int(''.join(filter(str.isdigit, month)) or 1) if isinstance(month, str) else int(month)
+    monthly_figs = [create_combined_donut_chart(metrics, m) for m, metrics in enumerate(month_progress_metrics(data), 1)]
+    
+    fig = go.Figure(monthly_figs[month - 1])
+    frames = [go.Frame(
+        name=str(m),
+        data=[dict(type='pie', values=list(pie.values), marker=dict(colors=list(pie.marker.colors))) for pie in month_fig.data],
+        layout=dict(annotations=month_fig.layout.annotations)
+    ) for m, month_fig in enumerate(monthly_figs, 1)]
+    _add_month_frames(fig, frames, month)
+    fig.update_layout(height=370, margin=dict(l=20, r=20, t=50, b=70))
+    return fig
+
+@cached_figure(lambda data, month: (data.get('fee_series'), data.get('fee_items'), month))
+def create_bar_chart_by_month(data, month):
+    """创建带1-12月帧的二级费项累计对比柱状图，旧缓存中没有 fee_series 时退回单月图表"""
+    series = data.get('fee_series') or {}
+    if not series.get('names'):
+        return create_bar_chart(data)
+    
+    cum_target = np.asarray(series['cum_target'], dtype=float)
+    cum_actual = np.asarray(series['cum_actual'], dtype=float)
+    month = int(month)
+    fig = create_bar_chart({'fee_items': [
+        {'name': name, 'cum_target': float(cum_target[i, month - 1]), 'cum_actual': float(cum_actual[i, month - 1])}
+        for i, name in enumerate(series['names'])
+    ]})
+    if fig is None:
+        return None
+    
+    frames = [go.Frame(name=str(m), data=[dict(type='bar', y=cum_target[:, m - 1].tolist()),
+                                          dict(type='bar', y=cum_actual[:, m - 1].tolist())])
+              for m in range(1, 13)]
+    _add_month_frames(fig, frames, month)
+    # 帧切换时坐标轴不会重新自适应，固定为全年最大值
+    y_max = max(float(cum_target.max(initial=0)), float(cum_actual.max(initial=0)))
+    fig.update_layout(height=380, margin=dict(b=110), yaxis_range=[0, y_max * 1.1 if y_max > 0 else 1])
+    return fig
+
+@cached_figure(lambda data, month: (data.get('cum_target'), data.get('cum_actual'), month))
+def create_line_chart_by_month(data, month):
+    """创建带1-12月帧的累计趋势折线图，滑块移动当前月份标记线"""
+    fig = create_line_chart(data)
+    month = int(month)
+    
+    def month_marker(m):
+        return [dict(type='line', xref='x', yref='paper', x0=m, x1=m, y0=0, y1=1,
+                     line=dict(color='#8E8E93', width=1, dash='dash'))]
+    
+    frames = [go.Frame(name=str(m), layout=dict(shapes=month_marker(m))) for m in range(1, 13)]
+    fig.update_layout(shapes=month_marker(month))
+    _add_month_frames(fig, frames, month)
+    fig.update_layout(height=380, margin=dict(b=110))
+    return fig
+
+@cached_figure()
+def create_exception_pie_by_month(type_counts, month, title):
+    """创建带1-12月帧的红/黄异常饼图
+    
+    Args:
+        type_counts: (2, 13) 的 [红色, 黄色] 全年前缀计数，见 year_type_counts
+        title: 标题前缀，如 '主控费项异常统计'
+    """
+    type_counts = np.asarray(type_counts, dtype=np.int64)
+    month = int(month)
+    
+    def month_layout(m):
+        empty = int(type_counts[:, m].sum()) == 0
+        return dict(
+            title=dict(text=f'{title} (第{m}月)'),
+            annotations=[dict(x=0.5, y=0.5, xref='paper', yref='paper', showarrow=False,
+                              text='无异常' if empty else '', font=dict(size=16, color='#34C759'))]
+        )
+    
+    fig = go.Figure(go.Pie(
+        labels=['红色异常', '黄色异常'],
+        values=type_counts[:, month].tolist(),
+        hole=0.5,
+        marker_colors=['#ef4444', '#f59e0b'],
+        textinfo='label+value',
+        textposition='inside',
+        textfont=dict(size=12, color='white'),
+        sort=False
+    ))
+    fig.update_layout(
+        title={
+            'x': 0.5,
+            'xanchor': 'center',
+            'font': {'size': 18, 'color': '#1D1D1F'}
+        },
+        plot_bgcolor='white',
+        paper_bgcolor='white',
+        font=dict(family="SF Pro Display, -apple-system, BlinkMacSystemFont, sans-serif"),
+        height=460,
+        margin=dict(b=100),
+        showlegend=True,
+        legend=dict(
+            orientation="v",  # 垂直布局
+            yanchor="top",
+            y=1,
+            xanchor="left",
+            x=0,  # 图例放在左边
+            itemsizing='constant'
+        )
+    )
+    fig.update_layout(month_layout(month))
+    
+    frames = [go.Frame(name=str(m), data=[dict(type='pie', values=type_counts[:, m].tolist())], layout=month_layout(m))
+              for m in range(1, 13)]
+    return _add_month_frames(fig, frames, month)
@@ -1,14 +1,17 @@
 import pandas as pd
 import numpy as np
-import streamlit as st
 from pathlib import Path
 import os
 from io import BytesIO
 import time
 import hashlib
-from utils.cache_manager import get_cache_manager
+from utils import diagnostics
+from utils.cache_manager import get_cache_manager, fingerprint_frame
+from utils.portfolio_aggregator import get_portfolio_aggregator, get_labor_aggregator
+from utils.numeric_parser import to_float_array, to_float_matrix, to_cents, CENTS_PER_YUAN
+from utils.exception_store import exception_prefix_counts
 
-def extract_table_from_excel(file, include_self_owned_labor=False):
+def extract_table_from_excel(file, include_self_owned_labor=False, use_cache=True):
     """从Excel文件中提取工作表的数据:
     1. 主要费项费项月累成本使用情况(前39行) - 根据include_self_owned_labor参数选择4或4-1开头的工作表
     2. 三级费项月累表格(前153行)
@@ -19,12 +22,13 @@ def extract_table_from_excel(file, include_self_owned_labor=False):
         include_self_owned_labor: 是否包含自有人工成本
             - True: 使用"4主要费项费项月累成本使用情况" (包含自有人工成本)
             - False: 使用"4-1主要费项费项月累成本使用情况" (不包含自有人工成本)
+        use_cache: 是否读写提取缓存；多进程批量处理时由主进程统一写入缓存
     """
     # 获取缓存管理器
     cache_manager = get_cache_manager()
     
     # 如果是文件路径，先尝试从缓存获取
-    if isinstance(file, str) or isinstance(file, Path):
+    if use_cache and (isinstance(file, str) or isinstance(file, Path)):
         file_path = str(file)
         cached_data = cache_manager.get_cached_data(file_path, include_self_owned_labor)
         if cached_data:
@@ -46,7 +50,7 @@ def extract_table_from_excel(file, include_self_owned_labor=False):
                 # 使用BytesIO包装bytes，避免FutureWarning
                 xl = pd.ExcelFile(BytesIO(file_bytes))
             else:
-                st.error(f"不支持的文件对象类型: {type(file)}")
+                diagnostics.error(f"不支持的文件对象类型: {type(file)}")
                 return None, None
             
         # 根据参数选择主要费项工作表
@@ -104,8 +108,8 @@ def extract_table_from_excel(file, include_self_owned_labor=False):
         
         if main_df is None:
             sheet_type = "包含自有人工成本" if include_self_owned_labor else "不包含自有人工成本"
-            st.error(f"文件中未找到{sheet_type}的主要费项工作表，尝试了: {', '.join(main_sheets_to_try)}")
-            st.error(f"文件中实际存在的工作表: {', '.join(xl.sheet_names)}")
+            diagnostics.error(f"文件中未找到{sheet_type}的主要费项工作表，尝试了: {', '.join(main_sheets_to_try)}")
+            diagnostics.error(f"文件中实际存在的工作表: {', '.join(xl.sheet_names)}")
             return None, None
         
         tertiary_df = None
@@ -115,18 +119,18 @@ def extract_table_from_excel(file, include_self_owned_labor=False):
                 break
         
         if tertiary_df is None:
-            st.error(f"文件中未找到三级费项工作表，尝试了: {', '.join(tertiary_sheets_to_try)}")
-            st.error(f"文件中实际存在的工作表: {', '.join(xl.sheet_names)}")
+            diagnostics.error(f"文件中未找到三级费项工作表，尝试了: {', '.join(tertiary_sheets_to_try)}")
+            diagnostics.error(f"文件中实际存在的工作表: {', '.join(xl.sheet_names)}")
             return None, None
         
         # 如果是文件路径，保存到缓存
-        if isinstance(file, str) or isinstance(file, Path):
+        if use_cache and (isinstance(file, str) or isinstance(file, Path)):
             file_path = str(file)
             cache_manager.save_cached_data(file_path, include_self_owned_labor, main_df, tertiary_df)
         
         return main_df, tertiary_df
     except Exception as e:
-        st.error(f"处理文件时出错: {str(e)}")
+        diagnostics.error(f"处理文件时出错: {str(e)}")
         return None, None
 
 def get_excel_files(data_dir):
@@ -195,7 +199,8 @@ def process_excel_data(df, month, project_name=None, include_self_owned_labor=Fa
     if project_name:
         cache_manager = get_cache_manager()
         cached_data = cache_manager.get_project_analysis_cache(project_name, month, include_self_owned_labor)
-        if cached_data:
+        # 旧版本的缓存没有全年异常计数，视为未命中并重新计算
+        if cached_data and 'year_exception_counts' in cached_data:
             return cached_data
     
     try:
@@ -233,43 +238,15 @@ def process_excel_data(df, month, project_name=None, include_self_owned_labor=Fa
                         elif "已发生金额" in second_col:
                             item['actual_row'] = idx
         
-        # 提取总成本数据
+        # 提取总成本数据（1-12月数值块整体转换一次）
         if total_target_row is not None and total_actual_row is not None:
-            total_target_data = df.iloc[total_target_row, 2:14].values  # 1-12月
-            total_actual_data = df.iloc[total_actual_row, 2:14].values  # 1-12月
+            numeric_block = to_float_matrix(df.iloc[:, 2:14], width=12)
+            total_target_data = numeric_block[total_target_row]  # 1-12月
+            total_actual_data = numeric_block[total_actual_row]  # 1-12月
         else:
-            st.error("未找到总成本数据行")
+            diagnostics.error("未找到总成本数据行")
             return None
         
-        # 安全地转换数据为数值类型
-        def safe_convert_to_float(data):
-            """安全地将数据转换为浮点数，处理字符串和无效值"""
-            converted_data = []
-            for item in data:
-                if pd.isna(item):
-                    converted_data.append(0.0)
-                elif isinstance(item, str):
-                    # 处理字符串，提取数字部分
-                    import re
-                    number_match = re.search(r'([+-]?\d*\.?\d+)', str(item))
-                    if number_match:
-                        try:
-                            converted_data.append(float(number_match.group(1)))
-                        except ValueError:
-                            converted_data.append(0.0)
-                    else:
-                        converted_data.append(0.0)
-                else:
-                    try:
-                        converted_data.append(float(item))
-                    except (ValueError, TypeError):
-                        converted_data.append(0.0)
-            return np.array(converted_data)
-        
-        # 转换总成本数据
-        total_target_data = safe_convert_to_float(total_target_data)
-        total_actual_data = safe_convert_to_float(total_actual_data)
-        
         # 根据新要求修改计算逻辑：
         # 1. 累计总目标成本 = 原始表格 总成本 月累总目标成本
         # 2. 累计总已发生成本 = 原始表格 总成本 月累已发生成本
@@ -303,14 +280,13 @@ def process_excel_data(df, month, project_name=None, include_self_owned_labor=Fa
         # 处理二级费项数据和异常项
         processed_fee_items = []
         exceptions = []
+        # 全年（不受所选月份限制）的异常和各费项1-12月累计值，供浏览器端切换月份使用
+        year_exceptions = []
+        fee_series = {'names': [], 'cum_target': [], 'cum_actual': []}
         for item in fee_items:
             if item['target_row'] is not None and item['actual_row'] is not None:
-                target_data = df.iloc[item['target_row'], 2:14].values
-                actual_data = df.iloc[item['actual_row'], 2:14].values
-                
-                # 安全转换数据
-                target_data = safe_convert_to_float(target_data)
-                actual_data = safe_convert_to_float(actual_data)
+                target_data = numeric_block[item['target_row']]
+                actual_data = numeric_block[item['actual_row']]
                 
                 # 计算累计值
                 cum_target_item = np.cumsum(target_data)
@@ -325,6 +301,9 @@ def process_excel_data(df, month, project_name=None, include_self_owned_labor=Fa
                     'cum_target': current_cum_target,
                     'cum_actual': current_cum_actual
                 })
+                fee_series['names'].append(item['name'])
+                fee_series['cum_target'].append(cum_target_item.tolist())
+                fee_series['cum_actual'].append(cum_actual_item.tolist())
                 
                 # 异常项检测
                 # 12月份的目标金额累计
@@ -341,15 +320,18 @@ def process_excel_data(df, month, project_name=None, include_self_owned_labor=Fa
                     elif month_cum_actual > month_cum_target:
                         exception_type = 'yellow'
                     
-                    if exception_type and m <= month:  # 只检查到当前选择的月份
-                        exceptions.append({
+                    if exception_type:
+                        exception = {
                             'fee_name': item['name'],
                             'month': m,
                             'exception_type': exception_type,
                             'cum_actual': float(month_cum_actual),
                             'cum_target': float(month_cum_target),
                             'year_target': float(year_target_item)
-                        })
+                        }
+                        year_exceptions.append(exception)
+                        if m <= month:  # 只检查到当前选择的月份
+                            exceptions.append(exception)
         
         result = {
             'total_target': float(total_target_data.sum()),
@@ -361,7 +343,12 @@ def process_excel_data(df, month, project_name=None, include_self_owned_labor=Fa
             'month_usage': month_usage,
             'time_progress': time_progress,
             'fee_items': processed_fee_items,
-            'exceptions': exceptions
+            'fee_series': fee_series,
+            'exceptions': exceptions,
+            # 1-12月异常前缀计数，排行榜直接读取
+            'exception_counts': exception_prefix_counts(exceptions),
+            # 全年异常的前缀计数，不受所选月份限制
+            'year_exception_counts': exception_prefix_counts(year_exceptions)
         }
         
         # 保存到缓存
@@ -372,7 +359,7 @@ def process_excel_data(df, month, project_name=None, include_self_owned_labor=Fa
         return result
         
     except Exception as e:
-        st.error(f"处理Excel文件时出错: {e}")
+        diagnostics.error(f"处理Excel文件时出错: {e}")
         return None
 
 def load_and_process_files(uploaded_files, selected_files, data_dir, output_dir, month, include_self_owned_labor=False):
@@ -409,7 +396,7 @@ def load_and_process_files(uploaded_files, selected_files, data_dir, output_dir,
                 # 直接从上传文件中提取数据
                 main_df, tertiary_df = extract_table_from_excel(uploaded_file, include_self_owned_labor)
                 if main_df is None or tertiary_df is None:
-                    st.warning(f"无法从文件 {uploaded_file.name} 中提取有效数据")
+                    diagnostics.warning(f"无法从文件 {uploaded_file.name} 中提取有效数据")
                     continue
 
                 # 保存提取后的数据到唯一文件名
@@ -440,13 +427,13 @@ def load_and_process_files(uploaded_files, selected_files, data_dir, output_dir,
                     if data and 'tertiary_fee_items' in data:
                         pd.DataFrame(data['tertiary_fee_items']).to_excel(writer, sheet_name='三级费项分析', index=False)
 
-                st.success(f"成功处理文件: {uploaded_file.name}")
+                diagnostics.success(f"成功处理文件: {uploaded_file.name}")
             except Exception as e:
-                st.error(f"处理上传文件 {uploaded_file.name} 时出错: {e}")
+                diagnostics.error(f"处理上传文件 {uploaded_file.name} 时出错: {e}")
     
     # 处理选中的文件（从data目录读取原始文件，然后处理）
     if selected_files:
-        st.write(f"**正在处理选中的 {len(selected_files)} 个文件...**")
+        diagnostics.info(f"正在处理选中的 {len(selected_files)} 个文件...")
         for filename in selected_files:
             try:
                 # 检查是否是已处理的文件（包含"主要费项"或"三级费项"的文件）
@@ -458,7 +445,7 @@ def load_and_process_files(uploaded_files, selected_files, data_dir, output_dir,
                 file_path = data_dir / filename
                 main_df, tertiary_df = extract_table_from_excel(file_path, include_self_owned_labor)
                 if main_df is None or tertiary_df is None:
-                    st.warning(f"无法从文件 {filename} 中提取有效数据")
+                    diagnostics.warning(f"无法从文件 {filename} 中提取有效数据")
                     continue
                 
                 project_name = filename.replace('.xlsx', '')
@@ -483,9 +470,9 @@ def load_and_process_files(uploaded_files, selected_files, data_dir, output_dir,
                     if data and 'tertiary_fee_items' in data:
                         pd.DataFrame(data['tertiary_fee_items']).to_excel(writer, sheet_name='三级费项分析', index=False)
                 
-                st.success(f"成功处理文件: {filename}")
+                diagnostics.success(f"成功处理文件: {filename}")
             except Exception as e:
-                st.error(f"处理文件 {filename} 时出错: {e}")
+                diagnostics.error(f"处理文件 {filename} 时出错: {e}")
     
     return all_data, all_main_dfs, all_tertiary_dfs
 
@@ -520,39 +507,83 @@ def create_tertiary_exception_table(all_data):
     
     return None
 
+def _row_labels(df):
+    """生成按前两列（费项名称、数据类型）对齐的行标签，同名重复行追加序号区分"""
+    seen = {}
+    labels = []
+    for first, second in zip(df.iloc[:, 0], df.iloc[:, 1]):
+        key = (str(first).strip() if pd.notna(first) else "",
+               str(second).strip() if pd.notna(second) else "")
+        occurrence = seen.get(key, 0)
+        seen[key] = occurrence + 1
+        labels.append(key + (occurrence,))
+    return labels
+
+# 项目数值块缓存：(内容指纹, 是否定点) -> (指纹, 行标签, 1-12月数值矩阵)
+_project_block_cache = {}
+_PROJECT_BLOCK_CACHE_SIZE = 512
+
+def get_project_block(df, fixed_point=False):
+    """提取项目表格的数值块 (内容指纹, 行标签列表, rows x 12 的数值矩阵)，按内容指纹缓存
+
+    Args:
+        fixed_point: 为True时矩阵为int64的分，否则为float64的元
+    """
+    fingerprint = fingerprint_frame(df)
+    cache_key = (fingerprint, fixed_point)
+    block = _project_block_cache.get(cache_key)
+    if block is None:
+        matrix = to_float_matrix(df.iloc[:, 2:14], width=12)
+        block = (fingerprint, _row_labels(df), to_cents(matrix) if fixed_point else matrix)
+        if len(_project_block_cache) >= _PROJECT_BLOCK_CACHE_SIZE:
+            _project_block_cache.pop(next(iter(_project_block_cache)))
+        _project_block_cache[cache_key] = block
+    return block
+
+def _block_to_frame(labels, matrix, template_df):
+    """根据行标签和汇总矩阵重建与模板表结构一致的汇总DataFrame"""
+    columns = list(template_df.columns)
+    month_columns = columns[2:14]
+    summary_df = pd.DataFrame(matrix[:, :len(month_columns)], columns=month_columns)
+    summary_df.insert(0, columns[0], [label[0] if label[0] else np.nan for label in labels])
+    summary_df.insert(1, columns[1], [label[1] if label[1] else np.nan for label in labels])
+    # 1-12月之后的列（如项目名称列）统一设置为"汇总"
+    for col in columns[14:]:
+        summary_df[col] = "汇总"
+    return summary_df
+
 def create_summary_excel(all_dfs):
-    """创建真正的汇总Excel表 - 将所有项目的对应行列数据相加，生成汇总表"""
+    """创建真正的汇总Excel表 - 将所有项目的对应行列数据相加，生成汇总表
+
+    每个项目的1-12月数值块只转换一次为float64矩阵，按前两列标签对齐后
+    一次性 np.sum(axis=0) 求和，行数不一致的项目也能正确累加。
+    """
     if not all_dfs:
         return None
     
-    # 获取第一个DataFrame作为模板
-    first_df = list(all_dfs.values())[0]
-    
-    # 创建新的汇总DataFrame，保持相同的结构
-    summary_df = first_df.copy()
-    
-    # 初始化汇总数据为0
-    for col in summary_df.columns:
-        if col not in [summary_df.columns[0], summary_df.columns[1]]:  # 跳过前两列（费项名称和类型）
-            summary_df[col] = 0
+    frames = [df for df in all_dfs.values() if df is not None]
+    if not frames:
+        return None
     
-    # 将所有DataFrame的数值列相加
-    for project_name, df in all_dfs.items():
-        for col in df.columns:
-            if col not in [df.columns[0], df.columns[1]]:  # 跳过前两列
-                # 确保数据类型为数值型
-                numeric_data = pd.to_numeric(df[col], errors='coerce').fillna(0)
-                summary_df[col] += numeric_data
+    blocks = [get_project_block(df) for df in frames]
     
-    # 修改最后一列（项目名称列），统一设置为"汇总"
-    if len(summary_df.columns) > 2:  # 确保有足够的列
-        last_col_name = summary_df.columns[-1]
-        summary_df[last_col_name] = "汇总"
+    # 合并所有项目的行标签，保持首次出现的顺序（跳过费项名称和数据类型都为空的空白行）
+    row_index = {}
+    for _, labels, _ in blocks:
+        for label in labels:
+            if (label[0] or label[1]) and label not in row_index:
+                row_index[label] = len(row_index)
     
-    # 确保所有行的项目名称都是"汇总"
-    summary_df.iloc[:, -1] = "汇总"
+    # 按标签把各项目的数值块放入对齐后的三维数组，再一次性求和
+    aligned = np.zeros((len(blocks), len(row_index), 12), dtype=float)
+    for i, (_, labels, matrix) in enumerate(blocks):
+        keep = np.fromiter((label in row_index for label in labels), dtype=bool, count=len(labels))
+        rows = np.fromiter((row_index[label] for label in labels if label in row_index), dtype=np.int64)
+        aligned[i, rows] = matrix[keep]
+    summary_matrix = np.sum(aligned, axis=0)
     
-    return summary_df
+    # 以第一个DataFrame为模板，一次性重建汇总表
+    return _block_to_frame(list(row_index), summary_matrix, frames[0])
 
 def process_tertiary_fee_data(df, month, project_name=None, include_self_owned_labor=False):
     """处理三级费项数据并检测异常，支持缓存"""
@@ -563,12 +594,14 @@ def process_tertiary_fee_data(df, month, project_name=None, include_self_owned_l
     if project_name:
         cache_manager = get_cache_manager()
         cached_data = cache_manager.get_anomaly_cache(project_name, month, include_self_owned_labor)
-        if cached_data:
+        # 旧版本的缓存没有全年异常计数，视为未命中并重新计算
+        if cached_data and 'year_exception_counts' in cached_data:
             return cached_data
     
     try:
         tertiary_fee_items = []
         exceptions = []
+        year_exceptions = []
         
         # 动态检测列索引，避免硬编码导致的问题
         max_columns = df.shape[1]
@@ -576,7 +609,7 @@ def process_tertiary_fee_data(df, month, project_name=None, include_self_owned_l
         # 根据实际表格结构：数据列从第3列开始（索引2），对应1-12月
         min_required_columns = 14  # 至少需要14列（费项编码 + 数据类型 + 12个月数据）
         if max_columns < min_required_columns:
-            st.error(f"三级费项表格列数不足，仅找到{max_columns}列，需要至少{min_required_columns}列")
+            diagnostics.error(f"三级费项表格列数不足，仅找到{max_columns}列，需要至少{min_required_columns}列")
             return {'tertiary_fee_items': [], 'exceptions': []}
         
         # 数据列范围：第3列到第14列（索引2-13），对应1-12月
@@ -585,11 +618,14 @@ def process_tertiary_fee_data(df, month, project_name=None, include_self_owned_l
         # 用于存储每个费项的4行数据
         fee_data = {}
         
+        # 1-12月数值块整体转换一次
+        numeric_block = to_float_matrix(df.iloc[:, data_columns])
+        
         # 第一遍扫描：收集每个费项的所有数据
         current_fee_code = None
         current_fee_data = {}
         
-        for idx, row in df.iterrows():
+        for position, (idx, row) in enumerate(df.iterrows()):
             # 第一列是费项编码
             fee_code = str(row.iloc[0]).strip()
             
@@ -606,17 +642,7 @@ def process_tertiary_fee_data(df, month, project_name=None, include_self_owned_l
                 second_col = str(row.iloc[1]).strip()
                 
                 # 提取该行的数据
-                row_data = []
-                for col in data_columns:
-                    try:
-                        cell_value = row.iloc[col]
-                        if isinstance(cell_value, str) and ('已发生金额' in cell_value or '目标金额' in cell_value):
-                            val = 0
-                        else:
-                            val = float(cell_value) if pd.notna(cell_value) else 0
-                        row_data.append(val)
-                    except ValueError:
-                        row_data.append(0)
+                row_data = numeric_block[position].tolist()
                 
                 # 根据第二列内容确定数据类型
                 if '已发生金额' in second_col and '累计' not in second_col:
@@ -688,8 +714,8 @@ def process_tertiary_fee_data(df, month, project_name=None, include_self_owned_l
                     }
                 })
                 
-                # 异常检测 - 检查到当前选择的月份
-                for m in range(1, month+1):
+                # 异常检测 - 检查全年，异常列表只保留到当前选择的月份
+                for m in range(1, 13):
                     # 确保索引在有效范围内
                     if m-1 >= len(cum_target) or m-1 >= len(cum_actual):
                         continue
@@ -706,7 +732,7 @@ def process_tertiary_fee_data(df, month, project_name=None, include_self_owned_l
                         exception_type = 'yellow'
                     
                     if exception_type:
-                        exceptions.append({
+                        exception = {
                             'fee_code': fee_code,
                             'fee_name': fee_name,
                             'month': m,
@@ -714,16 +740,21 @@ def process_tertiary_fee_data(df, month, project_name=None, include_self_owned_l
                             'cum_actual': m_actual,
                             'cum_target': m_target,
                             'year_target': year_target
-                        })
+                        }
+                        year_exceptions.append(exception)
+                        if m <= month:
+                            exceptions.append(exception)
                         
             except Exception as e:
-                st.warning(f"处理三级费项 {fee_code} 时出错: {e}")
+                diagnostics.warning(f"处理三级费项 {fee_code} 时出错: {e}")
                 continue
         
         # 添加异常信息到返回结果
         result = {
             'tertiary_fee_items': tertiary_fee_items,
-            'exceptions': exceptions
+            'exceptions': exceptions,
+            'exception_counts': exception_prefix_counts(exceptions),
+            'year_exception_counts': exception_prefix_counts(year_exceptions)
         }
         
         # 保存到缓存
@@ -733,25 +764,54 @@ def process_tertiary_fee_data(df, month, project_name=None, include_self_owned_l
         
         return result
     except Exception as e:
-        st.error(f"处理三级费项数据时出错: {e}")
+        diagnostics.error(f"处理三级费项数据时出错: {e}")
         return {'tertiary_fee_items': [], 'exceptions': []}
 
-def merge_project_data(all_data, all_main_dfs, month, include_self_owned_labor=False):
-    """合并多个项目的数据并计算合并后的关键指标，支持缓存"""
+def analyze_project(main_df, tertiary_df, month, project_name=None, include_self_owned_labor=False):
+    """分析单个项目：主要费项指标加上三级费项明细和异常，两部分都使用分析缓存
+
+    Returns:
+        dict: 项目分析结果，主要费项无法分析时返回None
+    """
+    data = process_excel_data(main_df, month, project_name, include_self_owned_labor)
+    if data and tertiary_df is not None:
+        tertiary_result = process_tertiary_fee_data(tertiary_df, month, project_name, include_self_owned_labor)
+        data['tertiary_fee_items'] = tertiary_result['tertiary_fee_items']
+        data['tertiary_exceptions'] = tertiary_result['exceptions']
+        if 'exception_counts' in tertiary_result:
+            data['tertiary_exception_counts'] = tertiary_result['exception_counts']
+        if 'year_exception_counts' in tertiary_result:
+            data['tertiary_year_exception_counts'] = tertiary_result['year_exception_counts']
+    return data
+
+def merge_project_data(all_data, all_main_dfs, month, include_self_owned_labor=False, fixed_point=False):
+    """合并多个项目的数据并计算合并后的关键指标，支持缓存
+
+    合并矩阵由增量汇总器维护：选择变化时只加上新增项目、减去移除项目。
+    fixed_point=True 时各项目金额先转换为int64的分再累加，合并结果与逐项目金额之和完全一致。
+    """
     if not all_data or not all_main_dfs:
         return None
     
-    # 尝试从缓存获取
+    blocks = {name: get_project_block(df, fixed_point) for name, df in all_main_dfs.items() if df is not None}
+    if not blocks:
+        return None
+    
+    # 尝试从缓存获取（项目名称、内容指纹和金额存储方式共同决定缓存键）
     cache_manager = get_cache_manager()
-    project_hash = hashlib.md5(str(sorted(all_data.keys())).encode()).hexdigest()
+    project_hash = hashlib.md5(str(sorted((name, block[0]) for name, block in blocks.items())).encode()).hexdigest()
+    if fixed_point:
+        project_hash = f"{project_hash}_fen"
     cached_data = cache_manager.get_project_analysis_cache(f"merged_{project_hash}", month, include_self_owned_labor)
     if cached_data:
         return cached_data
     
-    # 先合并原始Excel数据
-    merged_df = create_summary_excel(all_main_dfs)
-    if merged_df is None:
-        return None
+    # 增量合并原始Excel数据
+    labels, matrix = get_portfolio_aggregator(fixed_point).aggregate(blocks)
+    if fixed_point:
+        matrix = matrix / CENTS_PER_YUAN
+    template_df = next(df for df in all_main_dfs.values() if df is not None)
+    merged_df = _block_to_frame(labels, matrix, template_df)
     
     # 使用合并后的原始数据重新计算关键指标
     merged_data = process_excel_data(merged_df, month, f"merged_{project_hash}", include_self_owned_labor)
@@ -774,6 +834,9 @@ def create_monthly_fee_summary(all_dfs):
     monthly_data = {}
     
     for project_name, df in all_dfs.items():
+        # 1-12月数值块整体转换一次
+        numeric_block = to_float_matrix(df.iloc[:, 2:14], width=12)
+        
         # 查找二级费项数据
         for idx, row in df.iterrows():
             first_col = str(row.iloc[0]).strip()
@@ -790,7 +853,7 @@ def create_monthly_fee_summary(all_dfs):
             # 处理目标金额
             if "目标金额" in second_col and "累计" not in second_col:
                 fee_name = first_col
-                target_data = df.iloc[idx, 2:14].values  # 1-12月数据
+                target_data = numeric_block[idx]  # 1-12月数据
                 
                 # 查找对应的已发生金额行
                 actual_data = None
@@ -801,7 +864,7 @@ def create_monthly_fee_summary(all_dfs):
                     if (sub_fee_name == fee_name and 
                         "已发生金额" in sub_second_col and 
                         "累计" not in sub_second_col):
-                        actual_data = df.iloc[sub_idx, 2:14].values
+                        actual_data = numeric_block[sub_idx]
                         break
                 
                 if actual_data is not None:
@@ -811,14 +874,8 @@ def create_monthly_fee_summary(all_dfs):
                         if month_key not in monthly_data:
                             monthly_data[month_key] = {'target': 0, 'actual': 0}
                         
-                        # 转换为数字并累加
-                        try:
-                            target_val = float(target_data[month]) if pd.notna(target_data[month]) else 0
-                            actual_val = float(actual_data[month]) if pd.notna(actual_data[month]) else 0
-                            monthly_data[month_key]['target'] += target_val
-                            monthly_data[month_key]['actual'] += actual_val
-                        except Exception as e:
-                            continue
+                        monthly_data[month_key]['target'] += float(target_data[month])
+                        monthly_data[month_key]['actual'] += float(actual_data[month])
                 else:
                     pass  # 静默处理，不显示警告
     
@@ -850,6 +907,9 @@ def create_client_download_table(all_dfs, all_data):
         total_actual_data = None
         fee_items_data = []
         
+        # 1-12月数值块整体转换一次
+        numeric_block = to_float_matrix(df.iloc[:, 2:14], width=12)
+        
         # 查找总成本行
         for idx, row in df.iterrows():
             first_col = str(row.iloc[0]).strip()
@@ -857,9 +917,9 @@ def create_client_download_table(all_dfs, all_data):
             
             if "总成本" in first_col or "年总成本" in first_col:
                 if "月累总目标成本" in second_col:
-                    total_target_data = df.iloc[idx, 2:14].values  # 1-12月
+                    total_target_data = numeric_block[idx]  # 1-12月
                 elif "月累已发生成本" in second_col:
-                    total_actual_data = df.iloc[idx, 2:14].values  # 1-12月
+                    total_actual_data = numeric_block[idx]  # 1-12月
             
             # 查找二级费项 - 排除带有序号的行（如1.1.1）
             elif ("已发生金额" in second_col or "目标金额" in second_col) and "累计" not in second_col:
@@ -874,7 +934,7 @@ def create_client_download_table(all_dfs, all_data):
                     continue
                 
                 if "目标金额" in second_col:
-                    target_data = df.iloc[idx, 2:14].values
+                    target_data = numeric_block[idx]
                     # 查找对应的已发生金额行
                     for sub_idx, sub_row in df.iterrows():
                         sub_fee_name = str(sub_row.iloc[0]).strip()
@@ -884,7 +944,7 @@ def create_client_download_table(all_dfs, all_data):
                         if (sub_fee_name == fee_name and \
                             "已发生金额" in sub_second_col and \
                             "累计" not in sub_second_col):
-                            actual_data = df.iloc[sub_idx, 2:14].values
+                            actual_data = numeric_block[sub_idx]
                             fee_items_data.append({
                                 'name': fee_name,
                                 'target': target_data,
@@ -897,25 +957,18 @@ def create_client_download_table(all_dfs, all_data):
         monthly_actual_sum = np.zeros(12, dtype=float)
         
         for item in fee_items_data:
-            # 确保数据类型转换
-            target_data = np.array(item['target'], dtype=float)
-            monthly_target_sum += target_data
-            actual_data = np.array(item['actual'], dtype=float)
-            monthly_actual_sum += actual_data
+            monthly_target_sum += item['target']
+            monthly_actual_sum += item['actual']
         
         # 检查是否找到了总成本数据
         if total_target_data is None or total_actual_data is None:
             continue
             
-        # 计算累计数据
-        total_target_array = np.array(total_target_data, dtype=float)
-        total_actual_array = np.array(total_actual_data, dtype=float)
-        
         # 累加到总数据
         total_monthly_target_sum += monthly_target_sum
         total_monthly_actual_sum += monthly_actual_sum
-        total_total_target_array += total_target_array
-        total_total_actual_array += total_actual_array
+        total_total_target_array += total_target_data
+        total_total_actual_array += total_actual_data
     
     # 重置result_data，确保只包含汇总数据
     result_data = []
@@ -988,42 +1041,15 @@ def create_secondary_fee_overall_data(all_main_dfs, month=None, include_self_own
         project_hash = hashlib.md5(str(sorted(all_main_dfs.keys())).encode()).hexdigest()
         cached_data = cache_manager.get_secondary_fee_cache(f"combined_{project_hash}", month, include_self_owned_labor)
         if cached_data is not None:
-            print(f"二级费项数据从缓存加载成功，项目哈希: {project_hash}, 月份: {month}")
             return cached_data
-        else:
-            print(f"未找到二级费项缓存，项目哈希: {project_hash}, 月份: {month}")
     secondary_fee_data = {}
-
-    import re
-
-    def to_float_array(values):
-        """将任意序列安全转换为float数组，容错逗号、中文逗号、空格、破折号等"""
-        cleaned: list[float] = []
-        for v in list(values):
-            if pd.isna(v):
-                cleaned.append(0.0)
-                continue
-            if isinstance(v, (int, float, np.number)):
-                cleaned.append(float(v))
-                continue
-            s = str(v).strip()
-            # 常见非数值表示视为0
-            if s in {"-", "—", "--", "——", "N/A", "", "None"}:
-                cleaned.append(0.0)
-                continue
-            # 去除千分位、中文逗号、空格
-            s = s.replace(",", "").replace("，", "").replace(" ", "")
-            # 去除末尾的非数字/小数点/负号字符（如单位等）
-            s = re.sub(r"[^0-9.\-]+$", "", s)
-            try:
-                cleaned.append(float(s))
-            except Exception:
-                cleaned.append(0.0)
-        return np.array(cleaned, dtype=float)
     
     for project_name, df in all_main_dfs.items():
         if df is None:
             continue
+        
+        # 1-12月数值块整体转换一次（容错千分位/中文符号）
+        numeric_block = to_float_matrix(df.iloc[:, 2:14], width=12)
             
         # 查找二级费项数据
         fee_items_data = []
@@ -1045,15 +1071,6 @@ def create_secondary_fee_overall_data(all_main_dfs, month=None, include_self_own
                 
                 fee_names.add(fee_name)
         
-        # 调试信息：打印找到的费项名称
-        if "物耗成本" in fee_names:
-            print(f"项目 {project_name} 中找到物耗成本费项")
-        else:
-            # 检查是否有类似的名称
-            for name in fee_names:
-                if "物耗" in name:
-                    print(f"项目 {project_name} 中找到类似物耗成本的费项: {name}")
-        
         # 对每个费项名称，查找其目标金额和已发生金额
         for fee_name in fee_names:
             target_data = None
@@ -1068,15 +1085,7 @@ def create_secondary_fee_overall_data(all_main_dfs, month=None, include_self_own
                 if (first_col == fee_name or first_col.strip() == fee_name.strip()) and \
                    ("目标金额" in second_col or "目标成本" in second_col or "目标" in second_col) and \
                    "累计" not in second_col:
-                    try:
-                        raw = df.iloc[idx, 2:14].values  # 1-12月
-                        # 确保数据类型正确（容错千分位/中文符号）
-                        target_data = to_float_array(raw)
-                        if fee_name == "物耗成本" or "物耗" in fee_name:
-                            print(f"物耗成本目标数据: {target_data}")
-                    except Exception as e:
-                        print(f"处理目标金额数据时出错: {e}")
-                        target_data = None
+                    target_data = numeric_block[idx]  # 1-12月
                     break
             
             # 查找已发生金额数据
@@ -1088,15 +1097,7 @@ def create_secondary_fee_overall_data(all_main_dfs, month=None, include_self_own
                 if (first_col == fee_name or first_col.strip() == fee_name.strip()) and \
                    ("已发生金额" in second_col or "已发生成本" in second_col or "已发生" in second_col) and \
                    "累计" not in second_col:
-                    try:
-                        raw = df.iloc[idx, 2:14].values  # 1-12月
-                        # 确保数据类型正确（容错千分位/中文符号）
-                        actual_data = to_float_array(raw)
-                        if fee_name == "物耗成本" or "物耗" in fee_name:
-                            print(f"物耗成本已发生数据: {actual_data}")
-                    except Exception as e:
-                        print(f"处理已发生金额数据时出错: {e}")
-                        actual_data = None
+                    actual_data = numeric_block[idx]  # 1-12月
                     break
             
             # 放宽条件：任意一项存在即加入；缺失的用0填充
@@ -1116,9 +1117,6 @@ def create_secondary_fee_overall_data(all_main_dfs, month=None, include_self_own
                 'cum_target': cum_target.tolist(),  # 月累目标
                 'cum_actual': cum_actual.tolist()   # 月累已发生
             })
-
-            if fee_name == "物耗成本":
-                print(f"物耗成本数据加入：target(首月)={target_data[0]}, actual(首月)={actual_data[0]}")
         
         # 将数据按费项名称分组
         for item in fee_items_data:
@@ -1147,9 +1145,6 @@ def create_secondary_fee_overall_data(all_main_dfs, month=None, include_self_own
             'cum_target': data['cum_target'].tolist(),  # 月累目标
             'cum_actual': data['cum_actual'].tolist()   # 月累已发生
         })
-        
-        if fee_name == "物耗成本":
-            print(f"最终物耗成本数据 - target: {data['target']}, actual: {data['actual']}")
     
     # 保存到缓存
     if month is not None:
@@ -1184,7 +1179,7 @@ def extract_labor_service_breakdown(file):
                 # 使用BytesIO包装bytes，避免FutureWarning
                 xl = pd.ExcelFile(BytesIO(file_bytes))
             else:
-                st.error(f"不支持的文件对象类型: {type(file)}")
+                diagnostics.error(f"不支持的文件对象类型: {type(file)}")
                 return None
         
         # 查找人工服务拆分工作表
@@ -1202,155 +1197,144 @@ def extract_labor_service_breakdown(file):
                     break
         
         if labor_sheet is None:
-            st.warning(f"文件中未找到人工服务拆分工作表")
+            diagnostics.warning(f"文件中未找到人工服务拆分工作表")
             return None
         
         # 读取前130行数据
         df = xl.parse(labor_sheet, nrows=130)
         
-        # 清理数据：移除空行和无效行
-        # 检查第一列和第二列，如果都是空值或无效值，则移除该行
-        cleaned_rows = []
-        for idx, row in df.iterrows():
-            first_col = str(row.iloc[0]).strip() if pd.notna(row.iloc[0]) else ""
-            second_col = str(row.iloc[1]).strip() if pd.notna(row.iloc[1]) else ""
-            
-            # 跳过空行、标题行等
-            if (first_col == "" or first_col == "nan" or 
-                second_col == "" or second_col == "nan" or
-                "人工服务费项" in first_col or "费项" in first_col):
-                continue
-            
-            # 检查是否有数值数据（第3列开始）
-            has_numeric_data = False
-            for col_idx in range(2, min(14, len(row))):
-                try:
-                    val = row.iloc[col_idx]
-                    if pd.notna(val) and str(val).strip() != "" and str(val).strip() != "nan":
-                        # 尝试转换为数字
-                        float_val = float(str(val).replace(',', '').replace('，', ''))
-                        if float_val != 0:
-                            has_numeric_data = True
-                            break
-                except:
-                    continue
-            
-            # 只保留有数值数据的行
-            if has_numeric_data:
-                cleaned_rows.append(row)
+        # 清理数据：移除空行和无效行（整列向量化判断）
+        # 第一列和第二列不能为空，且第一列不能是标题行
+        def label_strings(col):
+            return col.astype(str).str.strip().where(col.notna(), "")
+        
+        first_col = label_strings(df.iloc[:, 0])
+        second_col = label_strings(df.iloc[:, 1])
+        has_labels = (~first_col.isin(["", "nan"]) & ~second_col.isin(["", "nan"]) &
+                      ~first_col.str.contains("费项", regex=False))
+        
+        # 检查是否有数值数据（第3-14列），每列只做一次数值转换
+        numeric_block = to_float_matrix(df.iloc[:, 2:14])
+        has_numeric_data = pd.Series((numeric_block != 0).any(axis=1), index=df.index)
         
-        if cleaned_rows:
-            cleaned_df = pd.DataFrame(cleaned_rows)
+        # 只保留有数值数据的行
+        cleaned_df = df[has_labels & has_numeric_data]
+        if not cleaned_df.empty:
             return cleaned_df
         else:
             return None
         
     except Exception as e:
-        st.error(f"提取人工服务拆分数据时出错: {e}")
+        diagnostics.error(f"提取人工服务拆分数据时出错: {e}")
         return None
 
+def load_labor_service_breakdown(file_path):
+    """读取单个文件的人工服务拆分数据，按文件路径、大小和修改时间缓存"""
+    cache_manager = get_cache_manager()
+    cached = cache_manager.get_labor_cache(str(file_path))
+    if cached is not None:
+        return cached['labor_df']
+    
+    labor_df = extract_labor_service_breakdown(file_path)
+    cache_manager.save_labor_cache(str(file_path), labor_df)
+    return labor_df
+
+def _labor_month_columns(columns):
+    """找到1-12月数值列，支持纯数字、数字+月、带空格等格式，返回 [(月份, 列名)]"""
+    month_columns = []
+    for col in columns:
+        col_str = str(col).replace('月', '').replace(' ', '').strip()
+        if col_str.isdigit() and 1 <= int(col_str) <= 12:
+            month_columns.append((int(col_str), col))
+    return sorted(month_columns)
+
+# 人工服务拆分数值块缓存：内容指纹 -> (指纹, 分组标签, 1-12月数值矩阵)
+_labor_block_cache = {}
+
+def _labor_block(labor_df, group_columns, month_columns):
+    """将单个项目的人工服务拆分数据按分组列预先求和，得到可增量累加的数值块"""
+    fingerprint = fingerprint_frame(labor_df)
+    cache_key = (fingerprint, tuple(group_columns), tuple(month_columns))
+    block = _labor_block_cache.get(cache_key)
+    if block is None:
+        # 数值块同时取决于内容和列的划分，二者共同作为增量汇总器判断变化的指纹
+        block_fingerprint = hashlib.md5(repr(cache_key).encode()).hexdigest()
+        matrix = np.zeros((len(labor_df), 12), dtype=float)
+        for month, col in month_columns:
+            matrix[:, month - 1] = to_float_array(labor_df[col])
+        grouped = pd.DataFrame(matrix).groupby([labor_df[col].to_numpy() for col in group_columns], sort=False).sum()
+        labels = [label if isinstance(label, tuple) else (label,) for label in grouped.index]
+        block = (block_fingerprint, labels, grouped.to_numpy(dtype=float))
+        if len(_labor_block_cache) >= _PROJECT_BLOCK_CACHE_SIZE:
+            _labor_block_cache.pop(next(iter(_labor_block_cache)))
+        _labor_block_cache[cache_key] = block
+    return block
+
 def create_labor_service_summary(all_files, data_dir):
     """创建多项目人工服务拆分汇总表
     
+    每个文件的人工服务拆分数据按文件指纹缓存，跨项目的分组求和由增量汇总器维护，
+    选择变化时只累加/扣减变化的项目。
+    
     Args:
-        all_files: 所有项目文件名列表
+        all_files: 参与汇总的项目文件名列表（当前选中的项目）
         data_dir: 数据目录路径
         
     Returns:
         DataFrame: 汇总的人工服务拆分数据
     """
-    all_labor_data = []
-    
+    labor_dfs = {}
     for filename in all_files:
         try:
-            file_path = data_dir / filename
-            labor_df = extract_labor_service_breakdown(file_path)
-            
+            labor_df = load_labor_service_breakdown(data_dir / filename)
             if labor_df is not None:
-                # 添加项目名称列
-                project_name = filename.replace('.xlsx', '')
-                labor_df['项目名称'] = project_name
-                all_labor_data.append(labor_df)
-                
+                labor_dfs[filename.replace('.xlsx', '')] = labor_df
         except Exception as e:
-            st.error(f"处理文件 {filename} 的人工服务拆分数据时出错: {e}")
+            diagnostics.error(f"处理文件 {filename} 的人工服务拆分数据时出错: {e}")
     
-    if all_labor_data:
-        # 合并所有项目的数据
-        combined_df = pd.concat(all_labor_data, ignore_index=True)
-        
-        # 调试信息
-        print(f"合并后的数据形状: {combined_df.shape}")
-        print(f"合并后的列名: {list(combined_df.columns)}")
-        
-        # 找到数值列（1-12月）- 支持多种格式
-        numeric_columns = []
-        for col in combined_df.columns:
-            col_str = str(col).strip()
-            # 支持纯数字、数字+月、数字+月+其他字符等格式
-            if (col_str.isdigit() and 1 <= int(col_str) <= 12) or \
-               (col_str.replace('月', '').isdigit() and 1 <= int(col_str.replace('月', '')) <= 12) or \
-               (col_str.replace('月', '').replace(' ', '').isdigit() and 1 <= int(col_str.replace('月', '').replace(' ', '')) <= 12):
-                numeric_columns.append(col)
-        
-        print(f"找到的数值列: {numeric_columns}")
-        
-        if numeric_columns and len(numeric_columns) > 0:
-            # 确定分组列（前两列通常是费项名称和数据类型）
-            group_columns = []
-            if len(combined_df.columns) >= 2:
-                # 排除项目名称列和数值列
-                exclude_cols = numeric_columns + ['项目名称']
-                group_columns = [col for col in combined_df.columns if col not in exclude_cols]
-            
-            print(f"分组列: {group_columns}")
-            
-            if group_columns:
-                # 创建汇总表 - 按费项名称和数据类型分组，对数值列进行累加
-                summary_df = combined_df.groupby(group_columns)[numeric_columns].sum().reset_index()
-                
-                print(f"汇总后的数据形状: {summary_df.shape}")
-                print(f"汇总后的列名: {list(summary_df.columns)}")
-                
-                # 添加项目名称列，统一设置为"汇总"
-                summary_df['项目名称'] = '汇总'
-                
-                # 重新排列列顺序，确保与原表一致
-                # 首先获取原始列顺序（不包括项目名称）
-                original_cols = [col for col in combined_df.columns if col != '项目名称']
-                
-                # 确保数值列按正确顺序排列（1月到12月）
-                numeric_cols_ordered = []
-                for i in range(1, 13):
-                    month_col = f"{i}月"
-                    if month_col in summary_df.columns:
-                        numeric_cols_ordered.append(month_col)
-                    else:
-                        # 处理可能的空格问题
-                        month_col_with_space = f"{i} 月"
-                        if month_col_with_space in summary_df.columns:
-                            numeric_cols_ordered.append(month_col_with_space)
-                
-                # 构建最终的列顺序：分组列 + 数值列 + 项目名称
-                final_cols = group_columns + numeric_cols_ordered + ['项目名称']
-                
-                # 确保所有列都存在
-                available_cols = [col for col in final_cols if col in summary_df.columns]
-                summary_df = summary_df[available_cols]
-                
-                print(f"最终汇总表形状: {summary_df.shape}")
-                print(f"最终列顺序: {list(summary_df.columns)}")
-                return summary_df
-            else:
-                print("没有找到合适的分组列，返回原始数据")
-                # 如果没有找到合适的分组列，返回原始数据
-                return combined_df
-        else:
-            print("没有找到数值列，返回原始数据")
-            # 如果没有找到数值列，返回原始数据
-            return combined_df
+    if not labor_dfs:
+        return None
     
-    return None
+    # 每个文件分别识别1-12月数值列（列名可能是'1'或'1月'），按月份对齐
+    file_month_columns = {name: _labor_month_columns(df.columns) for name, df in labor_dfs.items()}
+    month_names = {}
+    for month_columns in file_month_columns.values():
+        for month, col in month_columns:
+            month_names.setdefault(month, col)
+    if not month_names:
+        # 如果没有找到数值列，返回原始数据
+        combined_df = pd.concat([df.assign(项目名称=name) for name, df in labor_dfs.items()], ignore_index=True)
+        return combined_df
+    
+    # 以第一个有数值列的项目确定分组列（前两列通常是费项名称和数据类型）
+    first_name = next(name for name, month_columns in file_month_columns.items() if month_columns)
+    numeric_cols = [col for _, col in file_month_columns[first_name]]
+    group_columns = [col for col in labor_dfs[first_name].columns if col not in numeric_cols and col != '项目名称']
+    if not group_columns:
+        # 如果没有找到合适的分组列，返回原始数据
+        combined_df = pd.concat([df.assign(项目名称=name) for name, df in labor_dfs.items()], ignore_index=True)
+        return combined_df
+    
+    blocks = {}
+    for name, df in labor_dfs.items():
+        missing = [str(col) for col in group_columns if col not in df.columns]
+        if missing:
+            diagnostics.error(f"文件 {name}.xlsx 的人工服务拆分数据缺少列 {', '.join(missing)}，未计入汇总")
+            continue
+        blocks[name] = _labor_block(df, group_columns, file_month_columns[name])
+    if not blocks:
+        return None
+    labels, matrix = get_labor_aggregator().aggregate(blocks)
+    
+    # 与 groupby().sum() 一致：按分组列排序
+    order = sorted(range(len(labels)), key=lambda i: tuple(str(v) for v in labels[i]))
+    summary_df = pd.DataFrame([labels[i] for i in order], columns=group_columns)
+    for month, col in sorted(month_names.items()):
+        summary_df[col] = matrix[order, month - 1]
+    
+    # 添加项目名称列，统一设置为"汇总"
+    summary_df['项目名称'] = '汇总'
+    return summary_df
 
 def create_formatted_summary_table(all_dfs, all_data):
     """创建格式化的汇总表显示，包含项目列表和汇总数据"""
@@ -0,0 +1,78 @@
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+logger = logging.getLogger("dashboard")
+
+# 诊断级别 -> logging 级别（没有安装处理函数时写入日志）
+LEVELS = {
+    'error': logging.ERROR,
+    'warning': logging.WARNING,
+    'info': logging.INFO,
+    'success': logging.INFO,
+}
+
+
+@dataclass(frozen=True)
+class Diagnostic:
+    """数据处理过程中产生的提示信息，由调用方决定如何展示"""
+    level: str
+    message: str
+
+
+# 当前上下文的处理函数：页面中显示为提示框，批量处理时收集到列表，未设置时写入日志
+_handler: ContextVar[Optional[Callable[[Diagnostic], None]]] = ContextVar("diagnostics_handler", default=None)
+
+
+def report(level: str, message: str):
+    """报告一条诊断信息"""
+    if level not in LEVELS:
+        raise ValueError(f"未知的诊断级别: {level}")
+    diagnostic = Diagnostic(level, message)
+    handler = _handler.get()
+    if handler is None:
+        logger.log(LEVELS[level], message)
+    else:
+        handler(diagnostic)
+
+
+def error(message: str):
+    report('error', message)
+
+
+def warning(message: str):
+    report('warning', message)
+
+
+def info(message: str):
+    report('info', message)
+
+
+def success(message: str):
+    report('success', message)
+
+
+@contextmanager
+def diagnostics_handler(handler: Callable[[Diagnostic], None]):
+    """在代码块内将诊断信息交给 handler 处理（只对当前线程/上下文生效）"""
+    token = _handler.set(handler)
+    try:
+        yield
+    finally:
+        _handler.reset(token)
+
+
+@contextmanager
+def collect_diagnostics():
+    """收集代码块内产生的诊断信息
+
+    用法：
+        with collect_diagnostics() as diagnostics:
+            extract_table_from_excel(path)
+        errors = [d.message for d in diagnostics if d.level == 'error']
+    """
+    diagnostics: List[Diagnostic] = []
+    with diagnostics_handler(diagnostics.append):
+        yield diagnostics
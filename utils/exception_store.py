@@ -0,0 +1,205 @@
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils.numeric_parser import to_float_array
+
+# 异常来源：主控（二级）费项 / 三级费项，对应分析结果中的字段
+EXCEPTION_KINDS = {'main': 'exceptions', 'tertiary': 'tertiary_exceptions'}
+# 分析结果中缓存的前缀计数字段
+EXCEPTION_COUNT_FIELDS = {'main': 'exception_counts', 'tertiary': 'tertiary_exception_counts'}
+# 全年异常的前缀计数字段（不受所选月份限制），浏览器端切换月份时使用
+EXCEPTION_YEAR_COUNT_FIELDS = {'main': 'year_exception_counts', 'tertiary': 'tertiary_year_exception_counts'}
+# 异常类型：红色（超年度目标）/ 黄色（超月度目标）
+EXCEPTION_TYPES = ('red', 'yellow')
+
+_TABLE_COLUMNS = ['project_name', 'fee_code', 'fee_name', 'month', 'exception_type',
+                  'cum_actual', 'cum_target', 'year_target']
+
+
+def exception_prefix_counts(exceptions) -> List[List[int]]:
+    """统计异常列表截至1-12月的 [红色, 黄色] 前缀计数，结果随分析结果一起缓存
+
+    Returns:
+        2 x 13 的嵌套列表，counts[类型][月份] = 截至该月（含）的异常数量，月份0恒为0
+    """
+    counts = np.zeros((len(EXCEPTION_TYPES), 13), dtype=np.int64)
+    for exception in exceptions or []:
+        if not isinstance(exception, dict) or exception.get('exception_type') not in EXCEPTION_TYPES:
+            continue
+        month = int(to_float_array([exception.get('month')])[0])
+        if 1 <= month <= 12:
+            counts[EXCEPTION_TYPES.index(exception['exception_type']), month] += 1
+    return np.cumsum(counts, axis=1).tolist()
+
+
+class ExceptionLeaderboard:
+    """异常数量排行榜
+
+    基于各项目 1-12 月的异常前缀计数，任意月份的排名都只是对一列计数排序。
+    Top-N 使用 argpartition 部分排序；同分时按项目原始顺序排列，与稳定排序结果一致。
+    """
+
+    METRICS = ('main', 'tertiary', 'total')
+
+    def __init__(self, projects: List[str], main_counts: np.ndarray, tertiary_counts: np.ndarray):
+        self.projects = list(projects)
+        # 每个指标为 (项目数, 13) 的前缀计数
+        self.type_counts = {'main': main_counts, 'tertiary': tertiary_counts}
+        self.totals = {
+            'main': main_counts.sum(axis=1),
+            'tertiary': tertiary_counts.sum(axis=1),
+        }
+        self.totals['total'] = self.totals['main'] + self.totals['tertiary']
+        self._orders = {}
+
+    def _sort_keys(self, metric: str) -> np.ndarray:
+        """组合排序键：异常数优先，同分时原始顺序靠前的项目键更大"""
+        n = len(self.projects)
+        tie_break = np.arange(n - 1, -1, -1, dtype=np.int64)
+        return self.totals[metric] * max(n, 1) + tie_break[:, None]
+
+    def top(self, metric: str, month, n: int = None) -> np.ndarray:
+        """返回截至指定月份异常数最多的前n个项目下标（降序）"""
+        month = ExceptionStore._clip_month(month)
+        if metric in self._orders or n is None or n >= len(self.projects):
+            # 需要完整排名时一次排好全部月份，切换月份直接复用
+            return self.rank_all_months(metric)[month][:n]
+        keys = self._sort_keys(metric)[:, month]
+        candidates = np.argpartition(-keys, n)[:n]
+        return candidates[np.argsort(-keys[candidates])]
+
+    def rank_all_months(self, metric: str) -> np.ndarray:
+        """一次性计算全部月份的排名顺序，形状为 (13, 项目数)，结果会被缓存"""
+        if metric not in self._orders:
+            self._orders[metric] = np.argsort(-self._sort_keys(metric).T, axis=1)
+        return self._orders[metric]
+
+
+class ExceptionStore:
+    """按月份索引的列式异常记录表
+
+    每类异常（主控费项 / 三级费项）存为一张按月份稳定排序的表，并为每个
+    项目、异常类型预先计算1-12月的前缀计数。"截至第N月"的统计只需读取
+    前缀计数，明细只需按月份切片，不再逐条过滤异常列表。
+    """
+
+    def __init__(self, projects: List[str], tables: Dict[str, pd.DataFrame],
+                 prefix_counts: Dict[str, np.ndarray] = None):
+        self.projects = list(projects)
+        self.tables = tables
+        self._month_ends = {}
+        self._leaderboard = None
+        # prefix_counts[kind][项目, 类型, 月份] = 截至该月（含）的异常数量，月份0恒为0
+        self.prefix_counts = dict(prefix_counts or {})
+        for kind, table in tables.items():
+            months = table['month'].to_numpy(dtype=np.int64)
+            self._month_ends[kind] = np.searchsorted(months, np.arange(13), side='right')
+            if kind in self.prefix_counts:
+                continue
+            counts = np.zeros((len(self.projects), len(EXCEPTION_TYPES), 13), dtype=np.int64)
+            type_codes = table['type_code'].to_numpy()
+            valid = (type_codes >= 0) & (months >= 1) & (months <= 12)
+            np.add.at(counts, (table['project_index'].to_numpy()[valid], type_codes[valid], months[valid]), 1)
+            self.prefix_counts[kind] = np.cumsum(counts, axis=2)
+
+    @staticmethod
+    def _clip_month(month) -> int:
+        return int(min(max(int(month), 0), 12))
+
+    def counts(self, kind: str, month) -> np.ndarray:
+        """返回截至指定月份各项目的 [红色, 黄色] 异常数量，形状为 (项目数, 2)"""
+        return self.prefix_counts[kind][:, :, self._clip_month(month)]
+
+    def type_counts(self, kind: str, month) -> Tuple[int, int]:
+        """返回截至指定月份全部项目的 (红色, 黄色) 异常数量"""
+        totals = self.counts(kind, month).sum(axis=0)
+        return int(totals[0]), int(totals[1])
+
+    def records(self, kind: str, month) -> pd.DataFrame:
+        """返回截至指定月份的异常明细（按月份升序）"""
+        end = self._month_ends[kind][self._clip_month(month)]
+        return self.tables[kind].iloc[:end][_TABLE_COLUMNS]
+
+    def months(self, kind: str) -> List[int]:
+        """返回出现过异常的月份列表"""
+        return sorted(int(m) for m in pd.unique(self.tables[kind]['month']) if 1 <= m <= 12)
+
+    def total(self, kind: str = None) -> int:
+        """返回异常记录总数"""
+        kinds = [kind] if kind else list(self.tables)
+        return int(sum(len(self.tables[k]) for k in kinds))
+
+    def leaderboard(self) -> ExceptionLeaderboard:
+        """返回异常数量排行榜（首次调用时构建）"""
+        if self._leaderboard is None:
+            self._leaderboard = ExceptionLeaderboard(self.projects, self.prefix_counts['main'],
+                                                     self.prefix_counts['tertiary'])
+        return self._leaderboard
+
+
+def _build_table(all_data, field: str) -> pd.DataFrame:
+    """将各项目的异常字典列表展开为一张列式表"""
+    project_index, records = [], []
+    for i, data in enumerate(all_data.values()):
+        exceptions = data.get(field) if isinstance(data, dict) else None
+        if not isinstance(exceptions, list):
+            continue
+        valid = [e for e in exceptions if isinstance(e, dict)]
+        records.extend(valid)
+        project_index.extend([i] * len(valid))
+
+    projects = list(all_data.keys())
+    table = pd.DataFrame.from_records(records, columns=[c for c in _TABLE_COLUMNS if c != 'project_name'])
+    table['project_index'] = np.asarray(project_index, dtype=np.int64)
+    table['project_name'] = np.asarray(projects, dtype=object)[table['project_index'].to_numpy()] if projects else []
+    # 月份可能是"12月"这样的字符串，统一转换为整数
+    table['month'] = to_float_array(table['month']).astype(np.int64)
+    table['type_code'] = table['exception_type'].map({t: i for i, t in enumerate(EXCEPTION_TYPES)}).fillna(-1).astype(np.int64)
+    for col in ('cum_actual', 'cum_target', 'year_target'):
+        table[col] = to_float_array(table[col])
+    return table.sort_values('month', kind='stable').reset_index(drop=True)
+
+
+def _cached_prefix_counts(all_data, field: str):
+    """读取分析结果中缓存的前缀计数，任一项目缺失时返回None"""
+    counts = []
+    for data in all_data.values():
+        cached = data.get(field) if isinstance(data, dict) else None
+        if cached is None:
+            return None
+        counts.append(np.asarray(cached, dtype=np.int64))
+    return np.stack(counts) if counts else None
+
+
+def year_prefix_counts(data, kind: str) -> np.ndarray:
+    """返回单个项目全年异常的 [红色, 黄色] 前缀计数，形状为 (2, 13)，与所选月份无关
+
+    分析结果读取缓存时已保证带有全年计数（旧缓存会重新计算）；
+    没有该字段的结果（如三级费项处理失败）按其中的异常记录统计。
+    """
+    counts = data.get(EXCEPTION_YEAR_COUNT_FIELDS[kind])
+    if counts is None:
+        counts = exception_prefix_counts(data.get(EXCEPTION_KINDS[kind]))
+    return np.asarray(counts, dtype=np.int64)
+
+
+def year_type_counts(all_data, kind: str) -> np.ndarray:
+    """返回全部项目全年异常的 [红色, 黄色] 前缀计数合计，形状为 (2, 13)"""
+    totals = np.zeros((len(EXCEPTION_TYPES), 13), dtype=np.int64)
+    for data in all_data.values():
+        if isinstance(data, dict):
+            totals += year_prefix_counts(data, kind)
+    return totals
+
+
+def build_exception_store(all_data) -> ExceptionStore:
+    """根据各项目的分析结果构建异常记录表，前缀计数优先使用分析时缓存的结果"""
+    tables = {kind: _build_table(all_data, field) for kind, field in EXCEPTION_KINDS.items()}
+    prefix_counts = {}
+    for kind, field in EXCEPTION_COUNT_FIELDS.items():
+        cached = _cached_prefix_counts(all_data, field)
+        if cached is not None:
+            prefix_counts[kind] = cached
+    return ExceptionStore(list(all_data.keys()), tables, prefix_counts)
@@ -0,0 +1,107 @@
+import io
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+
+from utils.figure_cache import figure_cache_key
+
+# 缓存的下载文件数量上限（每项为序列化后的文件字节）
+PAYLOAD_CACHE_SIZE = 32
+
+# 只写模式下每次转换为Python对象的行数，控制大表写出时的峰值内存
+EXCEL_CHUNK_ROWS = 5000
+
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+_payload_cache: "OrderedDict[str, bytes]" = OrderedDict()
+# 延迟生成的下载内容在Streamlit的工作线程中执行，缓存需要加锁
+_lock = threading.Lock()
+
+
+def csv_bytes(df: pd.DataFrame) -> bytes:
+    """将表格序列化为带BOM的UTF-8 CSV（Excel可直接打开中文）"""
+    return df.to_csv(index=False).encode('utf-8-sig')
+
+
+def excel_bytes(df: pd.DataFrame, sheet_name: str) -> bytes:
+    """将表格写入单个工作表的xlsx字节流"""
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        df.to_excel(writer, index=False, sheet_name=sheet_name)
+    return output.getvalue()
+
+
+def write_frame(ws, df: pd.DataFrame, chunk_rows: int = EXCEL_CHUNK_ROWS, header: bool = True):
+    """向只写模式的工作表逐块追加表头和数据行，缺失值写为空单元格
+
+    Args:
+        header: 是否先写表头，同一工作表分多次写入时只有第一次需要
+    """
+    if header:
+        cells = []
+        for col in df.columns:
+            cell = WriteOnlyCell(ws, value=str(col))
+            cell.font = Font(bold=True)
+            cells.append(cell)
+        ws.append(cells)
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows].astype(object)
+        for row in chunk.where(chunk.notna(), None).itertuples(index=False, name=None):
+            ws.append(row)
+
+
+def streaming_excel_bytes(df: pd.DataFrame, sheet_name: str) -> bytes:
+    """以openpyxl只写模式在内存中生成单个工作表的xlsx，不经过临时文件"""
+    wb = Workbook(write_only=True)
+    write_frame(wb.create_sheet(title=sheet_name), df)
+    output = io.BytesIO()
+    wb.save(output)
+    return output.getvalue()
+
+
+def cached_payload(name: str, builder, *parts) -> bytes:
+    """按名称和内容指纹缓存下载文件，内容未变化时不重新序列化
+
+    Args:
+        name: 文件类别，区分相同输入的不同导出格式
+        builder: 以 parts 为参数生成文件字节的函数
+        parts: 生成文件的输入，同时作为缓存指纹（DataFrame按内容哈希）
+    """
+    try:
+        key = figure_cache_key(name, parts)
+    except TypeError:
+        # 输入无法序列化时不使用缓存
+        return builder(*parts)
+
+    with _lock:
+        payload = _payload_cache.get(key)
+        if payload is not None:
+            _payload_cache.move_to_end(key)
+            return payload
+
+    payload = builder(*parts)
+    if payload is None:
+        return payload
+    with _lock:
+        _payload_cache[key] = payload
+        while len(_payload_cache) > PAYLOAD_CACHE_SIZE:
+            _payload_cache.popitem(last=False)
+    return payload
+
+
+def deferred_payload(name: str, builder, *parts):
+    """返回延迟生成下载文件的无参数函数，指纹计算和序列化都在调用时才进行
+
+    输入在创建时绑定，之后重新赋值同名变量不影响点击时生成的内容。
+    """
+    return lambda: cached_payload(name, builder, *parts)
+
+
+def clear_payload_cache():
+    """清空下载文件缓存"""
+    with _lock:
+        _payload_cache.clear()
@@ -0,0 +1,132 @@
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+# 一级、二级费项编码对应的名称（与主要费项表中的二级费项一致），三级费项名称见 FEE_CATEGORY_MAP
+FEE_GROUP_NAMES = {
+    '1': '年总成本',
+    '1.1': '服务成本',
+    '1.2': '物耗成本',
+    '1.3': '维改成本',
+    '1.4': '能源成本',
+    '1.5': '行政办公',
+    '1.6': '前期投入',
+}
+
+
+def _code_key(code: str):
+    """按数值顺序排列费项编码（1.3.10 排在 1.3.9 之后）"""
+    return tuple(int(part) for part in code.split('.'))
+
+
+class FeeHierarchy:
+    """三级费项编码的层级结构（1 -> 1.3 -> 1.3.4）
+
+    节点按层级排列：先一级，再二级，最后三级叶子。ancestor_matrix[节点, 叶子] = 1
+    表示该叶子属于该节点，任意层级的小计都是一次矩阵乘法。
+    """
+
+    def __init__(self, leaf_names: Dict[str, str], group_names: Dict[str, str] = None):
+        group_names = group_names or FEE_GROUP_NAMES
+        self.leaves = sorted(leaf_names, key=_code_key)
+        groups = {'.'.join(code.split('.')[:level]) for code in self.leaves for level in (1, 2)}
+        self.codes = sorted(groups, key=lambda c: (len(c.split('.')), _code_key(c))) + self.leaves
+        self.names = {code: group_names.get(code, leaf_names.get(code, code)) for code in self.codes}
+        self.index = {code: i for i, code in enumerate(self.codes)}
+        self.leaf_index = {code: i for i, code in enumerate(self.leaves)}
+
+        self.ancestor_matrix = np.zeros((len(self.codes), len(self.leaves)), dtype=float)
+        self._children: Dict[str, List[str]] = {code: [] for code in self.codes}
+        for j, leaf in enumerate(self.leaves):
+            parts = leaf.split('.')
+            for level in range(1, len(parts) + 1):
+                self.ancestor_matrix[self.index['.'.join(parts[:level])], j] = 1.0
+        for code in self.codes:
+            parent = code.rsplit('.', 1)[0] if '.' in code else None
+            if parent is not None:
+                self._children[parent].append(code)
+
+    def children(self, code: str) -> List[str]:
+        """返回下一级费项编码"""
+        return list(self._children.get(code, []))
+
+    def roots(self) -> List[str]:
+        """返回一级费项编码"""
+        return [code for code in self.codes if '.' not in code]
+
+    def level(self, code: str) -> int:
+        """返回费项编码所在层级（1、2、3）"""
+        return len(code.split('.'))
+
+    def rollup(self, leaf_values: np.ndarray) -> np.ndarray:
+        """将 (..., 叶子数, 月份) 的叶子数据汇总为 (..., 节点数, 月份) 的各级小计"""
+        return np.einsum('nl,...lm->...nm', self.ancestor_matrix, leaf_values)
+
+
+class FeeRollupIndex:
+    """按项目和全部项目合计预先汇总的费项层级小计
+
+    values[kind] 为 (项目数, 节点数, 12) 的各级小计，kind 与三级费项 monthly_data 一致：
+    单月目标/已发生金额及表格中的累计目标/已发生金额；portfolio 为全部项目合计。
+    钻取图表和表格直接读取已汇总的节点。
+    """
+
+    KINDS = ('target', 'actual', 'cum_target', 'cum_actual')
+
+    def __init__(self, hierarchy: FeeHierarchy, projects: List[str], leaf_values: Dict[str, np.ndarray]):
+        self.hierarchy = hierarchy
+        self.projects = list(projects)
+        self.values = {kind: hierarchy.rollup(leaf_values[kind]) for kind in self.KINDS}
+        self.portfolio = {kind: values.sum(axis=0) for kind, values in self.values.items()}
+
+    def _select(self, project: str = None) -> Dict[str, np.ndarray]:
+        if project is None:
+            return self.portfolio
+        i = self.projects.index(project)
+        return {kind: values[i] for kind, values in self.values.items()}
+
+    def node(self, code: str, project: str = None) -> Dict[str, object]:
+        """返回单个节点（任意层级）的1-12月单月和累计金额"""
+        i = self.hierarchy.index[code]
+        values = self._select(project)
+        node = {'code': code, 'name': self.hierarchy.names[code]}
+        node.update({kind: values[kind][i].tolist() for kind in self.KINDS})
+        return node
+
+    def children_table(self, code: str, month: int, project: str = None) -> pd.DataFrame:
+        """返回某节点的下一级费项截至指定月份的累计目标、累计已发生和使用率"""
+        children = self.hierarchy.children(code)
+        rows = [self.hierarchy.index[child] for child in children]
+        values = self._select(project)
+        month = int(min(max(int(month), 1), 12))
+        cum_target = values['cum_target'][rows, month - 1]
+        cum_actual = values['cum_actual'][rows, month - 1]
+        usage = np.divide(100 * cum_actual, cum_target, out=np.zeros(len(rows)), where=cum_target != 0)
+        return pd.DataFrame({
+            'code': children,
+            'name': [self.hierarchy.names[child] for child in children],
+            'cum_target': cum_target,
+            'cum_actual': cum_actual,
+            'usage': np.round(usage, 2),
+        })
+
+
+def build_fee_rollup_index(all_data, leaf_names: Dict[str, str]) -> FeeRollupIndex:
+    """根据各项目的三级费项分析结果（tertiary_fee_items）构建层级小计索引"""
+    hierarchy = FeeHierarchy(leaf_names)
+    projects = list(all_data.keys())
+    leaf_values = {kind: np.zeros((len(projects), len(hierarchy.leaves), 12), dtype=float)
+                   for kind in FeeRollupIndex.KINDS}
+
+    for p, data in enumerate(all_data.values()):
+        for item in data.get('tertiary_fee_items') or []:
+            j = hierarchy.leaf_index.get(item.get('code'))
+            monthly_data = item.get('monthly_data') or {}
+            if j is None:
+                continue
+            for kind in FeeRollupIndex.KINDS:
+                monthly = np.asarray(monthly_data.get(kind) or [], dtype=float)[:12]
+                leaf_values[kind][p, j, :len(monthly)] = monthly
+
+    return FeeRollupIndex(hierarchy, projects, leaf_values)
@@ -0,0 +1,122 @@
+import functools
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+try:
+    import orjson
+except ImportError:  # orjson 不可用时退回标准库 json
+    orjson = None
+
+# 缓存的图表数量上限（每项为序列化后的图表JSON）
+FIGURE_CACHE_SIZE = 256
+
+_figure_cache: "OrderedDict[str, object]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def _default(obj):
+    """序列化 orjson/json 不支持的输入类型"""
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        frame = obj.to_frame() if isinstance(obj, pd.Series) else obj
+        return {
+            'columns': [str(col) for col in frame.columns],
+            'shape': list(frame.shape),
+            'attrs': {str(k): v for k, v in frame.attrs.items()},
+            'hash': pd.util.hash_pandas_object(frame, index=True).values.tobytes().hex(),
+        }
+    if isinstance(obj, np.ndarray):
+        return {'dtype': str(obj.dtype), 'shape': list(obj.shape), 'data': obj.tobytes().hex()}
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, (set, frozenset)):
+        return sorted(obj, key=str)
+    if isinstance(obj, tuple):
+        return list(obj)
+    raise TypeError(f"无法序列化的图表输入类型: {type(obj).__name__}")
+
+
+def _dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default,
+                            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS | orjson.OPT_SORT_KEYS)
+    return json.dumps(obj, default=_default, sort_keys=True, ensure_ascii=False).encode()
+
+
+def _loads(data):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+def figure_cache_key(name: str, *parts) -> str:
+    """根据图表名称、输入数据和图表选项生成缓存键"""
+    return hashlib.md5(name.encode() + b'\0' + _dumps(list(parts))).hexdigest()
+
+
+def _restore(payload) -> go.Figure:
+    """从缓存的JSON重建图表，跳过逐条轨迹校验，之后的修改仍会正常校验"""
+    fig = go.Figure(_loads(payload), _validate=False)
+    fig._validate = True
+    fig.layout._validate = True
+    for trace in fig.data:
+        trace._validate = True
+    return fig
+
+
+def cached_figure(key_func=None):
+    """图表构建函数的缓存装饰器
+
+    输入未变化时直接从缓存的图表JSON重建，不再重新构建图表和校验轨迹。
+    每次命中都返回新的 Figure 对象，调用方修改图表（如设置 visible）不会影响缓存。
+    支持返回单个图表或图表列表的函数；返回 None 时不缓存。
+
+    Args:
+        key_func: 从调用参数中取出决定图表内容的部分，默认使用全部参数
+    """
+    def decorator(func):
+        name = f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                parts = key_func(*args, **kwargs) if key_func else (args, kwargs)
+                key = figure_cache_key(name, parts)
+            except TypeError:
+                # 输入无法序列化时不使用缓存
+                return func(*args, **kwargs)
+
+            with _lock:
+                payload = _figure_cache.get(key)
+                if payload is not None:
+                    _figure_cache.move_to_end(key)
+            if payload is not None:
+                if isinstance(payload, list):
+                    return [_restore(item) for item in payload]
+                return _restore(payload)
+
+            result = func(*args, **kwargs)
+            if result is None:
+                return result
+            if isinstance(result, (list, tuple)):
+                payload = [fig.to_json() for fig in result]
+            else:
+                payload = result.to_json()
+            with _lock:
+                _figure_cache[key] = payload
+                while len(_figure_cache) > FIGURE_CACHE_SIZE:
+                    _figure_cache.popitem(last=False)
+            return result
+
+        wrapper.uncached = func
+        return wrapper
+    return decorator
+
+
+def clear_figure_cache():
+    """清空图表缓存"""
+    with _lock:
+        _figure_cache.clear()
@@ -0,0 +1,50 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+# 千分位逗号、中文逗号和空白字符
+_SEPARATOR_PATTERN = re.compile(r"[,，\s]+")
+# 去掉前导非数字字符（如货币符号）后取第一个数字，末尾的单位（如"月"、"元"）自动忽略
+_NUMBER_PATTERN = re.compile(r"^[^0-9.+\-]*([+-]?(?:[0-9]+(?:\.[0-9]*)?|\.[0-9]+)(?:[eE][+-]?[0-9]+)?)")
+
+
+def to_float_array(values) -> np.ndarray:
+    """将一列单元格值转换为float64数组
+
+    已经是数值类型的列直接转换；对象列先整体 pd.to_numeric，只有转换失败的
+    字符串单元格才做全角转半角、去除千分位/中文逗号和空格，并用预编译正则提取数字。
+    空值、破折号、N/A 等无法识别的值一律视为0。
+    """
+    series = values if isinstance(values, pd.Series) else pd.Series(np.asarray(values, dtype=object))
+    if pd.api.types.is_numeric_dtype(series.dtype):
+        return series.to_numpy(dtype=float, na_value=0.0)
+
+    numeric = pd.to_numeric(series, errors='coerce')
+    unresolved = numeric.isna() & series.notna()
+    if unresolved.any():
+        # 表格中的文本单元格大量重复（如"-"、"N/A"），只解析去重后的取值
+        codes, uniques = pd.factorize(series[unresolved].astype(str))
+        text = pd.Series(uniques).str.normalize('NFKC').str.replace(_SEPARATOR_PATTERN, '', regex=True)
+        parsed = pd.to_numeric(text.str.extract(_NUMBER_PATTERN, expand=False), errors='coerce')
+        numeric[unresolved] = parsed.to_numpy(dtype=float)[codes]
+    return numeric.to_numpy(dtype=float, na_value=0.0)
+
+
+# 定点金额：1元 = 100分
+CENTS_PER_YUAN = 100
+
+
+def to_cents(values) -> np.ndarray:
+    """将以元为单位的金额四舍五入为int64的分，用于精确累加"""
+    return np.rint(np.asarray(values, dtype=float) * CENTS_PER_YUAN).astype(np.int64)
+
+
+def to_float_matrix(df: pd.DataFrame, width: int = None) -> np.ndarray:
+    """将DataFrame的数值块逐列转换为 rows x width 的float64矩阵，列数不足时补0"""
+    width = df.shape[1] if width is None else width
+    matrix = np.zeros((len(df), width), dtype=float)
+    for i in range(min(width, df.shape[1])):
+        matrix[:, i] = to_float_array(df.iloc[:, i])
+    return matrix
+
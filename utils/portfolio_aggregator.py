@@ -0,0 +1,126 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# 单个项目的数值块: (内容指纹, 行标签列表, rows x 12 的数值矩阵)
+ProjectBlock = Tuple[str, List[tuple], np.ndarray]
+
+
+class PortfolioAggregator:
+    """多项目合并汇总的增量维护器
+
+    保存当前选中项目集合的累加矩阵。选择变化时只对新增项目做加法、
+    对移除项目做减法，而不是每次从头汇总所有项目；同时缓存常用项目
+    子集的合并结果，来回切换侧边栏多选框时直接命中。
+    行按标签对齐，不同项目表格行数不一致时也能正确累加。
+    """
+
+    def __init__(self, width: int = 12, max_subsets: int = 64, rebuild_interval: int = 256, dtype=float):
+        self.width = width
+        # 累加矩阵的数据类型；使用int64（分）时加减完全精确
+        self.dtype = np.dtype(dtype)
+        self.max_subsets = max_subsets
+        # 浮点数反复加减会累积误差，超过一定次数后从头重建一次
+        self.rebuild_interval = rebuild_interval
+        self._lock = threading.Lock()
+        self._reset()
+        self._subset_cache: "OrderedDict[frozenset, Tuple[List[tuple], np.ndarray]]" = OrderedDict()
+
+    def _reset(self):
+        """清空当前累加状态"""
+        self._row_index: Dict[tuple, int] = {}
+        self._labels: List[tuple] = []
+        self._ref_counts = np.zeros(0, dtype=np.int64)
+        self._sum = np.zeros((0, self.width), dtype=self.dtype)
+        self._members: Dict[str, ProjectBlock] = {}
+        self._ops_since_rebuild = 0
+
+    def _ensure_rows(self, labels: List[tuple]) -> np.ndarray:
+        """确保标签行存在，返回这些标签在累加矩阵中的行号"""
+        new_labels = [label for label in labels if label not in self._row_index]
+        if new_labels:
+            start = len(self._labels)
+            for offset, label in enumerate(new_labels):
+                self._row_index[label] = start + offset
+            self._labels.extend(new_labels)
+            self._sum = np.vstack([self._sum, np.zeros((len(new_labels), self.width), dtype=self._sum.dtype)])
+            self._ref_counts = np.concatenate([self._ref_counts, np.zeros(len(new_labels), dtype=np.int64)])
+        return np.fromiter((self._row_index[label] for label in labels), dtype=np.int64, count=len(labels))
+
+    def _apply(self, block: ProjectBlock, sign: int):
+        """将单个项目的数值块加入（sign=1）或移出（sign=-1）累加矩阵"""
+        _, labels, matrix = block
+        rows = self._ensure_rows(labels)
+        if matrix.dtype != self._sum.dtype:
+            if self.dtype.kind == 'i':
+                raise TypeError(f"定点汇总器只接受整数矩阵，收到 {matrix.dtype}")
+            self._sum = self._sum.astype(np.result_type(self._sum.dtype, matrix.dtype))
+        np.add.at(self._sum, rows, matrix if sign > 0 else -matrix)
+        np.add.at(self._ref_counts, rows, sign)
+        self._ops_since_rebuild += 1
+
+    def _snapshot(self) -> Tuple[List[tuple], np.ndarray]:
+        """导出当前仍被引用的标签行及其累加值"""
+        keep = np.flatnonzero(self._ref_counts > 0)
+        return [self._labels[i] for i in keep], self._sum[keep].copy()
+
+    def aggregate(self, blocks: Dict[str, ProjectBlock]) -> Tuple[List[tuple], np.ndarray]:
+        """返回给定项目集合的合并结果 (行标签列表, 累加矩阵)
+
+        Args:
+            blocks: 项目名称 -> (内容指纹, 行标签列表, 数值矩阵)
+        """
+        subset_key = frozenset((name, block[0]) for name, block in blocks.items())
+        with self._lock:
+            cached = self._subset_cache.get(subset_key)
+            if cached is not None:
+                self._subset_cache.move_to_end(subset_key)
+                return list(cached[0]), cached[1].copy()
+
+            removed = [name for name, block in self._members.items()
+                       if name not in blocks or blocks[name][0] != block[0]]
+            added = [name for name in blocks
+                     if name not in self._members or self._members[name][0] != blocks[name][0]]
+
+            # 变化量超过目标集合本身或误差累积过多时，直接重建更划算（整数累加没有误差）
+            if (len(removed) + len(added) > len(blocks)
+                    or (self.dtype.kind == 'f'
+                        and self._ops_since_rebuild + len(removed) + len(added) > self.rebuild_interval)):
+                self._reset()
+                removed = []
+                added = list(blocks)
+
+            for name in removed:
+                self._apply(self._members.pop(name), -1)
+            for name in added:
+                self._apply(blocks[name], 1)
+                self._members[name] = blocks[name]
+
+            labels, matrix = self._snapshot()
+            self._subset_cache[subset_key] = (labels, matrix)
+            while len(self._subset_cache) > self.max_subsets:
+                self._subset_cache.popitem(last=False)
+            return list(labels), matrix.copy()
+
+    def clear(self):
+        """清空累加状态和子集缓存"""
+        with self._lock:
+            self._reset()
+            self._subset_cache.clear()
+
+
+# 全局合并汇总实例（主要费项表 / 主要费项表定点分 / 人工服务拆分表）
+portfolio_aggregator = PortfolioAggregator()
+fixed_point_portfolio_aggregator = PortfolioAggregator(dtype=np.int64)
+labor_aggregator = PortfolioAggregator()
+
+def get_portfolio_aggregator(fixed_point: bool = False) -> PortfolioAggregator:
+    """获取全局合并汇总实例，fixed_point=True 时返回按分（int64）累加的实例"""
+    return fixed_point_portfolio_aggregator if fixed_point else portfolio_aggregator
+
+def get_labor_aggregator() -> PortfolioAggregator:
+    """获取人工服务拆分汇总实例"""
+    return labor_aggregator
+
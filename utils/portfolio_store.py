@@ -0,0 +1,272 @@
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils.exception_store import EXCEPTION_KINDS, year_prefix_counts
+from utils.numeric_parser import CENTS_PER_YUAN, to_cents
+
+# 年使用率颜色分档：>=100% 红色，>=90% 黄色
+USAGE_BANDS = ('red', 'yellow', 'normal')
+USAGE_BAND_THRESHOLDS = (100, 90)
+
+# 项目对比图可用的排序指标（KPI列式表中的列）
+COMPARISON_SORT_KEYS = {
+    'year_usage': '年使用率',
+    'month_usage': '月累使用率',
+    'year_target': '年总目标',
+    'year_actual': '年累计已发生',
+}
+# 项目对比图的显示范围：全部项目分页 / 前N名 / 后N名
+COMPARISON_SELECTIONS = ('all', 'top', 'bottom')
+
+# 预置统计区间（起止月份，含两端）
+PERIODS = {
+    'Q1': (1, 3),
+    'Q2': (4, 6),
+    'Q3': (7, 9),
+    'Q4': (10, 12),
+    '上半年': (1, 6),
+    '下半年': (7, 12),
+    '全年': (1, 12),
+}
+
+
+def _usage(actual, target):
+    """使用率(%)，目标为0时记为0"""
+    actual = np.asarray(actual, dtype=float)
+    target = np.asarray(target, dtype=float)
+    usage = np.divide(100 * actual, target, out=np.zeros(np.broadcast(actual, target).shape), where=target != 0)
+    return np.round(usage, 2)
+
+
+class PortfolioStore:
+    """按项目保存1-12月前缀和的期间查询表
+
+    每个项目保存目标成本、已发生成本和全年异常数量的前缀和（第0列恒为0），
+    任意 [start, end] 区间的值都是两列之差，与区间长度和月份无关。
+    季度、半年和全年的汇总在构建时一次算好。
+
+    金额可以按float64的元或int64的分存储（money_scale 为每元对应的存储单位数），
+    查询结果保持存储单位，换算为万元只在图表展示时进行。
+    """
+
+    def __init__(self, projects: List[str], target_prefix: np.ndarray, actual_prefix: np.ndarray,
+                 exception_prefix: Dict[str, np.ndarray], money_scale: int = 1):
+        self.projects = list(projects)
+        self.money_scale = money_scale
+        # (项目数, 13)
+        self.target_prefix = target_prefix
+        self.actual_prefix = actual_prefix
+        # kind -> (项目数, 2[红色, 黄色], 13)
+        self.exception_prefix = exception_prefix
+        # 全部项目合计的前缀和
+        self.portfolio_target_prefix = target_prefix.sum(axis=0)
+        self.portfolio_actual_prefix = actual_prefix.sum(axis=0)
+        self.portfolio_exception_prefix = {kind: counts.sum(axis=0) for kind, counts in exception_prefix.items()}
+        self.period_summary = self._build_period_summary()
+        self._kpi_frames: Dict[int, pd.DataFrame] = {}
+        self._kpi_orders: Dict[Tuple[int, str], np.ndarray] = {}
+
+    @staticmethod
+    def _validate(start, end) -> Tuple[int, int]:
+        start, end = int(start), int(end)
+        if not 1 <= start <= end <= 12:
+            raise ValueError(f"无效的月份区间: {start}-{end}")
+        return start, end
+
+    def range_query(self, start, end, project: str = None) -> Dict[str, float]:
+        """查询单个项目（或全部项目合计）在 [start, end] 月份区间的指标
+
+        Returns:
+            包含 target、actual（存储单位）、usage（%）以及各类红/黄异常数量的字典
+        """
+        start, end = self._validate(start, end)
+        if project is None:
+            target_prefix, actual_prefix = self.portfolio_target_prefix, self.portfolio_actual_prefix
+            exception_prefix = self.portfolio_exception_prefix
+        else:
+            i = self.projects.index(project)
+            target_prefix, actual_prefix = self.target_prefix[i], self.actual_prefix[i]
+            exception_prefix = {kind: counts[i] for kind, counts in self.exception_prefix.items()}
+
+        target = (target_prefix[end] - target_prefix[start - 1]).item()
+        actual = (actual_prefix[end] - actual_prefix[start - 1]).item()
+        result = {
+            'start': start,
+            'end': end,
+            'target': target,
+            'actual': actual,
+            'usage': float(_usage(actual, target)),
+        }
+        for kind, counts in exception_prefix.items():
+            red, yellow = (int(c) for c in counts[:, end] - counts[:, start - 1])
+            result[f'{kind}_red'] = red
+            result[f'{kind}_yellow'] = yellow
+        return result
+
+    def project_range_table(self, start, end) -> pd.DataFrame:
+        """返回全部项目在 [start, end] 区间的指标表（金额为存储单位）"""
+        start, end = self._validate(start, end)
+        target = self.target_prefix[:, end] - self.target_prefix[:, start - 1]
+        actual = self.actual_prefix[:, end] - self.actual_prefix[:, start - 1]
+        table = pd.DataFrame({
+            'project': self.projects,
+            'target': target,
+            'actual': actual,
+            'usage': _usage(actual, target),
+        })
+        for kind, counts in self.exception_prefix.items():
+            diff = counts[:, :, end] - counts[:, :, start - 1]
+            table[f'{kind}_red'] = diff[:, 0]
+            table[f'{kind}_yellow'] = diff[:, 1]
+        return table
+
+    def kpi_frame(self, month) -> pd.DataFrame:
+        """返回截至指定月份的全部项目KPI列式表（按月份缓存）
+
+        列包括年目标/年已发生、截至该月的累计目标/已发生（金额为存储单位，
+        frame.attrs['money_scale'] 记录换算比例）、年使用率、月累使用率、时间进度，
+        以及按年使用率划分的颜色分档 usage_band。
+        """
+        month = int(min(max(int(month), 1), 12))
+        frame = self._kpi_frames.get(month)
+        if frame is None:
+            year_target = self.target_prefix[:, 12]
+            year_actual = self.actual_prefix[:, 12]
+            cum_target = self.target_prefix[:, month]
+            cum_actual = self.actual_prefix[:, month]
+            year_usage = _usage(cum_actual, year_target)
+            frame = pd.DataFrame({
+                'project': self.projects,
+                'year_target': year_target,
+                'year_actual': year_actual,
+                'cum_target': cum_target,
+                'cum_actual': cum_actual,
+                'year_usage': year_usage,
+                'month_usage': _usage(cum_actual, cum_target),
+                'time_progress': round(100 * month / 12, 2),
+                'usage_band': pd.Categorical(
+                    np.select([year_usage >= threshold for threshold in USAGE_BAND_THRESHOLDS],
+                              USAGE_BANDS[:-1], default=USAGE_BANDS[-1]),
+                    categories=USAGE_BANDS
+                ),
+            })
+            frame.attrs['money_scale'] = self.money_scale
+            self._kpi_frames[month] = frame
+        return frame
+
+    def kpi_order(self, month, sort_by: str = 'year_usage') -> np.ndarray:
+        """返回按指标降序排列的项目下标（同值保持原始顺序），按月份和指标缓存"""
+        if sort_by not in COMPARISON_SORT_KEYS:
+            raise ValueError(f"不支持的排序指标: {sort_by}")
+        month = int(min(max(int(month), 1), 12))
+        order = self._kpi_orders.get((month, sort_by))
+        if order is None:
+            order = np.argsort(-self.kpi_frame(month)[sort_by].to_numpy(dtype=float), kind='stable')
+            self._kpi_orders[(month, sort_by)] = order
+        return order
+
+    def comparison_view(self, month, sort_by: str = 'year_usage', selection: str = 'all', n: int = 20,
+                        page: int = 1, page_size: int = 50, others: bool = True) -> pd.DataFrame:
+        """返回项目对比图使用的KPI子集
+        
+        项目按 sort_by 降序排列；selection 为 'top'/'bottom' 时取前/后n名，
+        others 为True时其余项目合并为一行"其他"，使用率按合计金额重新计算；
+        selection 为 'all' 时按 page_size 分页返回第 page 页。
+        frame.attrs 中的 total_projects、pages 记录项目总数和页数。
+        """
+        if selection not in COMPARISON_SELECTIONS:
+            raise ValueError(f"不支持的显示范围: {selection}")
+        frame = self.kpi_frame(month)
+        order = self.kpi_order(month, sort_by)
+        total = len(order)
+        pages = 1
+        
+        if selection == 'all':
+            page_size = max(int(page_size), 1)
+            pages = max((total + page_size - 1) // page_size, 1)
+            page = min(max(int(page), 1), pages)
+            rows = order[(page - 1) * page_size:page * page_size]
+            rest = order[:0]
+        else:
+            n = min(max(int(n), 0), total)
+            rows, rest = (order[:n], order[n:]) if selection == 'top' else (order[total - n:], order[:total - n])
+        
+        view = frame.iloc[rows].reset_index(drop=True)
+        view['project_count'] = 1
+        if others and len(rest):
+            sums = {col: frame[col].to_numpy()[rest].sum() for col in ('year_target', 'year_actual', 'cum_target', 'cum_actual')}
+            year_usage = _usage(sums['cum_actual'], sums['year_target'])
+            other = pd.DataFrame({
+                'project': [f"其他（{len(rest)}个项目）"],
+                **{col: [value] for col, value in sums.items()},
+                'year_usage': [float(year_usage)],
+                'month_usage': [float(_usage(sums['cum_actual'], sums['cum_target']))],
+                'time_progress': [frame['time_progress'].iloc[0]],
+                'usage_band': pd.Categorical(
+                    [next((band for band, threshold in zip(USAGE_BANDS, USAGE_BAND_THRESHOLDS) if year_usage >= threshold),
+                          USAGE_BANDS[-1])],
+                    categories=USAGE_BANDS
+                ),
+                'project_count': [len(rest)],
+            })
+            view = pd.concat([view, other], ignore_index=True)
+        view.attrs.update(frame.attrs, total_projects=total, pages=pages)
+        return view
+
+    def _build_period_summary(self) -> pd.DataFrame:
+        """预先计算全部项目合计的季度、半年和全年指标"""
+        starts = np.array([start for start, _ in PERIODS.values()])
+        ends = np.array([end for _, end in PERIODS.values()])
+        target = self.portfolio_target_prefix[ends] - self.portfolio_target_prefix[starts - 1]
+        actual = self.portfolio_actual_prefix[ends] - self.portfolio_actual_prefix[starts - 1]
+        summary = pd.DataFrame({
+            'period': list(PERIODS),
+            'start': starts,
+            'end': ends,
+            'target': target,
+            'actual': actual,
+            'usage': _usage(actual, target),
+        })
+        for kind, counts in self.portfolio_exception_prefix.items():
+            diff = counts[:, ends] - counts[:, starts - 1]
+            summary[f'{kind}_red'] = diff[0]
+            summary[f'{kind}_yellow'] = diff[1]
+        return summary
+
+
+def _prefix(values) -> np.ndarray:
+    """将1-12月的累计值补上第0列，得到长度为13的前缀和"""
+    cumulative = np.zeros(13, dtype=float)
+    values = np.asarray(values if values is not None else [], dtype=float)[:12]
+    cumulative[1:1 + len(values)] = values
+    if len(values) < 12:
+        cumulative[1 + len(values):] = cumulative[len(values)]
+    return cumulative
+
+
+def build_portfolio_store(all_data, fixed_point: bool = False) -> PortfolioStore:
+    """根据各项目的分析结果（cum_target/cum_actual及全年异常前缀计数）构建期间查询表
+
+    金额本身是全年1-12月的数据，异常数量也使用不受所选月份限制的全年计数，
+    期间查询和季度/半年汇总的结果因此与所选月份无关。
+
+    Args:
+        fixed_point: 为True时金额按int64的分存储，跨项目求和完全精确
+    """
+    projects = list(all_data.keys())
+    target_prefix = np.zeros((len(projects), 13), dtype=float)
+    actual_prefix = np.zeros((len(projects), 13), dtype=float)
+    exception_prefix = {kind: np.zeros((len(projects), 2, 13), dtype=np.int64) for kind in EXCEPTION_KINDS}
+
+    for i, data in enumerate(all_data.values()):
+        target_prefix[i] = _prefix(data.get('cum_target'))
+        actual_prefix[i] = _prefix(data.get('cum_actual'))
+        for kind in EXCEPTION_KINDS:
+            exception_prefix[kind][i] = year_prefix_counts(data, kind)
+
+    if fixed_point:
+        return PortfolioStore(projects, to_cents(target_prefix), to_cents(actual_prefix), exception_prefix,
+                              money_scale=CENTS_PER_YUAN)
+    return PortfolioStore(projects, target_prefix, actual_prefix, exception_prefix)
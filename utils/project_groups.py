@@ -0,0 +1,192 @@
+import hashlib
+import json
+import re
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils.exception_store import EXCEPTION_COUNT_FIELDS, EXCEPTION_KINDS, exception_prefix_counts
+
+# 默认的分组映射文件（放在数据目录中）：{"项目名称": "一级分组/二级分组"}
+GROUP_MAPPING_FILE = "project_groups.json"
+
+# 名称前缀分组的分隔符：'粤东三管理中心-二职校' -> 粤东三管理中心，'中海油（我司权益）' -> 中海油
+_PREFIX_PATTERN = re.compile(r"\s*[-－—（(]")
+
+# 每个项目的汇总向量：1-12月累计目标、1-12月累计已发生、主控/三级费项红黄异常前缀计数
+_TARGET = slice(0, 12)
+_ACTUAL = slice(12, 24)
+_EXCEPTIONS = slice(24, 24 + len(EXCEPTION_KINDS) * 2 * 13)
+VECTOR_WIDTH = _EXCEPTIONS.stop
+
+GroupPath = Tuple[str, ...]
+
+
+def prefix_group(project_name: str) -> GroupPath:
+    """按名称前缀分组，名称中没有分隔符的项目单独成组"""
+    name = str(project_name).strip()
+    prefix = _PREFIX_PATTERN.split(name, maxsplit=1)[0].strip()
+    return (prefix or name,)
+
+
+def load_group_mapping(path) -> Dict[str, GroupPath]:
+    """读取分组映射文件，分组名中的 '/' 表示多级分组
+
+    Raises:
+        ValueError: 文件格式不正确
+    """
+    path = Path(path)
+    if not path.exists():
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            raw = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        raise ValueError(f"无法读取分组映射文件 {path.name}: {e}")
+    if not isinstance(raw, dict):
+        raise ValueError(f"分组映射文件 {path.name} 应为 {{项目名称: 分组}} 格式")
+    return {str(name).strip(): tuple(part.strip() for part in str(group).split('/') if part.strip())
+            for name, group in raw.items()}
+
+
+def make_grouper(mapping: Dict[str, GroupPath] = None) -> Callable[[str], GroupPath]:
+    """返回分组函数：映射文件中有的项目按映射分组，其余按名称前缀分组"""
+    mapping = mapping or {}
+
+    def grouper(project_name: str) -> GroupPath:
+        return mapping.get(str(project_name).strip()) or prefix_group(project_name)
+    return grouper
+
+
+def project_vector(data) -> np.ndarray:
+    """将单个项目的分析结果压缩为定长汇总向量"""
+    vector = np.zeros(VECTOR_WIDTH, dtype=float)
+    for part, key in ((_TARGET, 'cum_target'), (_ACTUAL, 'cum_actual')):
+        values = np.asarray(data.get(key) or [], dtype=float)[:12]
+        vector[part][:len(values)] = values
+    counts = []
+    for kind, field in EXCEPTION_KINDS.items():
+        cached = data.get(EXCEPTION_COUNT_FIELDS[kind])
+        counts.append(np.asarray(cached if cached is not None else exception_prefix_counts(data.get(field)),
+                                 dtype=float))
+    vector[_EXCEPTIONS] = np.concatenate([c.ravel() for c in counts])
+    return vector
+
+
+class ProjectGroupTree:
+    """项目分组汇总树
+
+    根节点为全部项目，其下为各级分组。每个节点保存其下所有项目汇总向量的和；
+    项目加入、移除或数据变化时只沿该项目所在路径更新祖先节点，不重新汇总全部项目。
+    分组层面的指标和图表直接读取节点上的汇总值。
+    """
+
+    ROOT: GroupPath = ()
+
+    def __init__(self, grouper: Callable[[str], GroupPath] = None):
+        self.grouper = grouper or make_grouper()
+        self._sums: Dict[GroupPath, np.ndarray] = {}
+        self._counts: Dict[GroupPath, int] = {}
+        # 项目名称 -> (分组路径, 数据指纹, 汇总向量)
+        self._members: Dict[str, Tuple[GroupPath, str, np.ndarray]] = {}
+
+    @staticmethod
+    def _ancestors(path: GroupPath) -> List[GroupPath]:
+        return [path[:depth] for depth in range(len(path) + 1)]
+
+    def _apply(self, path: GroupPath, vector: np.ndarray, sign: int):
+        for node in self._ancestors(path):
+            count = self._counts.get(node, 0) + sign
+            if count <= 0:
+                # 节点已无项目时直接删除，避免残留浮点误差
+                self._counts.pop(node, None)
+                self._sums.pop(node, None)
+                continue
+            self._counts[node] = count
+            self._sums[node] = self._sums.get(node, np.zeros(VECTOR_WIDTH)) + sign * vector
+
+    def sync(self, all_data) -> Dict[str, int]:
+        """让汇总树与当前选中的项目保持一致，返回新增/移除/更新的项目数"""
+        stats = {'added': 0, 'removed': 0, 'updated': 0}
+        for name in [name for name in self._members if name not in all_data]:
+            path, _, vector = self._members.pop(name)
+            self._apply(path, vector, -1)
+            stats['removed'] += 1
+
+        for name, data in all_data.items():
+            vector = project_vector(data)
+            fingerprint = hashlib.md5(vector.tobytes()).hexdigest()
+            member = self._members.get(name)
+            if member is not None and member[1] == fingerprint:
+                continue
+            if member is not None:
+                self._apply(member[0], member[2], -1)
+                stats['updated'] += 1
+            else:
+                stats['added'] += 1
+            path = tuple(self.grouper(name))
+            self._apply(path, vector, 1)
+            self._members[name] = (path, fingerprint, vector)
+        return stats
+
+    def children(self, path: GroupPath = ROOT) -> List[GroupPath]:
+        """返回下一级分组路径（按名称排序）"""
+        return sorted(node for node in self._counts if len(node) == len(path) + 1 and node[:len(path)] == path)
+
+    def projects(self, path: GroupPath = ROOT) -> List[str]:
+        """返回分组下的项目名称"""
+        return [name for name, (member_path, _, _) in self._members.items() if member_path[:len(path)] == path]
+
+    def node_data(self, path: GroupPath, month: int) -> Dict[str, object]:
+        """返回分组的汇总指标，字段与单个项目的分析结果一致，可直接用于现有图表"""
+        month = int(min(max(int(month), 1), 12))
+        vector = self._sums.get(path, np.zeros(VECTOR_WIDTH))
+        cum_target, cum_actual = vector[_TARGET], vector[_ACTUAL]
+        year_target = cum_target[-1]
+        exceptions = vector[_EXCEPTIONS].reshape(len(EXCEPTION_KINDS), 2, 13)[:, :, month]
+        return {
+            'total_target': float(year_target),
+            'cum_target': cum_target.tolist(),
+            'cum_actual': cum_actual.tolist(),
+            'year_cum_target_wy': round(float(year_target) / 10000, 2),
+            'year_cum_actual_wy': round(float(cum_actual[-1]) / 10000, 2),
+            'year_usage': round(100 * float(cum_actual[month - 1]) / year_target, 2) if year_target else 0,
+            'month_usage': round(100 * float(cum_actual[month - 1]) / cum_target[month - 1], 2) if cum_target[month - 1] else 0,
+            'time_progress': round(100 * month / 12, 2),
+            'project_count': self._counts.get(path, 0),
+            'exception_count': int(exceptions.sum()),
+        }
+
+    def level_data(self, month: int, path: GroupPath = ROOT) -> Dict[str, Dict[str, object]]:
+        """返回某节点下一级各分组的汇总指标 {分组名称: 指标}"""
+        return {child[-1]: self.node_data(child, month) for child in self.children(path)}
+
+    def subtotal_table(self, month: int) -> pd.DataFrame:
+        """按树的先序遍历返回所有分组及合计的小计表"""
+        rows = []
+
+        def visit(path: GroupPath):
+            data = self.node_data(path, month)
+            rows.append({
+                '分组': ('　' * (len(path) - 1) + path[-1]) if path else '全部项目',
+                '层级': len(path),
+                '项目数': data['project_count'],
+                '年累计目标(万元)': data['year_cum_target_wy'],
+                '年累计已发生(万元)': data['year_cum_actual_wy'],
+                '年使用率(%)': data['year_usage'],
+                '月累使用率(%)': data['month_usage'],
+                '异常数': data['exception_count'],
+            })
+            for child in self.children(path):
+                visit(child)
+
+        if self._counts:
+            visit(self.ROOT)
+        return pd.DataFrame(rows)
+
+
+def mapping_signature(mapping: Optional[Dict[str, GroupPath]]) -> str:
+    """分组映射的签名，映射变化时需要重建汇总树"""
+    return hashlib.md5(repr(sorted((mapping or {}).items())).encode()).hexdigest()
@@ -0,0 +1,193 @@
+import io
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+from utils.chart_creator import create_kpi_display
+from utils.data_processor import (
+    create_labor_service_summary, create_monthly_fee_summary, create_secondary_fee_overall_data, create_summary_excel
+)
+from utils.export_payloads import EXCEL_CHUNK_ROWS, write_frame
+from utils.figure_cache import figure_cache_key
+
+# 同时保留的完整报告数量上限（每项为生成好的xlsx字节）
+REPORT_CACHE_SIZE = 4
+
+# 工作表名称 -> 逐块产出DataFrame的生成函数
+SheetSpec = Tuple[str, Callable[[], Iterator[pd.DataFrame]]]
+
+_jobs: "OrderedDict[str, ReportJob]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def report_key(*parts) -> str:
+    """根据项目数据指纹和报告选项生成完整报告的缓存键"""
+    return figure_cache_key('full_report', parts)
+
+
+def main_exception_frame(records: pd.DataFrame) -> pd.DataFrame:
+    """将主控费项异常记录转换为明细表（与页面和CSV下载的列一致）"""
+    return pd.DataFrame({
+        '项目名称': records['project_name'].to_numpy(),
+        '月份': records['month'].to_numpy(),
+        '费项名称': records['fee_name'].to_numpy(),
+        '异常类型': np.where(records['exception_type'].to_numpy() == 'red', '红色异常', '黄色异常'),
+        '累计已发生': records['cum_actual'].round(2).to_numpy(),
+        '当月目标': records['cum_target'].round(2).to_numpy(),
+        '年总目标': records['year_target'].round(2).to_numpy()
+    })
+
+
+def tertiary_exception_frame(records: pd.DataFrame) -> pd.DataFrame:
+    """将三级费项异常记录转换为明细表（与页面和CSV下载的列一致）"""
+    return pd.DataFrame({
+        'Excel 文件名': records['project_name'].to_numpy(),
+        '月份': np.where(records['month'].to_numpy() > 0, records['month'].astype(str) + "月", "N/A"),
+        '费项名称': records['fee_name'].to_numpy(),
+        '异常类型': np.where(records['exception_type'].to_numpy() == 'red', "超年度目标", "超月度目标"),
+        '已发生金额累计': records['cum_actual'].round(2).to_numpy(),
+        '目标金额累计': records['cum_target'].round(2).to_numpy()
+    })
+
+
+def secondary_fee_frame(item) -> pd.DataFrame:
+    """单个二级费项的1-12月单月和月累金额（万元）"""
+    return pd.DataFrame({
+        '费项': item['name'],
+        '月份': [f'{i}月' for i in range(1, 13)],
+        '单月目标成本(万元)': np.round(np.asarray(item['target'][:12], dtype=float) / 10000, 2),
+        '单月已发生成本(万元)': np.round(np.asarray(item['actual'][:12], dtype=float) / 10000, 2),
+        '月累目标(万元)': np.round(np.asarray(item['cum_target'][:12], dtype=float) / 10000, 2),
+        '月累已发生(万元)': np.round(np.asarray(item['cum_actual'][:12], dtype=float) / 10000, 2)
+    })
+
+
+def _chunks(records: pd.DataFrame, convert) -> Iterator[pd.DataFrame]:
+    """按块转换明细记录，避免一次生成全部行的显示表"""
+    for start in range(0, len(records), EXCEL_CHUNK_ROWS):
+        yield convert(records.iloc[start:start + EXCEL_CHUNK_ROWS])
+
+
+def report_sheets(all_data, all_main_dfs, month, include_self_owned_labor=False, kpi_frame=None,
+                  exception_store=None, labor_files=None, data_dir=None) -> List[SheetSpec]:
+    """完整报告的工作表列表，每个工作表在后台线程写出时才计算
+
+    Args:
+        kpi_frame: 期间查询表中截至该月的KPI列式表，未传入时根据all_data构建
+        exception_store: 已构建的异常记录表
+        labor_files: 参与人工服务拆分汇总的项目文件名，为空时不输出该工作表
+    """
+    def kpi_sheet():
+        yield create_kpi_display(all_data, month, kpi_frame).drop(columns='usage_band')
+
+    def summary_sheet():
+        summary_df = create_summary_excel(all_main_dfs)
+        if summary_df is not None:
+            yield summary_df
+
+    def monthly_fee_sheet():
+        monthly_fee_df = create_monthly_fee_summary(all_main_dfs)
+        if monthly_fee_df is not None:
+            yield monthly_fee_df.round({'目标成本': 2, '已发生成本': 2})
+
+    def secondary_fee_sheet():
+        # 输出全部二级费项，而不只是页面上选中的一个
+        for item in create_secondary_fee_overall_data(all_main_dfs, month, include_self_owned_labor) or []:
+            yield secondary_fee_frame(item)
+
+    def labor_sheet():
+        labor_summary = create_labor_service_summary(labor_files, data_dir)
+        if labor_summary is not None:
+            yield labor_summary
+
+    sheets = [
+        ('项目KPI', kpi_sheet),
+        ('项目汇总表', summary_sheet),
+        ('每月费项', monthly_fee_sheet),
+        ('二级费项', secondary_fee_sheet),
+    ]
+    if labor_files:
+        sheets.append(('人工服务拆分', labor_sheet))
+    if exception_store is not None:
+        sheets.append(('主控费项异常', lambda: _chunks(exception_store.records('main', month), main_exception_frame)))
+        sheets.append(('三级费项异常',
+                       lambda: _chunks(exception_store.records('tertiary', month), tertiary_exception_frame)))
+    return sheets
+
+
+class ReportJob:
+    """在后台线程中生成的多工作表报告
+
+    工作表按顺序以openpyxl只写模式逐块写出（行数据写入临时文件，不在内存中保留整个工作簿），
+    progress（0-1）和 stage 供页面轮询显示，完成后 result 为xlsx字节，失败时 error 为错误信息。
+    """
+
+    def __init__(self, key: str, sheets: List[SheetSpec]):
+        self.key = key
+        self.sheets = sheets
+        self.progress = 0.0
+        self.stage = "等待开始"
+        self.result: Optional[bytes] = None
+        self.error: Optional[str] = None
+        self.elapsed = 0.0
+        self._thread = threading.Thread(target=self._run, name=f"report-{key[:8]}", daemon=True)
+
+    @property
+    def done(self) -> bool:
+        return self.result is not None or self.error is not None
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        start = time.perf_counter()
+        try:
+            wb = Workbook(write_only=True)
+            for i, (name, produce) in enumerate(self.sheets):
+                self.stage = name
+                ws = wb.create_sheet(title=name)
+                header = True
+                for chunk in produce():
+                    write_frame(ws, chunk, header=header)
+                    header = False
+                self.progress = (i + 1) / (len(self.sheets) + 1)
+            self.stage = "保存工作簿"
+            output = io.BytesIO()
+            wb.save(output)
+            self.result = output.getvalue()
+            self.progress = 1.0
+            self.stage = "完成"
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            # 生成完成后不再需要工作表的输入数据
+            self.sheets = []
+            self.elapsed = time.perf_counter() - start
+
+
+def get_report_job(key: str) -> Optional[ReportJob]:
+    """返回该缓存键对应的报告任务（进行中或已完成），没有时返回None"""
+    with _lock:
+        job = _jobs.get(key)
+        if job is not None:
+            _jobs.move_to_end(key)
+        return job
+
+
+def start_report_job(key: str, sheets: List[SheetSpec]) -> ReportJob:
+    """启动报告生成任务；相同缓存键的任务进行中或已成功时直接返回该任务"""
+    with _lock:
+        job = _jobs.get(key)
+        if job is not None and job.error is None:
+            return job
+        job = ReportJob(key, sheets)
+        _jobs[key] = job
+        while len(_jobs) > REPORT_CACHE_SIZE:
+            _jobs.popitem(last=False)
+    return job.start()